@@ -1,32 +1,32 @@
 # DataLoop.py
 import os
-import pandas as pd
-import datetime
-import requests
 import yaml
 import time
+from candle_store import CandleStore
+from candle_rollups import RollupStore
+import gecko_fetcher
+import control_bus
+import metrics
+import trace_log
+from lazy_imports import lazy_import
 
-MASTER_FILE = "master_control.csv"
-STATUS_FILE = "dataloop_status.csv"
+pd = lazy_import("pandas")
+
+MASTER_FILE = control_bus.MASTER_FILE
+STATUS_FILE = control_bus.STATUS_FILE
 
 
 # ----------------------------
 # Helpers
 # ----------------------------
 def is_module_on(module_name: str) -> bool:
-    """Check master_control.csv for module ON/OFF state."""
-    if not os.path.exists(MASTER_FILE):
-        return True  # default ON if missing
-    df = pd.read_csv(MASTER_FILE)
-    if module_name not in df.columns:
-        return True
-    return df[module_name].iloc[0].strip().upper() == "ON"
+    """Check the control bus for module ON/OFF state (default ON if unset)."""
+    return control_bus.is_module_on(module_name)
 
 
 def update_status():
-    """Write last_run timestamp to dataloop_status.csv."""
-    now = datetime.datetime.now(datetime.UTC).isoformat()
-    pd.DataFrame([{"last_run": now}]).to_csv(STATUS_FILE, index=False)
+    """Publish DataLoop's ready heartbeat (also mirrored to dataloop_status.csv)."""
+    control_bus.default_bus().mark_ready("DataLoop")
 
 
 # ----------------------------
@@ -38,76 +38,66 @@ with open("config.yaml", "r") as f:
 OHLC_CSV_BASE = config["ohlc_csv"]
 PAIR_CSV = config.get("pair_csv", "filtered_contracts.csv")
 MAX_FETCH = config.get("max_fetch_minutes", 200)
-RETRY_WAIT = config.get("retry_wait_seconds", 7)
+GECKO_BASE_URL = config.get("gecko_base_url", gecko_fetcher.GECKO_BASE_URL)
+GECKO_RATE_PER_MINUTE = config.get("gecko_rate_per_minute", gecko_fetcher.GECKO_RATE_PER_MINUTE)
+GECKO_CONCURRENCY = config.get("gecko_concurrency", gecko_fetcher.MAX_CONCURRENCY)
+MAX_GAP_BACKFILL = config.get("max_gap_backfill", 20)
 LOOP_INTERVAL = 20
 
 
-# ----------------------------
-# Fetch OHLC with pagination
-# ----------------------------
-def fetch_recent_ohlc_gecko(pair_id: str, interval="minute", page=1, limit=200, retries=3, wait_seconds=RETRY_WAIT):
-    url = f"https://api.geckoterminal.com/api/v2/networks/solana/pools/{pair_id}/ohlcv/{interval}"
-    for attempt in range(retries):
-        try:
-            res = requests.get(url, params={"limit": limit, "page": page})
-        except Exception as e:
-            print(f"❌ Exception fetching {pair_id} page {page}: {e}")
-            time.sleep(wait_seconds)
-            continue
-
-        if res.status_code == 429:
-            print(f"⚠️ Rate limit hit for {pair_id}, waiting {wait_seconds}s...")
-            time.sleep(wait_seconds)
-            continue
-
-        if res.status_code != 200:
-            print(f"❌ Error {res.status_code} for {pair_id}: {res.text}")
-            return pd.DataFrame()
-
-        candles = res.json().get("data", {}).get("attributes", {}).get("ohlcv_list", [])
-        if not candles:
-            return pd.DataFrame()
-
-        df = pd.DataFrame([{
-            "pair_id": pair_id,
-            "time": datetime.datetime.fromtimestamp(c[0], tz=datetime.UTC),
-            "open": c[1], "high": c[2], "low": c[3], "close": c[4], "volume": c[5]
-        } for c in candles])
-
-        return df.sort_values("time").reset_index(drop=True)
-
-    return pd.DataFrame()
-
-
 # ----------------------------
 # Summarize missing candles
 # ----------------------------
-def summarize_missing(ohlc_csv: str):
-    if not os.path.exists(ohlc_csv):
+def summarize_missing(store: CandleStore):
+    """Trailing minutes missing per pair, from the persisted watermarks (O(pairs))."""
+    last_times = store.last_times()
+    if not last_times:
         return pd.DataFrame()
 
-    df = pd.read_csv(ohlc_csv)
-    df["time"] = pd.to_datetime(df["time"], utc=True, errors="coerce")
-    df = df.dropna(subset=["time"]).drop_duplicates(subset=["pair_id", "time"])
-    df = df.sort_values(["pair_id", "time"]).reset_index(drop=True)
-
-    now = datetime.datetime.now(datetime.UTC).replace(second=0, microsecond=0)
-    results = []
-    for pid, group in df.groupby("pair_id"):
-        last_time = group["time"].max()
-        delta = now - last_time
-        results.append({
-            "pair_id": pid,
-            "last_timestamp": last_time,
-            "minutes_missing": max(0, int(delta.total_seconds() / 60)),
-        })
+    missing = store.watermarks.missing_minutes()
+    results = [{
+        "pair_id": pid,
+        "last_timestamp": last_time,
+        "minutes_missing": missing[pid],
+    } for pid, last_time in last_times.items()]
     return pd.DataFrame(results).sort_values("minutes_missing", ascending=False)
 
 
+def backfill_gaps(store: CandleStore, pair_ids, max_gaps: int, rollups: RollupStore = None):
+    """Fetch recorded interior gaps; the span each fetch covered is closed, whatever it returned."""
+    gaps = [g for g in store.watermarks.interior_gaps() if g[0] in pair_ids][:max_gaps]
+    if not gaps:
+        return
+    print(f"\n🩹 Backfilling {len(gaps)} interior gaps...")
+    filled = []
+    for pair_id, start, end, df_gap, covered_from in gecko_fetcher.fetch_gaps_ohlc(
+            gaps, base_url=GECKO_BASE_URL, rate_per_minute=GECKO_RATE_PER_MINUTE, concurrency=GECKO_CONCURRENCY):
+        if df_gap is None:
+            print(f"⚠️ Gap {pair_id} [{start}-{end}]: fetch failed, retrying next rotation")
+            continue
+        written = store.append(df_gap)
+        filled.append(written)
+        # minutes still missing in the covered span had no trades upstream; stop asking for them
+        store.watermarks.close_gap(pair_id, covered_from, end)
+        rest = f", [{start}-{covered_from - 60}] left for next rotation" if covered_from > start else ""
+        print(f"✅ Gap {pair_id} [{start}-{end}]: +{len(written)} candles{rest}")
+    store.watermarks.save()
+    if rollups is not None and filled:
+        # one pass: every pair with a filled gap is rebuilt once, not once per gap
+        rollups.update(pd.concat(filled, ignore_index=True))
+
+
 # ----------------------------
 # Runner
 # ----------------------------
 if __name__ == "__main__":
+    metrics.init("DataLoop")
+    store = CandleStore(compat_csv=OHLC_CSV_BASE)
+    rollups = RollupStore(store)
+    caught_up = rollups.sync()
+    if caught_up:
+        print(f"🕯️ Rollups caught up on {caught_up} pairs")
+
     while True:
         if not is_module_on("DataLoop"):
             print("⏹️ DataLoop OFF in master_control.csv. Exiting.")
@@ -116,67 +106,58 @@ if __name__ == "__main__":
         if not os.path.exists(PAIR_CSV):
             raise FileNotFoundError(f"❌ Pair CSV not found: {PAIR_CSV}")
 
-        pairs_df = pd.read_csv(PAIR_CSV)
+        rotation_start = time.perf_counter()
+        appended_before = metrics.registry().counter("candles_appended_total")
+        with metrics.timer("csv_io_seconds", op="read", file=PAIR_CSV):
+            pairs_df = pd.read_csv(PAIR_CSV)
         if "PairId" not in pairs_df.columns:
             raise ValueError("❌ Pair CSV must have a 'PairId' column")
 
-        df_summary = summarize_missing(OHLC_CSV_BASE)
-        existing_pairs = set(df_summary["pair_id"]) if not df_summary.empty else set()
+        df_summary = summarize_missing(store)
 
         print("\n📊 Missing Candle Summary:")
         print(df_summary.head(20))
 
+        missing = dict(zip(df_summary["pair_id"], df_summary["minutes_missing"])) if not df_summary.empty else {}
+        jobs = {}
         for pair_id in pairs_df["PairId"].dropna().unique():
-            if not is_module_on("DataLoop"):
-                print("⏹️ DataLoop turned OFF mid-run. Stopping.")
-                break
-
-            minutes_missing = MAX_FETCH if pair_id not in existing_pairs else \
-                df_summary[df_summary["pair_id"] == pair_id].iloc[0]["minutes_missing"]
-
+            minutes_missing = int(missing.get(pair_id, MAX_FETCH))
             if minutes_missing == 0:
                 print(f"⏭️ {pair_id} is already up to date.")
                 continue
+            jobs[pair_id] = minutes_missing
 
-            print(f"\n🔎 {pair_id}: Missing {minutes_missing} min, fetching...")
-            to_fetch, page, df_all = minutes_missing, 1, []
-
-            while to_fetch > 0:
-                fetch_size = min(MAX_FETCH, to_fetch)
-                df_page = fetch_recent_ohlc_gecko(pair_id, page=page, limit=fetch_size)
-
-                if df_page.empty:
-                    print(f"⚠️ No more data returned for {pair_id} (page {page}).")
-                    break
-
-                df_all.append(df_page)
-                to_fetch -= fetch_size
-                page += 1
-                time.sleep(0.25)
-
-                if len(df_page) < fetch_size:
-                    break
-
-            if df_all:
-                df_new = pd.concat(df_all, ignore_index=True).drop_duplicates(subset=["pair_id", "time"])
-                df_new = df_new.sort_values("time")
-
-                if os.path.exists(OHLC_CSV_BASE):
-                    df_existing = pd.read_csv(OHLC_CSV_BASE)
-                    df_existing["time"] = pd.to_datetime(df_existing["time"], utc=True, errors="coerce")
-                    df_combined = pd.concat([df_existing, df_new], ignore_index=True)
-                    df_combined = df_combined.drop_duplicates(subset=["pair_id", "time"]).sort_values(["pair_id", "time"])
-                    df_combined.to_csv(OHLC_CSV_BASE, index=False)
-                    print(f"✅ Updated {pair_id}: +{len(df_new)} candles, total {len(df_combined)} rows")
-                else:
-                    df_new.to_csv(OHLC_CSV_BASE, index=False)
-                    print(f"✅ Created {OHLC_CSV_BASE} with {len(df_new)} rows for {pair_id}")
+        print(f"\n🔎 Fetching {len(jobs)} pairs concurrently...")
+        truncated = set()
+        fetched = gecko_fetcher.fetch_pairs_ohlc(
+            jobs, max_fetch=MAX_FETCH, truncated=truncated, base_url=GECKO_BASE_URL,
+            rate_per_minute=GECKO_RATE_PER_MINUTE, concurrency=GECKO_CONCURRENCY,
+        ) if jobs else {}
+
+        for pair_id, df_new in fetched.items():
+            if not is_module_on("DataLoop"):
+                print("⏹️ DataLoop turned OFF mid-run. Stopping.")
+                break
+
+            if not df_new.empty:
+                written = store.append(df_new, truncated=pair_id in truncated)
+                rollups.update(written)
+                trace_log.record(trace_log.latest_ids(written), "stored")
+                print(f"✅ Updated {pair_id}: +{len(written)} candles, total {store.count(pair_id)} rows")
             else:
                 print(f"⚠️ No data fetched for {pair_id}")
 
+        backfill_gaps(store, set(pairs_df["PairId"].dropna()), MAX_GAP_BACKFILL, rollups)
+
         # Mark status done for this loop
         update_status()
-        print("📌 DataLoop finished one rotation.")
-
-        # Sleep until next run
-        time.sleep(LOOP_INTERVAL)
+        rotation_seconds = time.perf_counter() - rotation_start
+        rotation_candles = metrics.registry().counter("candles_appended_total") - appended_before
+        metrics.observe("rotation_seconds", rotation_seconds)
+        metrics.gauge("rotation_candles", rotation_candles)
+        print(f"📌 DataLoop finished one rotation in {rotation_seconds:.1f}s (+{rotation_candles} candles).")
+        for name, labels, count, mean, p50, p95 in metrics.registry().summary()[:3]:
+            print(f"   ⏱️ {name}{labels or ''}: n={count} mean={mean * 1000:.0f}ms p95<={p95 * 1000:.0f}ms")
+
+        # Sleep until next run (wakes immediately if switched OFF)
+        control_bus.default_bus().wait_module_off("DataLoop", LOOP_INTERVAL)
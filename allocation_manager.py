@@ -1,17 +1,57 @@
 # allocation_manager.py
-import pandas as pd
+from __future__ import annotations
 import os
 from datetime import datetime, timezone, timedelta
+from pair_meta_cache import default_cache
+from portfolio_ledger import default_ledger
+from candle_store import CandleStore
+from fill_model import parse_usd
+from price_feed import get_prices
+from lazy_imports import lazy_import
+
+np = lazy_import("numpy")
+pd = lazy_import("pandas")
 
 ALLOCATION = "allocation_tracker.csv"
-SIM_PORTFOLIO = "sim_portfolio.csv"
-SIM_TOKEN_LOG = "sim_token_log.csv"
 CONTRACTS_FILE = "filtered_contracts.csv"
+PREDICTIONS_FILE = "predictions.csv"
+PREVIEW_FILE = "allocation_preview.csv"
+
+VOL_WINDOW = 60            # candles of close-to-close returns for volatility
+MIN_VOL = 0.001            # floor so near-flat candles don't get unbounded weight
+MAX_POOL_SHARE = 0.01      # never put more than 1% of a pool's liquidity in one token
+MAX_TOKEN_SHARE = 0.25     # nor more than 25% of the allocatable USD
+
+
+def get_allocatable_usd():
+    """Total portfolio value minus the SOL kept for fees (ledger's materialized view)."""
+    ledger = default_ledger()
+    total_usd = ledger.total_value()
+    if total_usd is None:
+        raise RuntimeError("Portfolio ledger has no total value, cannot calculate allocation.")
+
+    sol = ledger.balance("SOL")
+    sol_usd_value = sol["value_usd"] if sol and sol["value_usd"] is not None else 0
+    return max(0, total_usd - sol_usd_value)
 
-def get_allocation(hours=12):
+
+def _previewed_usd(contract):
+    """usd_allocated for one contract from allocation_preview.csv, or None if it isn't there."""
+    if not os.path.exists(PREVIEW_FILE) or os.path.getsize(PREVIEW_FILE) == 0:
+        return None
+    preview = pd.read_csv(PREVIEW_FILE, dtype={"contract": str})
+    hit = preview.loc[preview["contract"] == contract, "usd_allocated"]
+    return float(hit.iloc[0]) if not hit.empty else None
+
+
+def get_allocation(hours=12, contract=None):
     """
     Get constant allocation USD for buys.
     Reuse allocation if stop_timestamp > now, else recalc.
+    With `contract`, return that token's AllocationEngine share instead of
+    the flat split; both are frozen together (allocation_tracker.csv and
+    allocation_preview.csv) for the same window. Contracts the engine
+    doesn't know get the flat split.
     """
     now = datetime.now(timezone.utc)
 
@@ -22,35 +62,23 @@ def get_allocation(hours=12):
             stop_ts = datetime.fromisoformat(df.iloc[0]["stop_timestamp"])
             alloc_usd = float(df.iloc[0]["allocation_usd"])
             if now <= stop_ts:
+                token_usd = _previewed_usd(contract) if contract else None
+                if token_usd is not None:
+                    alloc_usd = token_usd
                 print(f"[ALLOCATION] Reusing ${alloc_usd:.2f} until {stop_ts}")
                 return alloc_usd
 
     # --- Step 2: Recalculate allocation ---
-    # Get latest total value
-    if not os.path.exists(SIM_PORTFOLIO) or os.path.getsize(SIM_PORTFOLIO) == 0:
-        raise RuntimeError("Portfolio file missing or empty, cannot calculate allocation.")
-    port_df = pd.read_csv(SIM_PORTFOLIO)
-    total_usd = float(port_df.iloc[-1]["TOTAL_VALUE_USD"])
-
-    # Get SOL USD value from latest token log
-    if not os.path.exists(SIM_TOKEN_LOG) or os.path.getsize(SIM_TOKEN_LOG) == 0:
-        sol_usd_value = 0
-    else:
-        token_df = pd.read_csv(SIM_TOKEN_LOG)
-        sol_rows = token_df[token_df["Contract"] == "SOL"]
-        if sol_rows.empty:
-            sol_usd_value = 0
-        else:
-            latest = sol_rows.iloc[-1]
-            sol_usd_value = float(latest["USD_Value"])
-
-    allocatable_usd = max(0, total_usd - sol_usd_value)
-
-    # Count how many contracts in filtered_contracts.csv
-    if not os.path.exists(CONTRACTS_FILE) or os.path.getsize(CONTRACTS_FILE) == 0:
-        raise RuntimeError("Contracts file missing or empty, cannot divide allocation.")
-    contracts_df = pd.read_csv(CONTRACTS_FILE, dtype=str)
-    n_contracts = len(contracts_df)
+    ledger = default_ledger()
+    allocatable_usd = get_allocatable_usd()
+
+    # Count tracked contracts (recorded by get-pairs; falls back to the cache, then filtered_contracts.csv)
+    n_contracts = ledger.contract_count() or default_cache().tracked_count()
+    if n_contracts == 0:
+        if not os.path.exists(CONTRACTS_FILE) or os.path.getsize(CONTRACTS_FILE) == 0:
+            raise RuntimeError("Contracts file missing or empty, cannot divide allocation.")
+        contracts_df = pd.read_csv(CONTRACTS_FILE, dtype=str)
+        n_contracts = len(contracts_df)
     if n_contracts == 0:
         raise RuntimeError("No contracts found in filtered_contracts.csv.")
 
@@ -64,4 +92,200 @@ def get_allocation(hours=12):
     }]).to_csv(ALLOCATION, index=False)
 
     print(f"[ALLOCATION] New allocation ${allocation_usd:.2f} valid until {stop_ts}")
-    return allocation_usd
+
+    # Per-token split for the same window
+    try:
+        write_allocation_preview(build_engine(allocatable_usd))
+    except Exception as e:
+        print(f"[ALLOCATION] Per-token allocation unavailable, using the flat split: {e}")
+        if os.path.exists(PREVIEW_FILE):
+            os.remove(PREVIEW_FILE)
+    token_usd = _previewed_usd(contract) if contract else None
+    return token_usd if token_usd is not None else allocation_usd
+
+
+# ----------------------------
+# Per-token allocation engine
+# ----------------------------
+class AllocationEngine:
+    """
+    Splits allocatable USD over contracts in proportion to a risk-adjusted
+    score, max(reg_prediction, 0) / volatility (inverse volatility when no
+    contract has a positive prediction). Each token is capped at
+    MAX_POOL_SHARE of its pool liquidity and MAX_TOKEN_SHARE of the total,
+    and capped excess is redistributed in one vectorized water-filling pass.
+
+    update() changes one token in O(1): it keeps the running score sum and
+    the smallest cap/score ratio, so as long as no cap binds, shares are
+    total * score / sum and nothing is recomputed. The full pass only runs
+    when a cap can bind.
+    """
+
+    def __init__(self, total_usd, contracts, volatility, liquidity, reg_prediction, price):
+        self.total_usd = float(total_usd)
+        self.contracts = list(contracts)
+        self.index = {c: i for i, c in enumerate(self.contracts)}
+        self.vol = np.asarray(volatility, dtype="float64").copy()
+        self.liquidity = np.asarray(liquidity, dtype="float64").copy()
+        self.reg = np.asarray(reg_prediction, dtype="float64").copy()
+        self.price = np.asarray(price, dtype="float64").copy()
+        self._rebuild()
+
+    # ---- scoring ----
+    def _scores(self, idx=slice(None)):
+        vol = self.vol[idx]
+        vol = np.maximum(np.where(np.isfinite(vol), vol, self._vol_fill), MIN_VOL)
+        if self._inverse_vol:
+            return 1.0 / vol
+        return np.nan_to_num(np.maximum(self.reg[idx], 0.0)) / vol
+
+    def _caps(self, idx=slice(None)):
+        liq = self.liquidity[idx]
+        pool = np.where(np.isfinite(liq), liq * MAX_POOL_SHARE, np.inf)
+        return np.minimum(pool, self.total_usd * MAX_TOKEN_SHARE)
+
+    def _rebuild(self):
+        # tokens without candle history are treated as median-volatility
+        self._vol_fill = float(np.nanmedian(self.vol)) if np.isfinite(self.vol).any() else MIN_VOL
+        self._n_positive = int((np.nan_to_num(self.reg) > 0).sum())
+        self._inverse_vol = self._n_positive == 0
+        self.score = self._scores()
+        self.cap = self._caps()
+        self.score_sum = float(self.score.sum())
+        self._refresh_min_ratio()
+        self._usd = None
+
+    def _ratio(self, i) -> float:
+        return self.cap[i] / self.score[i] if self.score[i] > 0 else np.inf
+
+    def _refresh_min_ratio(self):
+        with np.errstate(divide="ignore"):
+            ratio = np.where(self.score > 0, self.cap / self.score, np.inf)
+        self.min_ratio = float(ratio.min()) if len(ratio) else np.inf
+
+    def _uncapped(self) -> bool:
+        """True when total * score / sum stays under every cap."""
+        return self.score_sum > 0 and self.total_usd / self.score_sum <= self.min_ratio
+
+    # ---- updates ----
+    def update(self, contract, volatility=None, liquidity=None, reg_prediction=None, price=None):
+        """Change one token's inputs; O(1) unless it switches the scoring mode."""
+        i = self.index[contract]
+        if volatility is not None:
+            self.vol[i] = volatility
+        if liquidity is not None:
+            self.liquidity[i] = liquidity
+        if price is not None:
+            self.price[i] = price
+        if reg_prediction is not None:
+            self._n_positive += int(reg_prediction > 0) - int(np.nan_to_num(self.reg[i]) > 0)
+            self.reg[i] = reg_prediction
+            if (self._n_positive == 0) != self._inverse_vol:
+                self._rebuild()            # first positive prediction appeared, or the last one went
+                return
+
+        old_score, old_ratio = self.score[i], self._ratio(i)
+        self.score[i] = self._scores(slice(i, i + 1))[0]
+        self.cap[i] = self._caps(slice(i, i + 1))[0]
+        self.score_sum += self.score[i] - old_score
+        new_ratio = self._ratio(i)
+        if new_ratio <= self.min_ratio:
+            self.min_ratio = new_ratio
+        elif old_ratio <= self.min_ratio:
+            self._refresh_min_ratio()      # the tightest token loosened: find the next one
+        self._usd = None
+
+    def set_total(self, total_usd):
+        self.total_usd = float(total_usd)
+        self.cap = self._caps()
+        self._refresh_min_ratio()
+        self._usd = None
+
+    # ---- results ----
+    def usd_for(self, contract) -> float:
+        i = self.index[contract]
+        if self._usd is None and self._uncapped():
+            return self.total_usd * self.score[i] / self.score_sum
+        return float(self.allocations()[i])
+
+    def allocations(self) -> np.ndarray:
+        if self._usd is not None:
+            return self._usd
+        if self._uncapped():
+            self._usd = self.total_usd * self.score / self.score_sum
+            return self._usd
+
+        usd = np.zeros(len(self.score))
+        free = self.score > 0
+        remaining = self.total_usd
+        while free.any() and remaining > 1e-9:
+            share = np.where(free, self.score, 0.0)
+            proposal = remaining * share / share.sum()
+            over = free & (proposal > self.cap)
+            if not over.any():
+                usd[free] = proposal[free]
+                break
+            usd[over] = self.cap[over]
+            remaining -= self.cap[over].sum()
+            free &= ~over
+        self._usd = usd
+        return usd
+
+    def preview(self) -> pd.DataFrame:
+        usd = self.allocations()
+        with np.errstate(divide="ignore", invalid="ignore"):
+            tokens = np.where(self.price > 0, usd / self.price, 0.0)
+        return pd.DataFrame({
+            "contract": self.contracts, "price_usd": self.price,
+            "usd_allocated": usd, "tokens_expected": tokens,
+        })
+
+
+def recent_volatility(pair_ids, window=VOL_WINDOW, store: CandleStore = None) -> dict:
+    """PairId -> std of the last `window` close-to-close returns, from the candle store."""
+    store = store or CandleStore()
+    candles = store.read([p for p in pair_ids if p in set(store.pairs())])
+    if candles.empty:
+        return {}
+    candles = candles.groupby("pair_id", sort=False).tail(window + 1)
+    ret = candles.groupby("pair_id", sort=False)["close"].pct_change()
+    return ret.groupby(candles["pair_id"]).std().to_dict()
+
+
+def build_engine(total_usd=None, contracts_file=CONTRACTS_FILE, predictions_file=PREDICTIONS_FILE,
+                 store: CandleStore = None) -> AllocationEngine:
+    """Engine over every tracked contract, from filtered_contracts.csv, predictions.csv and the store."""
+    if not os.path.exists(contracts_file) or os.path.getsize(contracts_file) == 0:
+        raise RuntimeError("Contracts file missing or empty, cannot allocate.")
+    contracts = pd.read_csv(contracts_file, dtype=str).dropna(subset=["Contract"]).drop_duplicates("Contract")
+    preds = pd.DataFrame(columns=["Contract", "reg_prediction", "Price"])
+    if os.path.exists(predictions_file) and os.path.getsize(predictions_file) > 0:
+        preds = pd.read_csv(predictions_file, dtype={"Contract": str}).drop_duplicates("Contract", keep="last")
+    merged = contracts.merge(preds[["Contract", "reg_prediction", "Price"]], on="Contract", how="left",
+                             suffixes=("", "_pred"))
+    vol = recent_volatility(merged["PairId"].dropna().tolist(), store=store)
+    live = merged["Contract"].map(get_prices(merged["Contract"].tolist())).map(parse_usd)
+    price = live.fillna(merged["Price_pred"].map(parse_usd)).fillna(merged["Price"].map(parse_usd))
+    return AllocationEngine(
+        get_allocatable_usd() if total_usd is None else total_usd,
+        merged["Contract"],
+        merged["PairId"].map(vol).astype("float64"),
+        merged["Liquidity"].map(parse_usd),
+        pd.to_numeric(merged["reg_prediction"], errors="coerce"),
+        price,
+    )
+
+
+def write_allocation_preview(engine: AllocationEngine = None, path=PREVIEW_FILE) -> pd.DataFrame:
+    engine = engine or build_engine()
+    preview = engine.preview()
+    tmp = f"{path}.tmp"
+    preview.to_csv(tmp, index=False)
+    os.replace(tmp, path)
+    return preview
+
+
+if __name__ == "__main__":
+    preview = write_allocation_preview()
+    print(preview.to_string(index=False))
+    print(f"[ALLOCATION] ${preview['usd_allocated'].sum():.2f} over {int((preview['usd_allocated'] > 0).sum())} tokens")
@@ -0,0 +1,248 @@
+# archive_store.py
+from __future__ import annotations
+import argparse
+import csv
+import datetime
+import gzip
+import hashlib
+import os
+import shutil
+import threading
+from lazy_imports import lazy_import
+
+try:
+    import fcntl
+except ImportError:  # Windows: single-writer assumption, no cross-process lock
+    fcntl = None
+
+ARCHIVE_DIR = "archive"
+MANIFEST_FILE = os.path.join(ARCHIVE_DIR, "manifest.csv")
+STAGING_DIR = ".staging"
+CHUNK_BYTES = 1 << 20
+COMPRESS_LEVEL = 3        # most of gzip's ratio on CSV at a fraction of level 9's time
+
+pd = lazy_import("pandas")
+
+MANIFEST_COLUMNS = ["session", "file", "sha256", "object", "size", "compressed_size", "rows", "header", "archived_at"]
+
+
+def read_header(path) -> str:
+    """First line of a file, without reading the rest."""
+    with open(path, "r", newline="") as f:
+        return f.readline().rstrip("\r\n")
+
+
+class ArchiveStore:
+    """
+    Compressed, content-addressed session archive.
+
+    Archiving a session renames each file into archive/<session>/.staging
+    (instant, same filesystem), puts back a header-only file, and returns.
+    A background thread then streams each staged file in CHUNK_BYTES pieces
+    through sha256 and gzip into archive/<session>/<sha256>.csv.gz. Content
+    already archived by an earlier session is not stored again; its manifest
+    row points at the existing object. archive/manifest.csv indexes every
+    (session, file) with sizes, row count and header, so sessions can be
+    listed and single files loaded without decompressing anything else.
+    Staging left behind by an interrupted run is finished on the next one.
+    """
+
+    def __init__(self, root=ARCHIVE_DIR, manifest=None, compress_level=COMPRESS_LEVEL):
+        self.root = root
+        self.manifest_path = manifest or os.path.join(root, "manifest.csv")
+        self.compress_level = compress_level
+        self._thread = None
+
+    # ---- manifest ----
+    def manifest(self) -> pd.DataFrame:
+        if not os.path.exists(self.manifest_path) or os.path.getsize(self.manifest_path) == 0:
+            return pd.DataFrame(columns=MANIFEST_COLUMNS)
+        return pd.read_csv(self.manifest_path, dtype={"session": str, "sha256": str, "header": str})
+
+    def _append_manifest(self, row: dict):
+        os.makedirs(self.root, exist_ok=True)
+        lock = open(f"{self.manifest_path}.lock", "a")
+        try:
+            if fcntl:
+                fcntl.flock(lock, fcntl.LOCK_EX)
+            new_file = not os.path.exists(self.manifest_path) or os.path.getsize(self.manifest_path) == 0
+            with open(self.manifest_path, "a", newline="") as f:
+                writer = csv.DictWriter(f, fieldnames=MANIFEST_COLUMNS)
+                if new_file:
+                    writer.writeheader()
+                writer.writerow(row)
+        finally:
+            if fcntl:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+            lock.close()
+
+    def _known_objects(self) -> dict:
+        """sha256 -> object path, read with csv so the background archiver never loads pandas."""
+        if not os.path.exists(self.manifest_path):
+            return {}
+        with open(self.manifest_path, "r", newline="") as f:
+            return {row["sha256"]: row["object"] for row in csv.DictReader(f)}
+
+    def sessions(self) -> pd.DataFrame:
+        """One row per archived session: files, raw and compressed bytes."""
+        m = self.manifest()
+        if m.empty:
+            return pd.DataFrame(columns=["session", "files", "size", "compressed_size"])
+        return m.groupby("session").agg(files=("file", "count"), size=("size", "sum"),
+                                        compressed_size=("compressed_size", "sum")).reset_index()
+
+    def locate(self, session, fname):
+        """Object path of one archived file (compressed), or None."""
+        m = self.manifest()
+        hit = m[(m["session"] == session) & (m["file"] == fname)]
+        return os.path.join(self.root, hit.iloc[-1]["object"]) if not hit.empty else None
+
+    def open(self, session, fname):
+        """Text stream over one archived file, decompressed as it is read."""
+        path = self.locate(session, fname)
+        if path is None:
+            raise FileNotFoundError(f"{fname} not archived in session {session}")
+        return gzip.open(path, "rt", newline="")
+
+    def read_csv(self, session, fname, **kwargs) -> pd.DataFrame:
+        with self.open(session, fname) as f:
+            return pd.read_csv(f, **kwargs)
+
+    # ---- archiving ----
+    def stage(self, files, session=None) -> str:
+        """
+        Move files out of the way and leave header-only copies in their place.
+        Cheap: only first lines are read. Returns the session name.
+        """
+        session = session or datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
+        staging = os.path.join(self.root, session, STAGING_DIR)
+        os.makedirs(staging, exist_ok=True)
+        for fname in files:
+            if not os.path.exists(fname):
+                continue
+            header = read_header(fname)
+            os.replace(fname, os.path.join(staging, os.path.basename(fname)))
+            with open(fname, "w", newline="") as f:
+                f.write(f"{header}\n" if header else "")
+        return session
+
+    def _store(self, session, staged_path, known: dict) -> dict:
+        digest = hashlib.sha256()
+        rows, size = 0, 0
+        session_dir = os.path.join(self.root, session)
+        tmp = os.path.join(session_dir, f".{os.path.basename(staged_path)}.gz.tmp")
+        with open(staged_path, "rb") as src, open(tmp, "wb") as raw:
+            with gzip.GzipFile(fileobj=raw, mode="wb", compresslevel=self.compress_level, mtime=0) as gz:
+                while chunk := src.read(CHUNK_BYTES):
+                    digest.update(chunk)
+                    gz.write(chunk)
+                    rows += chunk.count(b"\n")
+                    size += len(chunk)
+        sha = digest.hexdigest()
+        header = read_header(staged_path)
+        if sha in known and os.path.exists(os.path.join(self.root, known[sha])):
+            os.remove(tmp)                             # same bytes already archived
+            obj = known[sha]
+        else:
+            obj = os.path.join(session, f"{sha}.csv.gz")
+            os.replace(tmp, os.path.join(self.root, obj))
+            known[sha] = obj
+        return {
+            "session": session, "file": os.path.basename(staged_path), "sha256": sha, "object": obj,
+            "size": size, "compressed_size": os.path.getsize(os.path.join(self.root, obj)),
+            "rows": max(rows - 1, 0) if header else rows, "header": header,
+            "archived_at": datetime.datetime.now(datetime.UTC).isoformat(),
+        }
+
+    def compress(self, session):
+        """Stream every staged file of a session into objects and the manifest."""
+        staging = os.path.join(self.root, session, STAGING_DIR)
+        if not os.path.isdir(staging):
+            return
+        known = self._known_objects()
+        for name in sorted(os.listdir(staging)):
+            path = os.path.join(staging, name)
+            try:
+                row = self._store(session, path, known)
+                self._append_manifest(row)
+                os.remove(path)
+                ratio = row["compressed_size"] / row["size"] if row["size"] else 0
+                print(f"📦 Archived {name} -> {row['object']} ({row['size'] / 1e6:.1f} MB, {ratio:.0%} compressed)")
+            except Exception as e:
+                print(f"⚠️ Failed to archive {name}: {e}")
+        if not os.listdir(staging):
+            os.rmdir(staging)
+
+    def pending(self) -> list:
+        """Sessions with staged files not compressed yet (an interrupted run)."""
+        if not os.path.isdir(self.root):
+            return []
+        return sorted(s for s in os.listdir(self.root) if os.path.isdir(os.path.join(self.root, s, STAGING_DIR)))
+
+    def archive(self, files, session=None, background=True) -> str:
+        session = self.stage(files, session)
+        todo = self.pending()
+
+        def run():
+            for s in todo:
+                self.compress(s)
+            print(f"✅ Archive completed at {os.path.join(self.root, session)}")
+
+        if background:
+            self._thread = threading.Thread(target=run, name="archiver")
+            self._thread.start()
+        else:
+            run()
+        return session
+
+    def wait(self, timeout=None):
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    # ---- legacy sessions ----
+    def import_legacy(self, session):
+        """Pack an old uncompressed archive/<session>/ directory into objects."""
+        session_dir = os.path.join(self.root, session)
+        staging = os.path.join(session_dir, STAGING_DIR)
+        plain = [f for f in os.listdir(session_dir) if f.endswith(".csv") and os.path.isfile(os.path.join(session_dir, f))]
+        if not plain:
+            return
+        os.makedirs(staging, exist_ok=True)
+        for f in plain:
+            shutil.move(os.path.join(session_dir, f), os.path.join(staging, f))
+        self.compress(session)
+
+
+_default_store = None
+
+
+def default_store() -> ArchiveStore:
+    global _default_store
+    if _default_store is None:
+        _default_store = ArchiveStore()
+    return _default_store
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compressed session archive")
+    parser.add_argument("--list", action="store_true", help="list archived sessions")
+    parser.add_argument("--files", metavar="SESSION", help="list the files of one session")
+    parser.add_argument("--resume", action="store_true", help="finish interrupted archives")
+    parser.add_argument("--import-legacy", action="store_true", help="compress old plain-CSV session folders")
+    args = parser.parse_args()
+
+    store = default_store()
+    if args.list:
+        print(store.sessions().to_string(index=False))
+    elif args.files:
+        m = store.manifest()
+        print(m[m["session"] == args.files][["file", "rows", "size", "compressed_size", "object"]].to_string(index=False))
+    elif args.resume:
+        for s in store.pending():
+            store.compress(s)
+    elif args.import_legacy:
+        for s in sorted(os.listdir(store.root)) if os.path.isdir(store.root) else []:
+            if os.path.isdir(os.path.join(store.root, s)):
+                store.import_legacy(s)
+    else:
+        parser.print_help()
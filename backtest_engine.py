@@ -0,0 +1,187 @@
+# backtest_engine.py
+import numpy as np
+import pandas as pd
+
+REGIME_LOOKBACK = 20
+REGIME_THRESHOLD = 0.02   # mean rolling std of returns below this -> "calm"
+
+
+# ----------------------------
+# Data layout
+# ----------------------------
+class OHLCArrays:
+    """
+    OHLC candles loaded once into contiguous NumPy arrays, sorted by (pair, time).
+    Pair p occupies rows offsets[p]:offsets[p + 1].
+    """
+
+    def __init__(self, pair_ids, offsets, open_, high, low, close):
+        self.pair_ids = pair_ids
+        self.offsets = offsets
+        self.open = open_
+        self.high = high
+        self.low = low
+        self.close = close
+
+    @property
+    def n_pairs(self) -> int:
+        return len(self.pair_ids)
+
+    @classmethod
+    def from_frame(cls, df: pd.DataFrame) -> "OHLCArrays":
+        df = df.copy()
+        df.columns = [c.strip().lower() for c in df.columns]
+        df["time"] = pd.to_datetime(df["time"], errors="coerce", utc=True)
+        df = df.sort_values(["pair_id", "time"], kind="mergesort")
+        codes, pair_ids = pd.factorize(df["pair_id"], sort=True)
+        counts = np.bincount(codes, minlength=len(pair_ids))
+        offsets = np.concatenate([[0], np.cumsum(counts)])
+        as_f8 = lambda col: np.ascontiguousarray(df[col].to_numpy(dtype="float64"))
+        return cls(np.asarray(pair_ids), offsets, as_f8("open"), as_f8("high"), as_f8("low"), as_f8("close"))
+
+    @classmethod
+    def from_csv(cls, path: str) -> "OHLCArrays":
+        return cls.from_frame(pd.read_csv(path))
+
+    def pair_codes(self) -> np.ndarray:
+        return np.repeat(np.arange(self.n_pairs), np.diff(self.offsets))
+
+
+# ----------------------------
+# Regime
+# ----------------------------
+def pair_volatility(data: OHLCArrays, lookback=REGIME_LOOKBACK) -> np.ndarray:
+    """Per-pair mean of the rolling std of close-to-close returns (NaN if too short)."""
+    codes = data.pair_codes()
+    ret = np.full(len(data.close), np.nan)
+    ret[1:] = data.close[1:] / data.close[:-1] - 1
+    ret[data.offsets[:-1][np.diff(data.offsets) > 0]] = np.nan   # no return across pair boundaries
+    # rows are already grouped by pair, so the groupby output keeps row order
+    rolling = pd.Series(ret).groupby(codes).rolling(lookback).std().to_numpy()
+    valid = ~np.isnan(rolling)
+    sums = np.bincount(codes[valid], weights=rolling[valid], minlength=data.n_pairs)
+    counts = np.bincount(codes[valid], minlength=data.n_pairs)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return sums / counts
+
+
+def detect_regimes(data: OHLCArrays, lookback=REGIME_LOOKBACK, threshold=REGIME_THRESHOLD) -> np.ndarray:
+    """Boolean array, True where the pair is 'calm' (NaN volatility counts as storm)."""
+    vol = pair_volatility(data, lookback)
+    return np.nan_to_num(vol, nan=np.inf) < threshold
+
+
+# ----------------------------
+# Core-stop / trailing-stop state machine
+# ----------------------------
+def trade_legs(data: OHLCArrays, entry_mask=None):
+    """
+    The state machine enters at a bar's open and always exits on the next bar,
+    so trades are the bar pairs (0, 1), (2, 3), ... of each pair. Returns the
+    entry row indices and the pair code of each trade.
+
+    `entry_mask` (bool per row) optionally gates entries; skipped bars shift
+    the pairing exactly as the sequential loop would.
+    """
+    codes = data.pair_codes()
+    n = len(codes)
+    if entry_mask is None:
+        pos = np.arange(n) - data.offsets[codes]
+        ends = data.offsets[codes + 1]
+        entries = np.flatnonzero((pos % 2 == 0) & (np.arange(n) + 1 < ends))
+        return entries, codes[entries]
+
+    entries = []
+    for p in range(data.n_pairs):
+        i, end = data.offsets[p], data.offsets[p + 1]
+        while i + 1 < end:
+            if entry_mask[i]:
+                entries.append(i)
+                i += 2
+            else:
+                i += 1
+    entries = np.asarray(entries, dtype=np.int64)
+    return entries, codes[entries]
+
+
+def run_configs(data: OHLCArrays, core_sl, trail_sl, entry_mask=None, cost=None):
+    """
+    Evaluate every (core_sl[i], trail_sl[i]) config at once.
+
+    `cost` (fraction per round trip, scalar or one value per pair, e.g. from
+    fill_model.FillModel.pair_costs) is subtracted from each trade's pnl.
+    Returns per-pair arrays of shape (configs, pairs): pnl (sum of trade
+    returns), trades, stoploss_hits, trailing_hits.
+    """
+    core = np.asarray(core_sl, dtype="float64")[:, None]
+    trail = np.asarray(trail_sl, dtype="float64")[:, None]
+    entries, trade_pairs = trade_legs(data, entry_mask)
+    exits = entries + 1
+
+    entry = data.open[entries][None, :]
+    hwm = np.maximum(entry, data.high[exits][None, :])
+    low = data.low[exits][None, :]
+    close = data.close[exits][None, :]
+
+    core_hit = low <= entry * (1 - core)
+    trail_price = hwm * (1 - trail)
+    trail_hit = ~core_hit & (low <= trail_price)
+    pnl = np.where(core_hit, -core, np.where(trail_hit, (trail_price - entry) / entry, (close - entry) / entry))
+    if cost is not None:
+        cost = np.asarray(cost, dtype="float64")
+        pnl = pnl - (cost[trade_pairs] if cost.ndim else cost)
+
+    n_cfg, n_pairs = core.shape[0], data.n_pairs
+    flat = (np.arange(n_cfg)[:, None] * n_pairs + trade_pairs[None, :]).ravel()
+    per_pair = lambda w: np.bincount(flat, weights=w.ravel(), minlength=n_cfg * n_pairs).reshape(n_cfg, n_pairs)
+    trades = np.broadcast_to(np.bincount(trade_pairs, minlength=n_pairs), (n_cfg, n_pairs))
+    return {
+        "pnl": per_pair(pnl),
+        "trades": trades,
+        "stoploss_hits": per_pair(core_hit.astype("float64")).astype(int),
+        "trailing_hits": per_pair(trail_hit.astype("float64")).astype(int),
+    }
+
+
+# ----------------------------
+# Reports (same files as test.py)
+# ----------------------------
+def summarize(data: OHLCArrays, configs, results, calm) -> pd.DataFrame:
+    """configs: [(name, core_sl, trail_sl)] -> aggregate_stoploss_comparison rows."""
+    pnl_pct = results["pnl"] * 100
+    n_pairs = data.n_pairs
+    return pd.DataFrame({
+        "config": [name for name, _, _ in configs],
+        "pairs_tested": n_pairs,
+        "calm_pairs": int(calm.sum()),
+        "storm_pairs": int(n_pairs - calm.sum()),
+        "total_pnl_%": pnl_pct.sum(axis=1),
+        "avg_pnl_per_pair_%": pnl_pct.sum(axis=1) / n_pairs if n_pairs else 0,
+    })
+
+
+def per_pair_frame(data: OHLCArrays, configs, results) -> pd.DataFrame:
+    frames = []
+    for i, (name, _, _) in enumerate(configs):
+        frames.append(pd.DataFrame({
+            "config": name,
+            "pair_id": data.pair_ids,
+            "trades": results["trades"][i],
+            "stoploss_hits": results["stoploss_hits"][i],
+            "trailing_hits": results["trailing_hits"][i],
+            "final_pnl_%": results["pnl"][i] * 100,
+        }))
+    return pd.concat(frames, ignore_index=True)
+
+
+def backtest(csv_file, configs, aggregate_csv="aggregate_stoploss_comparison.csv",
+             per_pair_csv="stoploss_trailing_backtest_results.csv", cost=None):
+    """`csv_file` may also be an already loaded OHLCArrays (e.g. to build per-pair costs first)."""
+    data = csv_file if isinstance(csv_file, OHLCArrays) else OHLCArrays.from_csv(csv_file)
+    calm = detect_regimes(data)
+    results = run_configs(data, [c[1] for c in configs], [c[2] for c in configs], cost=cost)
+    agg_df = summarize(data, configs, results, calm)
+    agg_df.to_csv(aggregate_csv, index=False)
+    if per_pair_csv:
+        per_pair_frame(data, configs, results).to_csv(per_pair_csv, index=False)
+    return agg_df
@@ -0,0 +1,238 @@
+# candle_rollups.py
+from __future__ import annotations
+import argparse
+import os
+import shutil
+from candle_store import CandleStore, COLUMNS, normalize_candles, _epoch_seconds, _last_epoch
+from gap_index import _atomic_to_csv
+from lazy_imports import lazy_import
+
+np = lazy_import("numpy")
+pd = lazy_import("pandas")
+
+ROLLUP_DIR = "ohlc_rollups"
+TIMEFRAMES = {"5m": 300, "15m": 900, "1h": 3600, "4h": 14400}
+ROLLUP_COLUMNS = COLUMNS + ["minutes"]              # minutes = minute candles in the bucket
+STATE_COLUMNS = ["timeframe"] + ROLLUP_COLUMNS + ["last_minute"]
+
+
+def aggregate(df: pd.DataFrame, seconds: int) -> pd.DataFrame:
+    """Minute candles (sorted by pair/time) -> one row per (pair, bucket) of `seconds`."""
+    if df.empty:
+        return pd.DataFrame(columns=ROLLUP_COLUMNS)
+    secs = np.asarray(_epoch_seconds(df["time"]), dtype="int64")
+    bucket = secs // seconds * seconds
+    out = df.assign(bucket=bucket).groupby(["pair_id", "bucket"], sort=True).agg(
+        open=("open", "first"), high=("high", "max"), low=("low", "min"),
+        close=("close", "last"), volume=("volume", "sum"), minutes=("close", "size"),
+    ).reset_index()
+    out["time"] = pd.to_datetime(out["bucket"], unit="s", utc=True)
+    return out[ROLLUP_COLUMNS]
+
+
+class RollupStore:
+    """
+    5m / 15m / 1h / 4h candles derived from the minute CandleStore.
+
+    Closed buckets are appended to ohlc_rollups/<timeframe>/<pair_id>.csv.
+    The current bucket of each pair is still filling, so it is kept in
+    ohlc_rollups/state.csv together with the last minute folded in, and it
+    is rewritten on every update. update() takes the rows CandleStore.append
+    just wrote: minutes past the watermark are merged in O(new rows), and a
+    minute landing in an already closed bucket (a gap backfill) rebuilds
+    that pair from the minute store.
+    """
+
+    def __init__(self, store: CandleStore = None, root=ROLLUP_DIR, timeframes=None, load=True):
+        self.store = store
+        self.root = root
+        self.timeframes = {tf: TIMEFRAMES[tf] for tf in (timeframes or TIMEFRAMES)}
+        self.state_file = os.path.join(root, "state.csv")
+        self.open = {tf: {} for tf in self.timeframes}    # tf -> pair_id -> open bucket row (dict)
+        self.last_minute = {}                              # pair_id -> last epoch second folded in
+        for tf in self.timeframes:
+            os.makedirs(os.path.join(root, tf), exist_ok=True)
+        if load:
+            self._load_state()
+            self._reconcile_state()
+
+    # ---- state ----
+    def partition_path(self, timeframe, pair_id) -> str:
+        return os.path.join(self.root, timeframe, f"{pair_id}.csv")
+
+    def _load_state(self):
+        if not os.path.exists(self.state_file) or os.path.getsize(self.state_file) == 0:
+            return
+        state = pd.read_csv(self.state_file, dtype={"pair_id": str})
+        state["time"] = pd.to_datetime(state["time"], utc=True)
+        for row in state.to_dict("records"):
+            tf = row.pop("timeframe")
+            self.last_minute[row["pair_id"]] = int(row.pop("last_minute"))
+            if tf in self.open:
+                self.open[tf][row["pair_id"]] = row
+
+    def _reconcile_state(self):
+        """
+        Rebuild pairs with a closed bar at or past their open bucket: a crash
+        between _close() and _save_state() left the state behind, and folding
+        from its last_minute again would append those bars twice.
+        """
+        stale = set()
+        for tf in self.timeframes:
+            for name in os.listdir(os.path.join(self.root, tf)):
+                if not name.endswith(".csv"):
+                    continue
+                pair_id = name[:-4]
+                last = _last_epoch(self.partition_path(tf, pair_id))
+                current = self.open[tf].get(pair_id)
+                if last is not None and (current is None or last >= current["time"].timestamp()):
+                    stale.add(pair_id)
+        if stale and self.store is not None:
+            print(f"🩹 Rebuilding rollups of {len(stale)} pairs written after the last state save")
+            self.rebuild(sorted(stale))
+
+    def _save_state(self):
+        rows = [{"timeframe": tf, **row, "last_minute": self.last_minute[pid]}
+                for tf, pairs in self.open.items() for pid, row in pairs.items()]
+        _atomic_to_csv(pd.DataFrame(rows, columns=STATE_COLUMNS), self.state_file)
+
+    def reset(self):
+        for tf in self.timeframes:
+            shutil.rmtree(os.path.join(self.root, tf), ignore_errors=True)
+            os.makedirs(os.path.join(self.root, tf), exist_ok=True)
+        self.open = {tf: {} for tf in self.timeframes}
+        self.last_minute = {}
+        if os.path.exists(self.state_file):
+            os.remove(self.state_file)
+
+    # ---- updates ----
+    def _close(self, tf, rows: pd.DataFrame):
+        for pair_id, group in rows.groupby("pair_id", sort=False):
+            path = self.partition_path(tf, pair_id)
+            group.to_csv(path, mode="a", header=not os.path.exists(path), index=False)
+
+    def _fold(self, df: pd.DataFrame):
+        """Merge minutes newer than every pair's watermark into open buckets; closes finished ones."""
+        for tf, seconds in self.timeframes.items():
+            agg = aggregate(df, seconds)
+            closed = []
+            for pair_id, group in agg.groupby("pair_id", sort=False):
+                rows = group.to_dict("records")
+                current = self.open[tf].get(pair_id)
+                if current is not None:
+                    if rows[0]["time"] == current["time"]:
+                        first = rows[0]
+                        rows[0] = {**current, "high": max(current["high"], first["high"]),
+                                   "low": min(current["low"], first["low"]), "close": first["close"],
+                                   "volume": current["volume"] + first["volume"],
+                                   "minutes": current["minutes"] + first["minutes"]}
+                    else:
+                        rows.insert(0, current)
+                closed.extend(rows[:-1])
+                self.open[tf][pair_id] = rows[-1]
+            if closed:
+                self._close(tf, pd.DataFrame(closed, columns=ROLLUP_COLUMNS))
+        for pair_id, group in df.groupby("pair_id", sort=False):
+            self.last_minute[pair_id] = int(_epoch_seconds(group["time"].iloc[[-1]])[0])
+
+    def rebuild(self, pair_ids):
+        """Recompute every timeframe of these pairs from the minute store."""
+        pair_ids = [pair_ids] if isinstance(pair_ids, str) else list(pair_ids)
+        for pair_id in pair_ids:
+            for tf in self.timeframes:
+                self.open[tf].pop(pair_id, None)
+                if os.path.exists(self.partition_path(tf, pair_id)):
+                    os.remove(self.partition_path(tf, pair_id))
+            self.last_minute.pop(pair_id, None)
+        df = self.store.read(pair_ids) if self.store is not None else pd.DataFrame(columns=COLUMNS)
+        if not df.empty:
+            self._fold(df)
+        self._save_state()
+
+    def update(self, new_rows: pd.DataFrame) -> int:
+        """Fold candles CandleStore.append just wrote. Returns the number of minutes folded."""
+        df = normalize_candles(new_rows)
+        if df.empty:
+            return 0
+        df = df.sort_values(["pair_id", "time"], kind="mergesort")
+        secs = np.asarray(_epoch_seconds(df["time"]), dtype="int64")
+        last = df["pair_id"].map(self.last_minute).fillna(-1).to_numpy(dtype="int64")
+        late = set(df.loc[secs <= last, "pair_id"])
+        if late:
+            # a minute inside an already folded range: cheaper to redo those pairs than patch closed rows
+            self.rebuild(late)
+            df = df[~df["pair_id"].isin(late)]
+        if not df.empty:
+            self._fold(df)
+            self._save_state()
+        return len(new_rows)
+
+    def sync(self) -> int:
+        """Catch up with minutes appended while no RollupStore was attached (e.g. by get-pairs)."""
+        if self.store is None:
+            return 0
+        stored = {p: int(t.timestamp()) for p, t in self.store.last_times().items()}
+        behind = [p for p, t in stored.items() if self.last_minute.get(p, -1) < t]
+        for pair_id in behind:
+            since = self.last_minute.get(pair_id)
+            if since is None:
+                self.rebuild(pair_id)
+            else:
+                df = self.store.read(pair_id)
+                self.update(df[df["time"] > pd.Timestamp(since, unit="s", tz="UTC")])
+        gone = [p for p in self.last_minute if p not in stored]
+        for pair_id in gone:               # minute store was reset under us
+            self.rebuild(pair_id)
+        return len(behind)
+
+    # ---- reads ----
+    def read(self, timeframe, pair_ids=None, start=None, end=None, include_open=True) -> pd.DataFrame:
+        """
+        Bars of one timeframe for the given pairs (default: all) with time in
+        [start, end]. The still-filling bucket is included unless
+        include_open=False; `complete` tells them apart.
+        """
+        if pair_ids is None:
+            pair_ids = sorted(set(self.open[timeframe]) | {
+                f[:-4] for f in os.listdir(os.path.join(self.root, timeframe)) if f.endswith(".csv")})
+        elif isinstance(pair_ids, str):
+            pair_ids = [pair_ids]
+
+        frames = []
+        for pair_id in pair_ids:
+            path = self.partition_path(timeframe, pair_id)
+            if os.path.exists(path):
+                frames.append(pd.read_csv(path, dtype={"pair_id": str}).assign(complete=True))
+        open_rows = [self.open[timeframe][p] for p in pair_ids if p in self.open[timeframe]]
+        if include_open and open_rows:
+            frames.append(pd.DataFrame(open_rows, columns=ROLLUP_COLUMNS).assign(complete=False))
+        if not frames:
+            return pd.DataFrame(columns=ROLLUP_COLUMNS + ["complete"])
+
+        df = pd.concat(frames, ignore_index=True)
+        df["time"] = pd.to_datetime(df["time"], utc=True)
+        if start is not None:
+            df = df[df["time"] >= pd.to_datetime(start, utc=True)]
+        if end is not None:
+            df = df[df["time"] <= pd.to_datetime(end, utc=True)]
+        return df.sort_values(["pair_id", "time"]).reset_index(drop=True)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Derive 5m/15m/1h/4h candles from the minute store")
+    parser.add_argument("--rebuild", action="store_true", help="recompute every pair from the minute store")
+    parser.add_argument("--show", metavar="PAIR_ID")
+    parser.add_argument("--timeframe", default="1h", choices=list(TIMEFRAMES))
+    args = parser.parse_args()
+
+    rollups = RollupStore(CandleStore())
+    if args.rebuild:
+        rollups.reset()
+        rollups.rebuild(rollups.store.pairs())
+    else:
+        rollups.sync()
+    if args.show:
+        print(rollups.read(args.timeframe, args.show).tail(24).to_string(index=False))
+    else:
+        for tf in rollups.timeframes:
+            print(f"🕯️ {tf}: {len(rollups.open[tf])} pairs, open buckets tracked in {rollups.state_file}")
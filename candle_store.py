@@ -0,0 +1,228 @@
+# candle_store.py
+from __future__ import annotations
+import os
+import metrics
+from lazy_imports import lazy_import
+from gap_index import WatermarkIndex, WATERMARK_FILE, GAPS_FILE
+
+pd = lazy_import("pandas")
+
+STORE_DIR = "ohlc_store"
+COMPAT_CSV = "all_pairs_ohlc.csv"
+
+# Fixed candle schema (column -> dtype). "time" is always UTC.
+COLUMNS = ["pair_id", "time", "open", "high", "low", "close", "volume"]
+FLOAT_COLUMNS = ["open", "high", "low", "close", "volume"]
+
+
+# ----------------------------
+# Helpers
+# ----------------------------
+def normalize_candles(df: pd.DataFrame) -> pd.DataFrame:
+    """Coerce a candle frame to the store schema, dropping unparsable rows."""
+    if df is None or df.empty:
+        return pd.DataFrame(columns=COLUMNS)
+    df = df.copy()
+    df.columns = [c.strip().lower() for c in df.columns]
+    df = df[COLUMNS]
+    df["pair_id"] = df["pair_id"].astype(str)
+    df["time"] = pd.to_datetime(df["time"], utc=True, errors="coerce")
+    for col in FLOAT_COLUMNS:
+        df[col] = pd.to_numeric(df[col], errors="coerce").astype("float64")
+    return df.dropna(subset=["time"])
+
+
+def _epoch_seconds(times: pd.Series) -> list:
+    return ((times - pd.Timestamp(0, tz="UTC")) // pd.Timedelta(seconds=1)).tolist()
+
+
+def _last_epoch(path: str, tail_bytes=4096):
+    """Epoch second of the last row's `time` (second column) of a store CSV, read from its tail; None if empty."""
+    with open(path, "rb") as f:
+        f.seek(0, os.SEEK_END)
+        f.seek(max(0, f.tell() - tail_bytes))
+        lines = [line for line in f.read().decode("utf-8", "ignore").splitlines() if line.strip()]
+    if not lines:
+        return None
+    try:
+        return int(pd.Timestamp(lines[-1].split(",")[1]).timestamp())
+    except (IndexError, ValueError):
+        return None                      # header only, or a torn last line
+
+
+# ----------------------------
+# Store
+# ----------------------------
+class CandleStore:
+    """
+    Append-only OHLC store partitioned per pair (ohlc_store/<pair_id>.csv).
+
+    Per-pair watermarks and interior gaps live in a persisted WatermarkIndex,
+    so startup and missing-minute checks are O(pairs). Candles newer than a
+    pair's watermark are appended without any lookup; older ones (backfill)
+    are deduped on (pair_id, time) against an in-memory index that is loaded
+    lazily for that pair only. all_pairs_ohlc.csv is kept as an append-only
+    compatibility view for readers that expect a single file.
+    """
+
+    def __init__(self, root=STORE_DIR, compat_csv=COMPAT_CSV, load=True,
+                 watermark_file=WATERMARK_FILE, gaps_file=GAPS_FILE):
+        self.root = root
+        self.compat_csv = compat_csv
+        self.watermarks = WatermarkIndex(watermark_file, gaps_file)
+        self._index = {}  # pair_id -> set of epoch seconds (lazily loaded)
+        os.makedirs(root, exist_ok=True)
+        if not load:
+            return
+        if not self._partition_ids() and compat_csv and os.path.exists(compat_csv):
+            self._bootstrap_from_compat()
+        if self.watermarks.exists():
+            self.watermarks.load()
+            self._reconcile_watermarks()
+        else:
+            self._rebuild_watermarks()
+
+    # ---- paths / index ----
+    def partition_path(self, pair_id: str) -> str:
+        return os.path.join(self.root, f"{pair_id}.csv")
+
+    def _partition_ids(self) -> list:
+        return [f[:-4] for f in os.listdir(self.root) if f.endswith(".csv")]
+
+    def _pair_index(self, pair_id: str) -> set:
+        if pair_id not in self._index:
+            path = self.partition_path(pair_id)
+            if os.path.exists(path):
+                times = pd.read_csv(path, usecols=["time"])["time"]
+                times = pd.to_datetime(times, utc=True, errors="coerce").dropna()
+                self._index[pair_id] = set(_epoch_seconds(times))
+            else:
+                self._index[pair_id] = set()
+        return self._index[pair_id]
+
+    def _rebuild_watermarks(self):
+        """Full scan of every partition; only needed when the watermark file is missing."""
+        for pair_id in self._partition_ids():
+            self.watermarks.rebuild(pair_id, sorted(self._pair_index(pair_id)))
+        self.watermarks.save()
+
+    def _reconcile_watermarks(self):
+        """
+        Re-index pairs whose partition ends past their watermark: a crash
+        between the partition write and watermarks.save() left the watermark
+        stale, and the next tail-only append would duplicate those candles.
+        """
+        stale = []
+        for pair_id in self._partition_ids():
+            last = _last_epoch(self.partition_path(pair_id))
+            if last is not None and last > self.watermarks.last.get(pair_id, -1):
+                stale.append(pair_id)
+        for pair_id in stale:
+            self.watermarks.rebuild(pair_id, sorted(self._pair_index(pair_id)))
+        if stale:
+            self.watermarks.save()
+            print(f"🩹 Re-indexed {len(stale)} partitions written after the last watermark save")
+
+    def _bootstrap_from_compat(self):
+        """One-off import of an existing all_pairs_ohlc.csv into partitions."""
+        df = normalize_candles(pd.read_csv(self.compat_csv))
+        df = df.drop_duplicates(subset=["pair_id", "time"]).sort_values(["pair_id", "time"])
+        for pair_id, group in df.groupby("pair_id"):
+            group.to_csv(self.partition_path(pair_id), index=False)
+        self.watermarks.reset()
+        print(f"📦 Imported {len(df)} candles from {self.compat_csv} into {self.root}/")
+
+    # ---- writes ----
+    def append(self, df: pd.DataFrame, truncated=False) -> pd.DataFrame:
+        """
+        Append candles not already stored. Returns the rows actually written.
+        `truncated`: the fetch stopped at its limit before reaching the stored
+        history, so the minutes it skipped are recorded as a gap to backfill.
+        """
+        with metrics.timer("csv_io_seconds", op="write", file="ohlc_store"):
+            written = self._append(df, truncated)
+        metrics.inc("candles_appended_total", len(written))
+        return written
+
+    def _append(self, df: pd.DataFrame, truncated=False) -> pd.DataFrame:
+        df = normalize_candles(df)
+        if df.empty:
+            return df
+        df = df.drop_duplicates(subset=["pair_id", "time"]).sort_values(["pair_id", "time"])
+
+        written = []
+        for pair_id, group in df.groupby("pair_id"):
+            secs = _epoch_seconds(group["time"])
+            last = self.watermarks.last.get(pair_id)
+            tail_only = last is not None and secs[0] > last  # pure tail append: no lookup needed
+            if tail_only:
+                mask = [True] * len(secs)
+            else:
+                seen = self._pair_index(pair_id)
+                mask = [s not in seen for s in secs]
+            fresh = group[mask]
+            if fresh.empty:
+                continue
+            fresh_secs = [s for s, keep in zip(secs, mask) if keep]
+            path = self.partition_path(pair_id)
+            fresh.to_csv(path, mode="a", header=not os.path.exists(path), index=False)
+            if pair_id in self._index:
+                self._index[pair_id].update(fresh_secs)
+            self.watermarks.observe(pair_id, fresh_secs,
+                                    is_stored=None if tail_only else self._index[pair_id].__contains__,
+                                    truncated=truncated)
+            written.append(fresh)
+
+        if not written:
+            return pd.DataFrame(columns=COLUMNS)
+        self.watermarks.save()
+        new_rows = pd.concat(written, ignore_index=True)
+        if self.compat_csv:
+            new_rows.to_csv(self.compat_csv, mode="a", index=False,
+                            header=not os.path.exists(self.compat_csv) or os.path.getsize(self.compat_csv) == 0)
+        return new_rows
+
+    def reset(self):
+        """Drop all partitions and watermarks and truncate the compatibility CSV to its header."""
+        for pair_id in self._partition_ids():
+            os.remove(self.partition_path(pair_id))
+        self._index.clear()
+        self.watermarks.reset()
+        if self.compat_csv:
+            with open(self.compat_csv, "w", newline="") as f:
+                f.write(",".join(COLUMNS) + "\n")
+
+    # ---- reads ----
+    def pairs(self) -> list:
+        return sorted(self.watermarks.last)
+
+    def count(self, pair_id=None) -> int:
+        if pair_id is not None:
+            return self.watermarks.counts.get(pair_id, 0)
+        return sum(self.watermarks.counts.values())
+
+    def last_times(self) -> dict:
+        """pair_id -> last candle time (UTC), straight from the watermark index."""
+        return self.watermarks.last_times()
+
+    def read(self, pair_ids=None, since=None) -> pd.DataFrame:
+        """Load candles for the given pairs (default: all), sorted by pair/time."""
+        if pair_ids is None:
+            pair_ids = self.pairs()
+        elif isinstance(pair_ids, str):
+            pair_ids = [pair_ids]
+
+        frames = []
+        with metrics.timer("csv_io_seconds", op="read", file="ohlc_store"):
+            for pid in pair_ids:
+                path = self.partition_path(pid)
+                if not os.path.exists(path):
+                    continue
+                frames.append(normalize_candles(pd.read_csv(path)))
+        if not frames:
+            return pd.DataFrame(columns=COLUMNS)
+
+        df = pd.concat(frames, ignore_index=True)
+        if since is not None:
+            df = df[df["time"] >= pd.to_datetime(since, utc=True)]
+        return df.sort_values(["pair_id", "time"]).reset_index(drop=True)
@@ -1,6 +1,21 @@
 import requests
+import price_feed
+from pair_meta_cache import default_cache
+
+def get_price_from_dexscreener(token_address, use_cache=True):
+    # Shared feed first: one upstream subscription serves every caller
+    price = price_feed.get_price(token_address)
+    if price is not None:
+        print(f"✅ {token_address} price (feed): ${price}")
+        return price
+
+    cache = default_cache()
+    if use_cache:
+        price = cache.get(f"contract:{token_address}", "price_usd")
+        if price is not None:
+            print(f"✅ {token_address} price (cached): ${price}")
+            return price
 
-def get_price_from_dexscreener(token_address):
     url = f"https://api.dexscreener.com/latest/dex/tokens/{token_address}"
     try:
         response = requests.get(url, timeout=10)
@@ -19,6 +34,11 @@ def get_price_from_dexscreener(token_address):
         base = best_pair.get("baseToken", {}).get("symbol")
         quote = best_pair.get("quoteToken", {}).get("symbol")
 
+        cache.put_fields(
+            f"contract:{token_address}", price_usd=price, pair_id=best_pair.get("pairAddress"),
+            liquidity_usd=float(best_pair.get("liquidity", {}).get("usd", 0)),
+        )
+
         print(f"✅ {base}/{quote} price: ${price}")
         return price
 
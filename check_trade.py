@@ -1,5 +1,6 @@
 import requests
 import time
+import price_feed
 
 # Contract address (token on Solana)
 CONTRACT_ADDRESS = "GBAk9Ws6iCpoST3fj6Z7hnyqvJ6FwNFWAnjuXGkxZ2iy"
@@ -8,6 +9,11 @@ CONTRACT_ADDRESS = "GBAk9Ws6iCpoST3fj6Z7hnyqvJ6FwNFWAnjuXGkxZ2iy"
 API_URL = f"https://api.dexscreener.com/latest/dex/trades/solana/{CONTRACT_ADDRESS}"
 
 def fetch_trades():
+    # Shared feed first: it already polls every tracked contract and dedupes trades
+    trades = price_feed.get_trades(CONTRACT_ADDRESS, limit=10)
+    if trades is not None:
+        return trades
+
     try:
         response = requests.get(API_URL, timeout=10)
         if response.status_code != 200:
@@ -1,10 +1,10 @@
 # telegram.py
 import os
 import time
-import sqlite3
 from datetime import datetime, timedelta
 from telegram import InlineKeyboardButton, InlineKeyboardMarkup, Update
 from telegram.ext import Application, CommandHandler, CallbackQueryHandler, ContextTypes
+from user_db import UserDB
 
 # Load ENV
 BOT_TOKEN = os.getenv("BOT")
@@ -13,27 +13,14 @@ BOT_TOKEN = os.getenv("BOT")
 DEPOSIT_ADDRESS = "YourSolanaWalletHere"
 DUNE_DASHBOARD_URL = "https://dune.com/your-dashboard-link"
 
-# Setup DB (users table)
-conn = sqlite3.connect("users.db", check_same_thread=False)
-cursor = conn.cursor()
-cursor.execute("""
-CREATE TABLE IF NOT EXISTS users (
-    user_id INTEGER PRIMARY KEY,
-    username TEXT,
-    sol_balance REAL DEFAULT 0,
-    joined_window TIMESTAMP,
-    trading_active INTEGER DEFAULT 0
-)
-""")
-conn.commit()
+# Setup DB (users table): WAL, one batching writer thread, pooled readers
+db = UserDB("users.db")
 
 # ---------------- BOT COMMANDS ----------------
 
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user = update.effective_user
-    cursor.execute("INSERT OR IGNORE INTO users (user_id, username) VALUES (?, ?)", 
-                   (user.id, user.username))
-    conn.commit()
+    await db.register(user.id, user.username)
     await update.message.reply_text(
         f"👋 Welcome {user.first_name}!\n\n"
         "This is the Hybrid AI Trading Bot.\n"
@@ -62,9 +49,7 @@ async def join_window(update: Update, context: ContextTypes.DEFAULT_TYPE):
     start_time = datetime.utcnow()
     end_time = start_time + timedelta(hours=12)
 
-    cursor.execute("UPDATE users SET trading_active=1, joined_window=? WHERE user_id=?",
-                   (start_time, user.id))
-    conn.commit()
+    await db.join_window(user.id, start_time)
 
     await update.message.reply_text(
         f"✅ You’ve joined the trading window!\n"
@@ -75,10 +60,9 @@ async def join_window(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
 async def balance(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user = update.effective_user
-    cursor.execute("SELECT sol_balance FROM users WHERE user_id=?", (user.id,))
-    row = cursor.fetchone()
-    if row:
-        await update.message.reply_text(f"💰 Your balance: {row[0]:.4f} SOL")
+    sol_balance = await db.balance(user.id)
+    if sol_balance is not None:
+        await update.message.reply_text(f"💰 Your balance: {sol_balance:.4f} SOL")
     else:
         await update.message.reply_text("No account found. Use /start to register.")
 
@@ -93,7 +77,10 @@ def main():
     app.add_handler(CommandHandler("balance", balance))
 
     print("🚀 Bot running...")
-    app.run_polling()
+    try:
+        app.run_polling()
+    finally:
+        db.close()
 
 if __name__ == "__main__":
     main()
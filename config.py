@@ -1,14 +1,12 @@
-from web3 import Web3
-
 # Base RPC (can be dynamic if needed)
 CHAIN_RPC = "https://arb1.arbitrum.io/rpc"
 
-# Tokens
-BASE_TOKEN = Web3.to_checksum_address("0x82af49447d8a07e3bd95bd0d56f35241523fbab1")  # WETH
-QUOTE_TOKEN = Web3.to_checksum_address("0xfd086bc7cd5c481dcc9c85ebe478a1c0b69fcbb9")  # USDT
+# Tokens (EIP-55 checksummed ahead of time, so importing config doesn't load web3)
+BASE_TOKEN = "0x82aF49447D8a07e3bd95BD0d56f35241523fBab1"  # WETH
+QUOTE_TOKEN = "0xFd086bC7CD5C481DCC9C85ebE478A1C0b69FCbb9"  # USDT
 
 # Uniswap v3 Router
-UNISWAP_V3_ROUTER = Web3.to_checksum_address("0xE592427A0AEce92De3Edee1F18E0157C05861564")
+UNISWAP_V3_ROUTER = "0xE592427A0AEce92De3Edee1F18E0157C05861564"
 
 # Trade settings
 USD_TO_SWAP = 5          # default swap amount
@@ -18,3 +16,9 @@ SLIPPAGE_TOLERANCE = 0.5   # percent slippage allowed
 # Gas settings
 DEFAULT_MAX_FEE_GWEI = 1.5
 DEFAULT_PRIORITY_FEE_GWEI = 1.0
+
+
+def checksum(address: str) -> str:
+    """Checksum an address chosen at runtime (web3 is only imported here)."""
+    from web3 import Web3
+    return Web3.to_checksum_address(address)
@@ -0,0 +1,272 @@
+# control_bus.py
+import csv
+import ctypes
+import ctypes.util
+import datetime
+import json
+import os
+import select
+import struct
+import time
+
+try:
+    import fcntl
+except ImportError:  # Windows: single-writer assumption, no cross-process lock
+    fcntl = None
+
+STATE_FILE = "control_state.json"
+MASTER_FILE = "master_control.csv"
+CONTROLLER_FILE = "controller.csv"
+STATUS_FILE = "dataloop_status.csv"
+
+MODULES = ["AI_BOT", "WATCHER", "DataLoop", "Get-pairs"]
+POLL_INTERVAL = 0.01   # fallback stat-poll period when inotify is unavailable
+
+
+# ----------------------------
+# Change notification
+# ----------------------------
+class _Inotify:
+    """Minimal ctypes inotify watch on the state file's directory (Linux only)."""
+
+    IN_CLOSE_WRITE = 0x00000008
+    IN_MOVED_TO = 0x00000080
+    IN_NONBLOCK = 0x00000800
+
+    def __init__(self, path):
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        self.fd = libc.inotify_init1(self.IN_NONBLOCK)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        directory = os.path.dirname(os.path.abspath(path)).encode()
+        if libc.inotify_add_watch(self.fd, directory, self.IN_CLOSE_WRITE | self.IN_MOVED_TO) < 0:
+            os.close(self.fd)
+            raise OSError(ctypes.get_errno(), "inotify_add_watch failed")
+        self.names = {os.path.basename(path).encode()}
+
+    def watch_name(self, path):
+        self.names.add(os.path.basename(path).encode())
+
+    def wait(self, timeout: float) -> bool:
+        """Block until a watched file is replaced/written or timeout. True on change."""
+        ready, _, _ = select.select([self.fd], [], [], max(0.0, timeout))
+        if not ready:
+            return False
+        changed = False
+        data = os.read(self.fd, 64 * 1024)
+        offset = 0
+        while offset < len(data):
+            _, _, _, name_len = struct.unpack_from("iIII", data, offset)
+            name = data[offset + 16: offset + 16 + name_len].rstrip(b"\0")
+            changed |= name in self.names
+            offset += 16 + name_len
+        return changed
+
+
+# ----------------------------
+# Control bus
+# ----------------------------
+class ControlBus:
+    """
+    Control plane shared by main, DataLoop, the AI bot and the watcher.
+
+    State (master ON/OFF flags, the AI/watcher controller flags and module
+    ready heartbeats) lives in one JSON file that is only ever replaced
+    atomically, so readers never see a torn write. Reads cost one os.stat
+    unless the file changed. Waiters are woken by inotify on Linux (stat
+    polling elsewhere), so ON/OFF changes are seen within milliseconds.
+
+    master_control.csv, controller.csv and dataloop_status.csv are still
+    written on every change as a compatibility view. A hand-edited
+    master_control.csv newer than the JSON state is imported on read.
+    """
+
+    def __init__(self, state_file=STATE_FILE, master_file=MASTER_FILE,
+                 controller_file=CONTROLLER_FILE, status_file=STATUS_FILE):
+        self.state_file = state_file
+        self.master_file = master_file
+        self.controller_file = controller_file
+        self.status_file = status_file
+        self._cache = None
+        self._cache_key = None
+        self._notifier = None
+
+    # ---- state I/O ----
+    @staticmethod
+    def _mtime(path):
+        try:
+            return os.stat(path).st_mtime_ns
+        except FileNotFoundError:
+            return None
+
+    def _default_state(self) -> dict:
+        return {"master": {m: "ON" for m in MODULES}, "controller": {"status": "OFF", "status2": "OFF"}, "ready": {}}
+
+    def read(self) -> dict:
+        key = (self._mtime(self.state_file), self._mtime(self.master_file))
+        if key == self._cache_key and self._cache is not None:
+            return self._cache
+
+        state = self._default_state()
+        if key[0] is not None:
+            try:
+                with open(self.state_file, "r") as f:
+                    state.update(json.load(f))
+            except (OSError, ValueError):
+                return self._cache or state
+        if key[1] is not None and (key[0] is None or key[1] > key[0]):
+            state["master"].update(self._read_master_csv())
+
+        self._cache, self._cache_key = state, key
+        return state
+
+    def _read_master_csv(self) -> dict:
+        try:
+            with open(self.master_file, newline="") as f:
+                row = next(csv.DictReader(f), None) or {}
+        except OSError:
+            return {}
+        return {k.strip(): (v or "").strip().upper() for k, v in row.items() if k}
+
+    def _update(self, mutate):
+        lock = open(f"{self.state_file}.lock", "a")
+        try:
+            if fcntl:
+                fcntl.flock(lock, fcntl.LOCK_EX)
+            self._cache_key = None
+            state = self.read()
+            mutate(state)
+            tmp = f"{self.state_file}.tmp"
+            with open(tmp, "w") as f:
+                json.dump(state, f)
+            os.replace(tmp, self.state_file)
+            self._write_views(state)
+        finally:
+            if fcntl:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+            lock.close()
+        self._cache_key = None
+        return state
+
+    @staticmethod
+    def _atomic_csv(path, header, row):
+        tmp = f"{path}.tmp"
+        with open(tmp, "w", newline="") as f:
+            writer = csv.writer(f)
+            writer.writerow(header)
+            writer.writerow(row)
+        os.replace(tmp, path)
+
+    def _write_views(self, state):
+        master = state["master"]
+        self._atomic_csv(self.master_file, MODULES, [master.get(m, "OFF") for m in MODULES])
+        ctrl = state["controller"]
+        self._atomic_csv(self.controller_file, ["status", "status2"], [ctrl["status"], ctrl["status2"]])
+        if "DataLoop" in state["ready"]:
+            self._atomic_csv(self.status_file, ["last_run"], [state["ready"]["DataLoop"]])
+        # the views are older than the JSON from here on, so they are not re-imported
+        os.utime(self.state_file)
+
+    # ---- master flags ----
+    def set_master(self, **flags):
+        """set_master(AI_BOT="ON", DataLoop="OFF", ...); unspecified modules keep their state."""
+        def mutate(state):
+            for module, value in flags.items():
+                state["master"][module] = str(value).strip().upper()
+        return self._update(mutate)["master"]
+
+    def is_module_on(self, module_name: str) -> bool:
+        return self.read()["master"].get(module_name, "ON") == "ON"
+
+    # ---- AI bot / watcher handshake ----
+    def set_controller(self, status=None, status2=None):
+        def mutate(state):
+            if status is not None:
+                state["controller"]["status"] = status
+            if status2 is not None:
+                state["controller"]["status2"] = status2
+        return self._update(mutate)["controller"]
+
+    def get_controller(self) -> dict:
+        return dict(self.read()["controller"])
+
+    # ---- readiness / heartbeats ----
+    def mark_ready(self, module_name: str):
+        now = datetime.datetime.now(datetime.UTC).isoformat()
+
+        def mutate(state):
+            state["ready"][module_name] = now
+        self._update(mutate)
+        return now
+
+    def last_ready(self, module_name: str):
+        ts = self.read()["ready"].get(module_name)
+        return datetime.datetime.fromisoformat(ts) if ts else None
+
+    # ---- waiting ----
+    def wait_for_change(self, timeout: float) -> bool:
+        """Block until the control state changes or timeout. True on change."""
+        if self._notifier is None and os.name == "posix":
+            try:
+                self._notifier = _Inotify(self.state_file)
+                self._notifier.watch_name(self.master_file)
+            except (OSError, AttributeError):
+                self._notifier = False
+        if self._notifier:
+            return self._notifier.wait(timeout)
+
+        key = (self._mtime(self.state_file), self._mtime(self.master_file))
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            time.sleep(POLL_INTERVAL)
+            if (self._mtime(self.state_file), self._mtime(self.master_file)) != key:
+                return True
+        return False
+
+    def wait_until(self, predicate, timeout: float) -> bool:
+        deadline = time.monotonic() + timeout
+        while True:
+            if predicate(self.read()):
+                return True
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return False
+            self.wait_for_change(min(remaining, 1.0))
+
+    def wait_ready(self, module_name: str, since=None, timeout: float = 300) -> bool:
+        """Wait until `module_name` reports ready (after `since`, if given)."""
+        def ready(state):
+            ts = state["ready"].get(module_name)
+            if not ts:
+                return False
+            return since is None or datetime.datetime.fromisoformat(ts) >= since
+        return self.wait_until(ready, timeout)
+
+    def wait_module_off(self, module_name: str, timeout: float) -> bool:
+        """Sleep up to `timeout`, returning early (True) if the module is switched OFF."""
+        return self.wait_until(lambda s: s["master"].get(module_name, "ON") != "ON", timeout)
+
+
+# ----------------------------
+# Module-level API
+# ----------------------------
+_default_bus = None
+
+
+def default_bus() -> ControlBus:
+    global _default_bus
+    if _default_bus is None:
+        _default_bus = ControlBus()
+    return _default_bus
+
+
+def set_master(**flags):
+    return default_bus().set_master(**flags)
+
+
+def is_module_on(module_name: str) -> bool:
+    return default_bus().is_module_on(module_name)
+
+
+def wait_ready(module_name: str, since=None, timeout: float = 300) -> bool:
+    return default_bus().wait_ready(module_name, since=since, timeout=timeout)
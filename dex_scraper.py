@@ -0,0 +1,243 @@
+# dex_scraper.py
+from __future__ import annotations
+import argparse
+import atexit
+import glob
+import html as html_lib
+import os
+import queue
+import threading
+import time
+from contextlib import contextmanager
+import metrics
+from lazy_imports import lazy_import
+
+pd = lazy_import("pandas")
+requests = lazy_import("requests")
+
+TRENDING_URL = "https://dexscreener.com/solana/5m?rankBy=trendingScoreM5&order=desc"
+HEADERS = {
+    "User-Agent": ("Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 "
+                   "(KHTML, like Gecko) Chrome/126.0 Safari/537.36"),
+    "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8",
+    "Accept-Language": "en-US,en;q=0.9",
+}
+TABLE_CLASS = "ds-dex-table"
+DRIVER_WAIT = 10          # seconds for the table to render in the browser
+POOL_SIZE = 1
+SNAPSHOT_DIR = "scrape_snapshots"
+SNAPSHOT_KEEP = 20
+VERSION_TAGS = ["V1", "V2", "V3"]
+
+
+# ----------------------------
+# Parsers (pure, snapshot-testable)
+# ----------------------------
+def _unique(tokens) -> list:
+    return list(dict.fromkeys(t for t in tokens if isinstance(t, str) and t.strip()))
+
+
+def parse_table_text(lines) -> list:
+    """
+    Token names from the innerText of ds-dex-table (one cell per line).
+
+    Rows start at "#<rank>"; the first block is the header. The name is the
+    5th cell of a row, or the 6th when the 5th is the quote symbol (rows with
+    an extra badge line shift by one).
+    """
+    cells = pd.Series(list(lines), dtype="object").str.strip()
+    cells = cells[~cells.isin(VERSION_TAGS) & (cells != "")]
+    if cells.empty:
+        return []
+    row = cells.str.startswith("#").cumsum()
+    pos = cells.groupby(row).cumcount()
+    wide = pd.DataFrame({"row": row, "pos": pos, "cell": cells})
+    wide = wide[wide["pos"].isin([4, 5])].pivot(index="row", columns="pos", values="cell")
+    wide = wide.reindex(columns=[4, 5]).drop(index=row.iloc[0], errors="ignore")
+    tokens = wide[4].where(wide[4] != "SOL", wide[5])
+    return _unique(tokens)
+
+
+def parse_trending_html(page: str) -> list:
+    """Token names from a dexscreener page source (server-rendered or from the browser)."""
+    rows = pd.Series(page.split('class="ds-dex-table-row ')[1:], dtype="object")
+    if rows.empty:
+        return []
+    names = rows.str.extract(r'ds-dex-table-row-base-token-name-text"[^>]*>([^<]+)<', expand=False)
+    symbols = rows.str.extract(r'ds-dex-table-row-base-token-symbol"[^>]*>([^<]+)<', expand=False)
+    tokens = names.fillna(symbols).dropna().map(html_lib.unescape).str.strip()
+    return _unique(tokens)
+
+
+def parse_snapshot(path) -> list:
+    """Parse a saved page: .html via the HTML parser, anything else as table text."""
+    with open(path, encoding="utf-8") as f:
+        content = f.read()
+    if path.endswith((".html", ".htm")):
+        return parse_trending_html(content)
+    return parse_table_text(content.splitlines())
+
+
+def save_snapshot(content, source, directory=SNAPSHOT_DIR, keep=SNAPSHOT_KEEP) -> str:
+    """Keep the last `keep` scraped pages so parser changes can be replayed offline."""
+    os.makedirs(directory, exist_ok=True)
+    ext = "html" if source in ("http", "driver") else "txt"
+    path = os.path.join(directory, f"{time.strftime('%Y%m%d-%H%M%S')}-{source}.{ext}")
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(content)
+    for old in sorted(glob.glob(os.path.join(directory, "*-*.*")))[:-keep]:
+        os.remove(old)
+    return path
+
+
+# ----------------------------
+# Fetch paths
+# ----------------------------
+def fetch_http(url=TRENDING_URL, session=None, timeout=15):
+    """Plain GET of the page. Returns the HTML, or None when blocked (challenge page / non-200)."""
+    http = session or requests
+    start = time.perf_counter()
+    try:
+        resp = http.get(url, headers=HEADERS, timeout=timeout)
+    except requests.RequestException as e:
+        metrics.record_response("dexscreener_page", None, time.perf_counter() - start)
+        print(f"⚠️ Trending page fetch failed: {e}")
+        return None
+    metrics.record_response("dexscreener_page", resp.status_code, time.perf_counter() - start)
+    if resp.status_code != 200:
+        return None
+    return resp.text
+
+
+class DriverPool:
+    """
+    Warm headless browsers, started on first use and reused until close().
+
+    Only needed when the plain GET is blocked; a scrape borrows a driver
+    instead of booting Chrome each time. A driver that errors is dropped
+    and replaced on the next acquire.
+    """
+
+    def __init__(self, size=POOL_SIZE, headless=True):
+        self.size = size
+        self.headless = headless
+        self._idle = queue.LifoQueue()
+        self._started = 0
+        self._lock = threading.Lock()
+        atexit.register(self.close)
+
+    def _start(self):
+        # the browser stack is only imported when a driver is actually needed
+        from seleniumbase import Driver
+        with metrics.timer("stage_seconds", stage="driver_start"):
+            return Driver(uc=True, headless=self.headless)
+
+    @contextmanager
+    def acquire(self):
+        driver = None
+        try:
+            driver = self._idle.get_nowait()
+        except queue.Empty:
+            with self._lock:
+                can_start = self._started < self.size
+                if can_start:
+                    self._started += 1
+            if can_start:
+                try:
+                    driver = self._start()
+                except Exception:
+                    with self._lock:
+                        self._started -= 1
+                    raise
+            else:
+                driver = self._idle.get()
+        try:
+            yield driver
+        except Exception:
+            self._discard(driver)
+            raise
+        else:
+            self._idle.put(driver)
+
+    def _discard(self, driver):
+        with self._lock:
+            self._started -= 1
+        try:
+            driver.quit()
+        except Exception:
+            pass
+
+    def close(self):
+        while True:
+            try:
+                driver = self._idle.get_nowait()
+            except queue.Empty:
+                return
+            self._discard(driver)
+
+
+_pool = None
+
+
+def default_pool() -> DriverPool:
+    global _pool
+    if _pool is None:
+        _pool = DriverPool()
+    return _pool
+
+
+def fetch_driver(url=TRENDING_URL, pool=None):
+    """Render the page in a pooled browser. Returns (page source, table text)."""
+    from selenium.webdriver.common.by import By
+    from selenium.webdriver.support.ui import WebDriverWait
+    from selenium.webdriver.support import expected_conditions as EC
+
+    with (pool or default_pool()).acquire() as driver:
+        driver.get(url)
+        table = WebDriverWait(driver, DRIVER_WAIT).until(
+            EC.presence_of_element_located((By.CLASS_NAME, TABLE_CLASS))
+        )
+        return driver.page_source, table.text
+
+
+def scrape_trending(url=TRENDING_URL, pool=None, use_http=True, use_driver=True, snapshots=True) -> list:
+    """Trending token names: plain GET first, pooled browser if that is blocked or parses empty."""
+    if use_http:
+        page = fetch_http(url)
+        tokens = parse_trending_html(page) if page else []
+        if tokens:
+            print(f"🌐 {len(tokens)} trending tokens without a browser")
+            if snapshots:
+                save_snapshot(page, "http")
+            return tokens
+    if not use_driver:
+        return []
+    try:
+        page, text = fetch_driver(url, pool)
+    except Exception as e:
+        print(f"Exception during scraping: {e}")
+        return []
+    tokens = parse_trending_html(page) or parse_table_text(text.split("\n"))
+    print(f"🧭 {len(tokens)} trending tokens from the browser")
+    if snapshots:
+        save_snapshot(page, "driver")
+        save_snapshot(text, "text")
+    return tokens
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Scrape Dexscreener trending tokens")
+    parser.add_argument("--snapshot", nargs="*", metavar="FILE",
+                        help=f"parse saved pages instead of scraping (default: all of {SNAPSHOT_DIR}/)")
+    parser.add_argument("--no-http", action="store_true", help="skip the plain GET, go straight to the browser")
+    parser.add_argument("--no-driver", action="store_true", help="never start a browser")
+    args = parser.parse_args()
+
+    if args.snapshot is not None:
+        paths = args.snapshot or sorted(glob.glob(os.path.join(SNAPSHOT_DIR, "*")))
+        for path in paths:
+            tokens = parse_snapshot(path)
+            flag = "✅" if tokens else "❌"
+            print(f"{flag} {path}: {len(tokens)} tokens {tokens[:5]}")
+    else:
+        print(scrape_trending(use_http=not args.no_http, use_driver=not args.no_driver))
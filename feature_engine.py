@@ -0,0 +1,211 @@
+# feature_engine.py
+import io
+import math
+import os
+from collections import deque
+import numpy as np
+import pandas as pd
+import yaml
+from candle_store import CandleStore, normalize_candles, _epoch_seconds
+import trace_log
+
+DEFAULT_FEATURES = ["open", "high", "low", "close", "volume", "return", "rolling_vol", "rolling_mean"]
+DEFAULT_WINDOW = 20
+RESYNC_EVERY = 10_000   # recompute window sums from the ring to cap float drift
+
+
+# ----------------------------
+# Rolling window state
+# ----------------------------
+class RollingWindow:
+    """Fixed-size ring buffer with O(1) mean/variance (Welford add/remove)."""
+
+    __slots__ = ("size", "values", "mean", "m2", "updates")
+
+    def __init__(self, size: int):
+        self.size = size
+        self.values = deque()
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.updates = 0
+
+    def push(self, x: float):
+        self.values.append(x)
+        n = len(self.values)
+        delta = x - self.mean
+        self.mean += delta / n
+        self.m2 += delta * (x - self.mean)
+        if n > self.size:
+            old = self.values.popleft()
+            n -= 1
+            delta = old - self.mean
+            self.mean -= delta / n
+            self.m2 -= delta * (old - self.mean)
+        self.updates += 1
+        if self.updates % RESYNC_EVERY == 0:
+            arr = np.fromiter(self.values, dtype="float64")
+            self.mean, self.m2 = arr.mean(), ((arr - arr.mean()) ** 2).sum()
+
+    @property
+    def full(self) -> bool:
+        return len(self.values) == self.size
+
+    def std(self) -> float:
+        """Sample std (ddof=1), like pandas rolling().std(); NaN until the window is full."""
+        if not self.full or self.size < 2:
+            return float("nan")
+        return math.sqrt(max(self.m2, 0.0) / (self.size - 1))
+
+    def avg(self) -> float:
+        return self.mean if self.full else float("nan")
+
+
+class PairState:
+    __slots__ = ("last_sec", "last_row", "ret", "close_win", "ret_win")
+
+    def __init__(self, window: int):
+        self.last_sec = None
+        self.last_row = None    # (open, high, low, close, volume)
+        self.ret = float("nan")
+        self.close_win = RollingWindow(window)
+        self.ret_win = RollingWindow(window)
+
+
+# ----------------------------
+# Engine
+# ----------------------------
+class FeatureEngine:
+    """
+    Incremental features for the AI bot, updated only from newly appended candles.
+
+    Per pair: `return` is the close-to-close change, `rolling_mean` the mean
+    close and `rolling_vol` the sample std of `return`, both over the last
+    `window` candles (NaN until the window is full). Cost per cycle scales with
+    the number of new candles: the engine tails the append-only
+    all_pairs_ohlc.csv from its last byte offset.
+    """
+
+    def __init__(self, features=None, window=DEFAULT_WINDOW, store: CandleStore = None, ohlc_csv=None):
+        self.features = list(features or DEFAULT_FEATURES)
+        self.window = window
+        self.store = store
+        self.ohlc_csv = ohlc_csv or (store.compat_csv if store else None)
+        self.pairs = {}
+        self._offset = 0
+        self._header = None
+
+    @classmethod
+    def from_config(cls, path="config.yaml", store=None):
+        with open(path, "r") as f:
+            config = yaml.safe_load(f)
+        return cls(config.get("features"), config.get("feature_window", DEFAULT_WINDOW),
+                   store=store, ohlc_csv=config.get("ohlc_csv"))
+
+    # ---- ingest ----
+    def update(self, df: pd.DataFrame) -> int:
+        """Feed new candles; returns how many advanced a pair's state."""
+        df = normalize_candles(df)
+        if df.empty:
+            return 0
+        df = df.sort_values(["pair_id", "time"], kind="mergesort")
+        secs = _epoch_seconds(df["time"])
+        applied = 0
+        stale = set()
+        advanced = set()
+        for pid, sec, o, h, l, c, v in zip(df["pair_id"], secs, df["open"], df["high"],
+                                           df["low"], df["close"], df["volume"]):
+            st = self.pairs.get(pid)
+            if st is None:
+                st = self.pairs[pid] = PairState(self.window)
+            if st.last_sec is not None and sec <= st.last_sec:
+                if sec < st.last_sec:
+                    stale.add(pid)   # backfilled candle: history changed underneath us
+                continue
+            if math.isnan(c):
+                continue
+            prev_close = st.last_row[3] if st.last_row else float("nan")
+            st.ret = c / prev_close - 1 if prev_close else float("nan")
+            st.close_win.push(c)
+            if not math.isnan(st.ret):
+                st.ret_win.push(st.ret)
+            st.last_sec, st.last_row = sec, (o, h, l, c, v)
+            applied += 1
+            advanced.add(pid)
+        for pid in stale:
+            self.rebuild(pid)
+        # a rebuilt pair may be gone (no store to reload it from)
+        trace_log.record([trace_log.trace_id(pid, self.pairs[pid].last_sec)
+                          for pid in advanced if pid in self.pairs], "features")
+        return applied
+
+    def rebuild(self, pair_id: str):
+        """Recompute one pair from the store (only after out-of-order backfill)."""
+        self.pairs.pop(pair_id, None)
+        if self.store is not None:
+            self.update(self.store.read(pair_id).tail(self.window * 2 + 1))
+
+    def poll(self) -> int:
+        """Read only the bytes appended to the OHLC CSV since the last poll."""
+        if not self.ohlc_csv or not os.path.exists(self.ohlc_csv):
+            return 0
+        size = os.path.getsize(self.ohlc_csv)
+        if size < self._offset:          # truncated by archive_csvs: new session
+            self.pairs.clear()
+            self._offset, self._header = 0, None
+        if size == self._offset:
+            return 0
+        with open(self.ohlc_csv, "rb") as f:
+            f.seek(self._offset)
+            chunk = f.read(size - self._offset)
+        end = chunk.rfind(b"\n") + 1      # leave a partially written line for next time
+        if end == 0:
+            return 0
+        self._offset += end
+        lines = chunk[:end].decode("utf-8").splitlines()
+        if self._header is None:
+            self._header, lines = lines[0], lines[1:]
+        # header lines re-appear when the file is recreated; drop them
+        body = "\n".join(l for l in lines if l and l != self._header)
+        if not body:
+            return 0
+        df = pd.read_csv(io.StringIO(f"{self._header}\n{body}"))
+        return self.update(df)
+
+    # ---- output ----
+    def pair_features(self, pair_id: str) -> dict:
+        st = self.pairs[pair_id]
+        o, h, l, c, v = st.last_row
+        return {
+            "open": o, "high": h, "low": l, "close": c, "volume": v,
+            "return": st.ret,
+            "rolling_vol": st.ret_win.std(),
+            "rolling_mean": st.close_win.avg(),
+        }
+
+    def matrix(self, pair_ids=None, ready_only=True):
+        """(pair_ids, X) with X shaped (pairs, features) in config feature order."""
+        pair_ids = [p for p in (pair_ids if pair_ids is not None else sorted(self.pairs)) if p in self.pairs]
+        rows, kept = [], []
+        for pid in pair_ids:
+            feats = self.pair_features(pid)
+            row = [feats[name] for name in self.features]
+            if ready_only and any(math.isnan(x) for x in row):
+                continue
+            rows.append(row)
+            kept.append(pid)
+        X = np.asarray(rows, dtype="float64").reshape(len(rows), len(self.features))
+        return kept, X
+
+    def frame(self, pair_ids=None) -> pd.DataFrame:
+        """Feature rows plus the trace_id of the candle they were computed from."""
+        kept, X = self.matrix(pair_ids)
+        trace_ids = [trace_log.trace_id(pid, self.pairs[pid].last_sec) for pid in kept]
+        return pd.DataFrame(X, columns=self.features).assign(pair_id=kept, trace_id=trace_ids)[
+            ["pair_id", *self.features, "trace_id"]]
+
+
+if __name__ == "__main__":
+    engine = FeatureEngine.from_config(store=CandleStore())
+    n = engine.poll()
+    ids, X = engine.matrix()
+    print(f"📐 {n} candles ingested, {len(ids)}/{len(engine.pairs)} pairs ready, matrix {X.shape}")
@@ -0,0 +1,236 @@
+# fill_model.py
+from __future__ import annotations
+import argparse
+import csv
+import os
+from lazy_imports import lazy_import
+from tx_ingest import TxTable, NATIVE_MINT, SOL_DECIMALS
+
+np = lazy_import("numpy")
+pd = lazy_import("pandas")
+
+BUYBOOK_CSV = "buybook.csv"
+CONTRACTS_CSV = "filtered_contracts.csv"
+SIM_TOKEN_LOG = "sim_token_log.csv"
+MODEL_CSV = "fill_model.csv"
+
+# Priors used until enough fills are captured to fit them
+DEFAULT_SWAP_FEE = 0.0025        # Raydium AMM LP fee
+DEFAULT_IMPACT_COEF = 2.0        # constant product: impact ~ size / reserve_in = 2 * size / liquidity
+DEFAULT_NETWORK_FEE_SOL = 0.000005
+DEFAULT_SOL_USD = 150.0
+DEFAULT_LIQUIDITY_USD = 100_000  # get-pairs' min_liquidity filter
+MIN_FIT_POINTS = 5
+
+
+def parse_usd(value) -> float:
+    """'$131K' / '$1.2M' / '950' -> float (NaN if unparsable); inverse of get-pairs' human_format."""
+    if value is None or (isinstance(value, float) and np.isnan(value)):
+        return np.nan
+    s = str(value).strip().replace("$", "").replace(",", "")
+    scale = {"K": 1e3, "M": 1e6, "B": 1e9}.get(s[-1:].upper(), 1.0)
+    try:
+        return float(s[:-1] if scale != 1.0 else s) * scale
+    except ValueError:
+        return np.nan
+
+
+# ----------------------------
+# Observations
+# ----------------------------
+def tx_observations(table: TxTable) -> pd.DataFrame:
+    """
+    One row per successful captured swap. The pool vaults are the non-signer
+    token accounts that mirror the signer's in/out legs; their pre-trade
+    balances are the reserves, so price impact needs no external price.
+    """
+    legs = table.legs[table.legs["mint"] != NATIVE_MINT]
+    ok = table.tx[~table.tx["failed"]].set_index("signature")
+    rows = []
+    for sig, group in legs[legs["signature"].isin(ok.index)].groupby("signature", sort=False):
+        own, pool = group[group["signer_owned"]], group[~group["signer_owned"]]
+        sold, bought = own[own["delta"] < 0], own[own["delta"] > 0]
+        if sold.empty or bought.empty:
+            continue
+        sold, bought = sold.loc[sold["delta"].idxmin()], bought.loc[bought["delta"].idxmax()]
+        vault_in = pool[(pool["mint"] == sold["mint"]) & (pool["delta"] > 0)]
+        vault_out = pool[(pool["mint"] == bought["mint"]) & (pool["delta"] < 0)]
+        if vault_in.empty or vault_out.empty:
+            continue
+        vault_in, vault_out = vault_in.loc[vault_in["delta"].idxmax()], vault_out.loc[vault_out["delta"].idxmin()]
+        reserve_in, reserve_out = float(vault_in["pre"]), float(vault_out["pre"])
+        amount_in, amount_out = float(vault_in["delta"]), float(-vault_out["delta"])
+        if reserve_in <= 0 or reserve_out <= 0:
+            continue
+        slippage = 1 - (amount_out / amount_in) / (reserve_out / reserve_in)
+        rows.append({
+            "source": "tx", "key": sig, "size_usd": np.nan, "liquidity_usd": np.nan,
+            "size_frac": amount_in / (2 * reserve_in),    # same scale as size_usd / liquidity_usd
+            "slippage": slippage, "extra_fee": 0.0,
+        })
+    return pd.DataFrame(rows)
+
+
+def buybook_observations(buybook_csv=BUYBOOK_CSV, contracts_csv=CONTRACTS_CSV) -> pd.DataFrame:
+    """Past fills from buybook.csv; pool liquidity comes from the session's filtered_contracts.csv."""
+    if not os.path.exists(buybook_csv) or os.path.getsize(buybook_csv) == 0:
+        return pd.DataFrame()
+    book = pd.read_csv(buybook_csv)
+    if book.empty:
+        return pd.DataFrame()
+    liquidity = contract_liquidity(contracts_csv)
+    size = pd.to_numeric(book["amount_bought"], errors="coerce") * book["price"].map(parse_usd)
+    liq = book["contract"].map(liquidity)
+    return pd.DataFrame({
+        "source": "buybook", "key": book["contract"], "size_usd": size, "liquidity_usd": liq,
+        "size_frac": size / liq,
+        "slippage": pd.to_numeric(book["slippage_pct"], errors="coerce") / 100,
+        "extra_fee": pd.to_numeric(book["jupiter_fee_pct"], errors="coerce").fillna(0) / 100,
+        "network_fee_usd": pd.to_numeric(book["fees_usd"], errors="coerce"),
+    })
+
+
+def _liquidity(contracts_csv, key) -> dict:
+    if not os.path.exists(contracts_csv) or os.path.getsize(contracts_csv) == 0:
+        return {}
+    df = pd.read_csv(contracts_csv, dtype=str)
+    if df.empty or "Liquidity" not in df.columns:
+        return {}
+    return dict(zip(df[key], df["Liquidity"].map(parse_usd)))
+
+
+def contract_liquidity(contracts_csv=CONTRACTS_CSV) -> dict:
+    return _liquidity(contracts_csv, "Contract")
+
+
+def pair_liquidity(contracts_csv=CONTRACTS_CSV) -> dict:
+    """PairId -> liquidity in USD, from a (possibly archived) filtered_contracts.csv."""
+    return _liquidity(contracts_csv, "PairId")
+
+
+def latest_sol_usd(token_log=SIM_TOKEN_LOG) -> float:
+    if os.path.exists(token_log) and os.path.getsize(token_log) > 0:
+        sol = pd.read_csv(token_log)
+        sol = sol[sol["Contract"] == "SOL"]
+        if not sol.empty:
+            return float(sol.iloc[-1]["Price"])
+    return DEFAULT_SOL_USD
+
+
+# ----------------------------
+# Model
+# ----------------------------
+class FillModel:
+    """
+    Cost of one fill as a fraction of trade size:
+
+        swap_fee + aggregator_fee + impact_coef * size / liquidity
+        + network_fee_sol * attempts * sol_usd / size
+
+    `attempts` is transactions sent per landed fill (failed sends still pay
+    the network fee). Nothing records the bot's own send attempts yet, so
+    fit() leaves it at 1. All inputs broadcast, so one call prices every trade.
+    """
+
+    PARAMS = ("swap_fee", "aggregator_fee", "impact_coef", "network_fee_sol", "attempts", "observations")
+
+    def __init__(self, swap_fee=DEFAULT_SWAP_FEE, aggregator_fee=0.0, impact_coef=DEFAULT_IMPACT_COEF,
+                 network_fee_sol=DEFAULT_NETWORK_FEE_SOL, attempts=1.0, observations=0):
+        self.swap_fee = swap_fee
+        self.aggregator_fee = aggregator_fee
+        self.impact_coef = impact_coef
+        self.network_fee_sol = network_fee_sol
+        self.attempts = attempts
+        self.observations = observations
+
+    @classmethod
+    def fit(cls, obs: pd.DataFrame, table: TxTable = None, sol_usd=None) -> "FillModel":
+        model = cls()
+        if table is not None and len(table.tx):
+            # the captured dumps are other wallets' transactions: good for the fee level,
+            # not for how often the bot's own sends fail, so `attempts` stays 1
+            model.network_fee_sol = float(table.tx["fee"].median()) / 10 ** SOL_DECIMALS
+        if obs is None or obs.empty:
+            return model
+        obs = obs.dropna(subset=["size_frac", "slippage"])
+        obs = obs[(obs["size_frac"] >= 0) & (obs["slippage"] > -0.5) & (obs["slippage"] < 0.5)]
+        model.observations = len(obs)
+        if len(obs) < MIN_FIT_POINTS:
+            return model                         # too few fills to move the priors
+
+        x, y = obs["size_frac"].to_numpy(), obs["slippage"].to_numpy()
+        if np.ptp(x) > 0:
+            slope, intercept = np.polyfit(x, y, 1)
+            model.impact_coef, model.swap_fee = max(float(slope), 0.0), max(float(intercept), 0.0)
+        else:
+            # every fill at the same size: keep the constant-product prior, fit the level
+            model.swap_fee = max(float(np.median(y - model.impact_coef * x)), 0.0)
+        model.aggregator_fee = float(obs["extra_fee"].fillna(0).mean())
+        if "network_fee_usd" in obs and obs["network_fee_usd"].notna().any():
+            fee_sol = obs["network_fee_usd"].dropna().median() / (sol_usd or latest_sol_usd())
+            model.network_fee_sol = max(model.network_fee_sol, float(fee_sol))
+        return model
+
+    def cost(self, size_usd, liquidity_usd, sol_usd=DEFAULT_SOL_USD):
+        """Fractional cost of one fill (vectorized)."""
+        size = np.asarray(size_usd, dtype="float64")
+        liq = np.asarray(liquidity_usd, dtype="float64")
+        liq = np.where(np.isfinite(liq) & (liq > 0), liq, DEFAULT_LIQUIDITY_USD)
+        with np.errstate(divide="ignore"):
+            fixed = np.where(size > 0, self.network_fee_sol * self.attempts * sol_usd / size, 0.0)
+        return self.swap_fee + self.aggregator_fee + self.impact_coef * size / liq + fixed
+
+    def round_trip(self, size_usd, liquidity_usd, sol_usd=DEFAULT_SOL_USD):
+        """Entry + exit cost, in the units run_configs subtracts from each trade's pnl."""
+        return 2 * self.cost(size_usd, liquidity_usd, sol_usd)
+
+    def pair_costs(self, pair_ids, size_usd, liquidity: dict, sol_usd=DEFAULT_SOL_USD) -> np.ndarray:
+        """Round-trip cost per pair for OHLCArrays.pair_ids (unknown pairs use DEFAULT_LIQUIDITY_USD)."""
+        liq = np.array([liquidity.get(p, np.nan) for p in pair_ids], dtype="float64")
+        return self.round_trip(size_usd, liq, sol_usd)
+
+    # ---- persistence ----
+    def save(self, path=MODEL_CSV):
+        tmp = f"{path}.tmp"
+        with open(tmp, "w", newline="") as f:
+            writer = csv.writer(f)
+            writer.writerow(["param", "value"])
+            writer.writerows((p, getattr(self, p)) for p in self.PARAMS)
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path=MODEL_CSV) -> "FillModel":
+        df = pd.read_csv(path)
+        return cls(**{p: float(v) for p, v in zip(df["param"], df["value"]) if p in cls.PARAMS})
+
+
+def build_model(tx_paths=None, buybook_csv=BUYBOOK_CSV, contracts_csv=CONTRACTS_CSV) -> FillModel:
+    table = TxTable.from_files(tx_paths)
+    obs = pd.concat([tx_observations(table), buybook_observations(buybook_csv, contracts_csv)], ignore_index=True)
+    return FillModel.fit(obs, table)
+
+
+def default_model(path=MODEL_CSV) -> FillModel:
+    """Saved fit if present, else fit from the captured transactions and buybook now."""
+    if os.path.exists(path):
+        return FillModel.load(path)
+    model = build_model()
+    model.save(path)
+    return model
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Fit the slippage / fee model from captured fills")
+    parser.add_argument("--buybook", default=BUYBOOK_CSV)
+    parser.add_argument("--contracts", default=CONTRACTS_CSV)
+    parser.add_argument("--size", type=float, default=100.0, help="trade size in USD for the example curve")
+    args = parser.parse_args()
+
+    model = build_model(None, args.buybook, args.contracts)
+    model.save()
+    print(f"🧮 Fill model from {int(model.observations)} fills: " +
+          ", ".join(f"{p}={getattr(model, p):.6g}" for p in FillModel.PARAMS))
+    liq = np.array([50e3, 100e3, 250e3, 1e6])
+    sol_usd = latest_sol_usd()
+    for l, c in zip(liq, model.round_trip(args.size, liq, sol_usd)):
+        print(f"   ${args.size:.0f} round trip @ ${l:,.0f} liquidity: {c * 100:.3f}%")
@@ -0,0 +1,162 @@
+# gap_index.py
+from __future__ import annotations
+import os
+import datetime
+from lazy_imports import lazy_import
+
+pd = lazy_import("pandas")
+
+WATERMARK_FILE = "dataloop_watermarks.csv"
+GAPS_FILE = "dataloop_gaps.csv"
+CANDLE_SECONDS = 60
+
+
+def _atomic_to_csv(df: pd.DataFrame, path: str):
+    tmp = f"{path}.tmp"
+    df.to_csv(tmp, index=False)
+    os.replace(tmp, path)
+
+
+class WatermarkIndex:
+    """
+    Persistent per-pair watermark (last candle time) plus interior gap list.
+
+    Updated by CandleStore on every append, so computing missing minutes is
+    O(pairs) and survives a restart. Gaps are minute ranges [start, end]
+    (epoch seconds, inclusive) that no fetch has covered yet. Minutes missing
+    inside one response are not gaps: GeckoTerminal omits minutes with no
+    trades, so only a fetch that stopped at its limit before reaching the
+    stored history leaves one.
+    """
+
+    def __init__(self, watermark_file=WATERMARK_FILE, gaps_file=GAPS_FILE):
+        self.watermark_file = watermark_file
+        self.gaps_file = gaps_file
+        self.last = {}    # pair_id -> last epoch second
+        self.counts = {}  # pair_id -> stored candle count
+        self.gaps = {}    # pair_id -> list of [start, end]
+
+    # ---- persistence ----
+    def exists(self) -> bool:
+        return os.path.exists(self.watermark_file)
+
+    def load(self):
+        self.last, self.counts, self.gaps = {}, {}, {}
+        if os.path.exists(self.watermark_file) and os.path.getsize(self.watermark_file) > 0:
+            df = pd.read_csv(self.watermark_file)
+            self.last = {str(p): int(t) for p, t in zip(df["pair_id"], df["last_epoch"])}
+            self.counts = {str(p): int(n) for p, n in zip(df["pair_id"], df["candles"])}
+        if os.path.exists(self.gaps_file) and os.path.getsize(self.gaps_file) > 0:
+            df = pd.read_csv(self.gaps_file)
+            for p, s, e in zip(df["pair_id"], df["gap_start"], df["gap_end"]):
+                self.gaps.setdefault(str(p), []).append([int(s), int(e)])
+
+    def save(self):
+        _atomic_to_csv(pd.DataFrame({
+            "pair_id": list(self.last.keys()),
+            "last_epoch": list(self.last.values()),
+            "last_time": [datetime.datetime.fromtimestamp(t, tz=datetime.UTC).isoformat() for t in self.last.values()],
+            "candles": [self.counts.get(p, 0) for p in self.last],
+        }), self.watermark_file)
+        rows = [(p, s, e) for p, spans in self.gaps.items() for s, e in spans]
+        _atomic_to_csv(pd.DataFrame(rows, columns=["pair_id", "gap_start", "gap_end"]), self.gaps_file)
+
+    def reset(self):
+        self.last, self.counts, self.gaps = {}, {}, {}
+        for path in (self.watermark_file, self.gaps_file):
+            if os.path.exists(path):
+                os.remove(path)
+
+    # ---- updates ----
+    def rebuild(self, pair_id: str, secs_sorted: list):
+        """Recompute the watermark for a pair from its full sorted history."""
+        if not secs_sorted:
+            self.last.pop(pair_id, None)
+            self.counts.pop(pair_id, None)
+            self.gaps.pop(pair_id, None)
+            return
+        self.last[pair_id] = secs_sorted[-1]
+        self.counts[pair_id] = len(secs_sorted)
+
+    def observe(self, pair_id: str, new_secs_sorted: list, is_stored=None, truncated=False):
+        """
+        Record freshly written candle times for a pair.
+
+        Times above the watermark extend it; times at or below it fill
+        existing gaps. `truncated` means the fetch hit its limit before
+        reaching the watermark, so the minutes between the old watermark and
+        the oldest new candle were never requested and become a gap.
+        `is_stored(sec)` is consulted to split a gap that was only partially filled.
+        """
+        if not new_secs_sorted:
+            return
+        self.counts[pair_id] = self.counts.get(pair_id, 0) + len(new_secs_sorted)
+        last = self.last.get(pair_id)
+        above = [s for s in new_secs_sorted if last is None or s > last]
+        below = [s for s in new_secs_sorted if last is not None and s <= last]
+
+        if above:
+            if truncated and last is not None and above[0] - last > CANDLE_SECONDS:
+                self.add_gap(pair_id, last + CANDLE_SECONDS, above[0] - CANDLE_SECONDS)
+            self.last[pair_id] = above[-1]
+        if below and pair_id in self.gaps:
+            self._fill(pair_id, below, is_stored)
+
+    def add_gap(self, pair_id: str, start: int, end: int):
+        self.gaps.setdefault(pair_id, []).append([start, end])
+
+    def _fill(self, pair_id, secs, is_stored):
+        lo, hi = secs[0], secs[-1]
+        kept = []
+        for start, end in self.gaps[pair_id]:
+            if end < lo or start > hi:
+                kept.append([start, end])
+                continue
+            # re-scan the touched gap minute by minute
+            run_start = None
+            for t in range(start, end + CANDLE_SECONDS, CANDLE_SECONDS):
+                present = is_stored(t) if is_stored else t in secs
+                if not present and run_start is None:
+                    run_start = t
+                elif present and run_start is not None:
+                    kept.append([run_start, t - CANDLE_SECONDS])
+                    run_start = None
+            if run_start is not None:
+                kept.append([run_start, end])
+        if kept:
+            self.gaps[pair_id] = kept
+        else:
+            self.gaps.pop(pair_id)
+
+    def close_gap(self, pair_id: str, start: int, end: int):
+        """Forget [start, end] once a fetch has covered it (what is still missing had no trades)."""
+        spans = []
+        for s, e in self.gaps.get(pair_id, []):
+            if e < start or s > end:
+                spans.append([s, e])
+                continue
+            if s < start:
+                spans.append([s, start - CANDLE_SECONDS])
+            if e > end:
+                spans.append([end + CANDLE_SECONDS, e])
+        if spans:
+            self.gaps[pair_id] = spans
+        else:
+            self.gaps.pop(pair_id, None)
+
+    # ---- queries ----
+    def last_times(self) -> dict:
+        return {p: pd.Timestamp(t, unit="s", tz="UTC") for p, t in self.last.items()}
+
+    def missing_minutes(self, now=None) -> dict:
+        """pair_id -> trailing minutes since the watermark."""
+        now = now or datetime.datetime.now(datetime.UTC).replace(second=0, microsecond=0)
+        now_sec = int(now.timestamp())
+        return {p: max(0, (now_sec - t) // CANDLE_SECONDS) for p, t in self.last.items()}
+
+    def interior_gaps(self) -> list:
+        """[(pair_id, start_sec, end_sec, minutes)] for every recorded interior gap."""
+        return [
+            (p, s, e, (e - s) // CANDLE_SECONDS + 1)
+            for p, spans in self.gaps.items() for s, e in spans
+        ]
@@ -0,0 +1,268 @@
+# gecko_fetcher.py
+from __future__ import annotations
+import argparse
+import asyncio
+import datetime
+import random
+import time
+import metrics
+from lazy_imports import lazy_import
+from rate_limit import TokenBucket, backoff_delay
+
+aiohttp = lazy_import("aiohttp")
+pd = lazy_import("pandas")
+
+GECKO_BASE_URL = "https://api.geckoterminal.com/api/v2"
+GECKO_RATE_PER_MINUTE = 30   # public API quota
+MAX_CONCURRENCY = 8
+GAP_FETCH_LIMIT = 1000       # API max candles per request
+GAP_MAX_PAGES = 3            # requests per gap per rotation; the rest of a longer gap stays open
+STUB_PORT = 8765
+
+
+# ----------------------------
+# Helpers
+# ----------------------------
+def candles_to_df(pair_id: str, candles: list) -> pd.DataFrame:
+    """Candle frame (pair_id, time, open, high, low, close, volume), sorted by time."""
+    if not candles:
+        return pd.DataFrame()
+    df = pd.DataFrame([{
+        "pair_id": pair_id,
+        "time": datetime.datetime.fromtimestamp(c[0], tz=datetime.UTC),
+        "open": c[1], "high": c[2], "low": c[3], "close": c[4], "volume": c[5]
+    } for c in candles])
+    return df.sort_values("time").reset_index(drop=True)
+
+
+# ----------------------------
+# Async fetch engine
+# ----------------------------
+class GeckoFetcher:
+    """
+    Concurrent OHLCV fetcher: one pooled aiohttp session, a shared token
+    bucket sized to the API quota, and jittered exponential backoff on 429.
+    """
+
+    def __init__(self, base_url=GECKO_BASE_URL, rate_per_minute=GECKO_RATE_PER_MINUTE,
+                 concurrency=MAX_CONCURRENCY, retries=5, timeout=15):
+        self.base_url = base_url.rstrip("/")
+        self.limiter = TokenBucket(rate_per_minute, per=60.0)
+        self.concurrency = concurrency
+        self.retries = retries
+        self.timeout = aiohttp.ClientTimeout(total=timeout)
+        self.rate_limited = 0
+        self.truncated = set()   # pairs whose fetch_pair stopped at its limit, not at the end of the data
+
+    async def fetch_candles(self, session, pair_id: str, interval="minute", page=1, limit=200,
+                            before_timestamp=None):
+        """Raw ohlcv_list for one page, or None when every attempt failed (unlike an empty page)."""
+        url = f"{self.base_url}/networks/solana/pools/{pair_id}/ohlcv/{interval}"
+        params = {"limit": limit, "page": page}
+        if before_timestamp is not None:
+            params = {"limit": limit, "before_timestamp": int(before_timestamp)}
+        where = f"page {page}" if before_timestamp is None else f"before {int(before_timestamp)}"
+        for attempt in range(self.retries):
+            await self.limiter.acquire_async()
+            start = time.perf_counter()
+            try:
+                async with session.get(url, params=params) as res:
+                    metrics.record_response("gecko_ohlcv", res.status, time.perf_counter() - start)
+                    if res.status == 429:
+                        self.rate_limited += 1
+                        wait = backoff_delay(attempt, base=2.0)
+                        self.limiter.penalize(wait)
+                        print(f"⚠️ Rate limit hit for {pair_id}, backing off {wait:.1f}s...")
+                        await asyncio.sleep(wait)
+                        continue
+                    if res.status >= 500:
+                        print(f"⚠️ Error {res.status} for {pair_id} {where}, retrying...")
+                        await asyncio.sleep(backoff_delay(attempt))
+                        continue
+                    if res.status != 200:
+                        print(f"❌ Error {res.status} for {pair_id}: {await res.text()}")
+                        return None
+                    payload = await res.json()
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                metrics.inc("http_errors_total", api="gecko_ohlcv")
+                print(f"❌ Exception fetching {pair_id} {where}: {e}")
+                await asyncio.sleep(backoff_delay(attempt))
+                continue
+
+            return payload.get("data", {}).get("attributes", {}).get("ohlcv_list", [])
+
+        return None
+
+    async def fetch_page(self, session, pair_id: str, interval="minute", page=1, limit=200,
+                         before_timestamp=None) -> pd.DataFrame:
+        candles = await self.fetch_candles(session, pair_id, interval, page, limit, before_timestamp)
+        return candles_to_df(pair_id, candles or [])
+
+    async def fetch_pair(self, session, pair_id: str, minutes_missing: int, max_fetch=200, interval="minute"):
+        """Page backwards until `minutes_missing` candles are covered (DataLoop semantics)."""
+        to_fetch, page, frames = minutes_missing, 1, []
+        while to_fetch > 0:
+            fetch_size = min(max_fetch, to_fetch)
+            df_page = await self.fetch_page(session, pair_id, interval=interval, page=page, limit=fetch_size)
+            if df_page.empty:
+                break
+            frames.append(df_page)
+            to_fetch -= fetch_size
+            page += 1
+            if len(df_page) < fetch_size:
+                break
+        else:
+            if frames:
+                self.truncated.add(pair_id)
+        if not frames:
+            return pd.DataFrame()
+        return pd.concat(frames, ignore_index=True).drop_duplicates(subset=["pair_id", "time"]).sort_values("time")
+
+    async def fetch_gap(self, session, pair_id: str, start: int, end: int, interval="minute",
+                        max_pages=GAP_MAX_PAGES):
+        """
+        Fetch the minutes in [start, end] (epoch seconds) for an interior gap,
+        paging backwards from `end`, each page anchored at the oldest candle
+        of the previous one. Returns (candles, covered_from): the candles in
+        the gap and the oldest minute the requests covered (`start` once the
+        whole gap was requested). (None, None) when the first request failed,
+        so callers can tell it from "no trades upstream".
+        """
+        frames, before = [], end + 60
+        while before > start:
+            limit = min((before - start) // 60, GAP_FETCH_LIMIT)
+            candles = await self.fetch_candles(session, pair_id, interval=interval,
+                                               limit=limit, before_timestamp=before)
+            if candles is None:
+                if not frames:
+                    return None, None
+                break
+            if len(candles) < limit:
+                before = start                      # upstream has nothing older than this page
+            else:
+                before = min(c[0] for c in candles)
+            frames.append(candles_to_df(pair_id, candles))
+            if len(frames) >= max_pages:
+                break
+        covered_from = max(before, start)
+        df = pd.concat(frames, ignore_index=True) if frames else pd.DataFrame()
+        if df.empty:
+            return df, covered_from
+        lo = datetime.datetime.fromtimestamp(start, tz=datetime.UTC)
+        df = df[df["time"] >= lo].drop_duplicates(subset=["pair_id", "time"])
+        return df.sort_values("time").reset_index(drop=True), covered_from
+
+    async def _gather(self, coros_factory, items):
+        sem = asyncio.Semaphore(self.concurrency)
+        connector = aiohttp.TCPConnector(limit=self.concurrency, keepalive_timeout=60)
+
+        async with aiohttp.ClientSession(connector=connector, timeout=self.timeout) as session:
+            async def run(item):
+                async with sem:
+                    return await coros_factory(session, item)
+
+            return await asyncio.gather(*(run(item) for item in items))
+
+    async def fetch_many(self, jobs: dict, max_fetch=200, interval="minute") -> dict:
+        """jobs: pair_id -> minutes_missing. Returns pair_id -> DataFrame."""
+        async def one(session, job):
+            pair_id, minutes = job
+            return pair_id, await self.fetch_pair(session, pair_id, minutes, max_fetch, interval)
+
+        return dict(await self._gather(one, list(jobs.items())))
+
+    async def fetch_gaps(self, gaps: list, interval="minute") -> list:
+        """
+        gaps: [(pair_id, start, end, ...)]. Returns [(pair_id, start, end, DataFrame, covered_from)],
+        with (None, None) for the last two when the fetch failed.
+        """
+        async def one(session, gap):
+            pair_id, start, end = gap[:3]
+            return (pair_id, start, end, *await self.fetch_gap(session, pair_id, start, end, interval))
+
+        return await self._gather(one, gaps)
+
+
+def fetch_pairs_ohlc(jobs: dict, max_fetch=200, interval="minute", truncated: set = None, **kwargs) -> dict:
+    """
+    Blocking wrapper for callers outside an event loop (DataLoop). Pairs whose
+    fetch stopped at its limit are added to `truncated` when given.
+    """
+    fetcher = GeckoFetcher(**kwargs)
+    fetched = asyncio.run(fetcher.fetch_many(jobs, max_fetch=max_fetch, interval=interval))
+    if truncated is not None:
+        truncated.update(fetcher.truncated)
+    return fetched
+
+
+def fetch_gaps_ohlc(gaps: list, interval="minute", **kwargs) -> list:
+    """Blocking wrapper around GeckoFetcher.fetch_gaps."""
+    return asyncio.run(GeckoFetcher(**kwargs).fetch_gaps(gaps, interval=interval))
+
+
+# ----------------------------
+# Local stub server (offline testing)
+# ----------------------------
+def make_stub_app(latency=0.05, rate_limit_ratio=0.0):
+    """GeckoTerminal-shaped OHLCV endpoint returning synthetic minute candles."""
+    from aiohttp import web
+
+    async def ohlcv(request):
+        await asyncio.sleep(latency)
+        if random.random() < rate_limit_ratio:
+            return web.json_response({"errors": ["rate limited"]}, status=429)
+        limit = int(request.query.get("limit", 200))
+        page = int(request.query.get("page", 1))
+        before = int(request.query.get("before_timestamp", time.time() + 60))
+        end = (before - 1) // 60 * 60 - (page - 1) * limit * 60
+        price = 1.0
+        candles = []
+        for i in range(limit):
+            price *= 1 + random.uniform(-0.01, 0.01)
+            candles.append([end - i * 60, price, price * 1.01, price * 0.99, price, random.uniform(10, 1000)])
+        return web.json_response({"data": {"attributes": {"ohlcv_list": candles}}})
+
+    app = web.Application()
+    app.router.add_get("/networks/solana/pools/{pair_id}/ohlcv/{interval}", ohlcv)
+    return app
+
+
+async def _bench(n_pairs, minutes, port, rate, concurrency):
+    from aiohttp import web
+
+    runner = web.AppRunner(make_stub_app())
+    await runner.setup()
+    await web.TCPSite(runner, "127.0.0.1", port).start()
+    try:
+        fetcher = GeckoFetcher(base_url=f"http://127.0.0.1:{port}", rate_per_minute=rate, concurrency=concurrency)
+        jobs = {f"STUBPAIR{i:03d}": minutes for i in range(n_pairs)}
+        start = time.perf_counter()
+        results = await fetcher.fetch_many(jobs)
+        elapsed = time.perf_counter() - start
+    finally:
+        await runner.cleanup()
+
+    candles = sum(len(df) for df in results.values())
+    print(f"📊 {n_pairs} pairs, {candles} candles in {elapsed:.2f}s "
+          f"({candles / elapsed:.0f} candles/s, {fetcher.rate_limited} x 429)")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Async GeckoTerminal OHLCV fetcher")
+    parser.add_argument("--stub", action="store_true", help="serve the local stub API and block")
+    parser.add_argument("--bench", action="store_true", help="benchmark the fetcher against the stub")
+    parser.add_argument("--port", type=int, default=STUB_PORT)
+    parser.add_argument("--pairs", type=int, default=50)
+    parser.add_argument("--minutes", type=int, default=400)
+    parser.add_argument("--rate", type=float, default=6000)
+    parser.add_argument("--concurrency", type=int, default=MAX_CONCURRENCY)
+    args = parser.parse_args()
+
+    if args.stub:
+        from aiohttp import web
+        print(f"🧪 Stub GeckoTerminal API on http://127.0.0.1:{args.port}")
+        web.run_app(make_stub_app(), host="127.0.0.1", port=args.port)
+    elif args.bench:
+        asyncio.run(_bench(args.pairs, args.minutes, args.port, args.rate, args.concurrency))
+    else:
+        parser.print_help()
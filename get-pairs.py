@@ -1,65 +1,31 @@
 import os
 import time
-import datetime
-import requests
-import pandas as pd
-from selenium.webdriver.common.by import By
-from selenium.webdriver.support.ui import WebDriverWait
-from selenium.webdriver.support import expected_conditions as EC
-from seleniumbase import Driver
+from concurrent.futures import ThreadPoolExecutor
+from candle_store import CandleStore
+from ohlc_backfill import Backfill, BackfillJournal, JOURNAL_FILE
+from rate_limit import TokenBucket
+from pair_meta_cache import default_cache
+from portfolio_ledger import default_ledger
+import metrics
+import dex_scraper
+from lazy_imports import lazy_import
+
+requests = lazy_import("requests")
+pd = lazy_import("pandas")
+
+DEXSCREENER_SEARCH_PER_MINUTE = 300     # Dexscreener search/pairs quota
+RESOLVE_WORKERS = 8
 
 # -------------------------
 # Utility Functions
 # -------------------------
 
-def processDataRaw(data):
-    """Clean raw scraped data into a DataFrame."""
-    clean_data = [x for x in data if x not in ['V1', 'V2', 'V3']]
-    rows, current_row = [], []
-    for item in clean_data:
-        if item.startswith("#") and current_row:
-            rows.append(current_row)
-            current_row = []
-        current_row.append(item)
-    if current_row:
-        rows.append(current_row)
-    return pd.DataFrame(rows)
-
-def rearrange_df(df):
-    """Extract Column 5 with token names."""
-    df = df.drop(index=0).reset_index(drop=True)
-    for idx, row in df.iterrows():
-        try:
-            col4 = str(row[4]) if 4 in row else ""
-            col5 = str(row[5]) if 5 in row else ""
-            col6 = str(row[6]) if 6 in row else ""
-            if col4 != "SOL":
-                if not col6.startswith("$"):
-                    df.at[idx, 5] = col4
-                else:
-                    df.at[idx, 5] = col4
-        except Exception as e:
-            print(f"Error processing row {idx}: {e}")
-    return pd.DataFrame({"Column5": df[5]})
-
 def scrapeDex():
-    """Scrape Dexscreener trending tokens."""
-    url = "https://dexscreener.com/solana/5m?rankBy=trendingScoreM5&order=desc"
-    driver = Driver(uc=True, headless=True)
-    rearranged_df = None
-    try:
-        driver.get(url)
-        data_element = WebDriverWait(driver, 10).until(
-            EC.presence_of_element_located((By.CLASS_NAME, 'ds-dex-table'))
-        )
-        if data_element:
-            data = data_element.text.split('\n')
-            original_df = processDataRaw(data)
-            rearranged_df = rearrange_df(original_df)
-    except Exception as e:
-        print(f"Exception during scraping: {e}")
-    driver.quit()
-    return rearranged_df
+    """Scrape Dexscreener trending tokens (plain GET first, pooled browser as fallback)."""
+    tokens = dex_scraper.scrape_trending()
+    if not tokens:
+        return None
+    return pd.DataFrame({"Column5": tokens})
 
 def human_format(num):
     """Convert large numbers into K, M, B style strings."""
@@ -75,11 +41,16 @@ def human_format(num):
     else:
         return f"${num:.0f}"
 
-def get_best_pair(token_name, min_mcap=140_000, min_liquidity=100_000):
+def get_best_pair(token_name, min_mcap=140_000, min_liquidity=100_000, session=None, limiter=None):
     """Fetch best trading pair for a token from Dexscreener API."""
     try:
+        if limiter:
+            limiter.acquire()
         url = f"https://api.dexscreener.com/latest/dex/search?q={token_name}"
-        resp = requests.get(url, timeout=10).json()
+        start = time.perf_counter()
+        res = (session or requests).get(url, timeout=10)
+        metrics.record_response("dexscreener_search", res.status_code, time.perf_counter() - start)
+        resp = res.json()
         if "pairs" not in resp or len(resp["pairs"]) == 0:
             return None
 
@@ -109,6 +80,10 @@ def get_best_pair(token_name, min_mcap=140_000, min_liquidity=100_000):
         if not valid_pairs:
             return None
         best_pair = max(valid_pairs, key=lambda x: (x["MarketCap_raw"], x["Liquidity_raw"]))
+        cache = default_cache()
+        cache.put_fields(f"contract:{best_pair['Contract']}", pair_id=best_pair["PairId"],
+                         liquidity_usd=best_pair["Liquidity_raw"], market_cap=best_pair["MarketCap_raw"])
+        cache.put(f"pair:{best_pair['PairId']}", "contract", best_pair["Contract"])
         return {
             "Token": best_pair["Token"],
             "Symbol": best_pair["Symbol"],
@@ -123,90 +98,93 @@ def get_best_pair(token_name, min_mcap=140_000, min_liquidity=100_000):
         print(f"Error fetching pairs for {token_name}: {e}")
         return None
 
-def add_contracts_to_df(rearranged_df):
-    """Add contracts and market data to tokens dataframe."""
-    results = []
-    for token in rearranged_df["Column5"]:
-        best_pair = get_best_pair(token)
-        if best_pair:
-            results.append(best_pair)
-        time.sleep(0.5)
+def add_contracts_to_df(rearranged_df, max_workers=RESOLVE_WORKERS):
+    """Add contracts and market data to tokens dataframe (concurrent, rate-limited, cached)."""
+    tokens = list(dict.fromkeys(rearranged_df["Column5"].dropna().astype(str)))
+    cache = default_cache()
+    cached, stale = cache.get_many([f"token:{t}" for t in tokens], "best_pair")
+    todo = [key[len("token:"):] for key in stale]
+    print(f"🗃️ {len(cached)} tokens from cache, resolving {len(todo)}...")
+
+    if todo:
+        limiter = TokenBucket(DEXSCREENER_SEARCH_PER_MINUTE, per=60.0, capacity=max_workers)
+        with requests.Session() as session:
+            adapter = requests.adapters.HTTPAdapter(pool_connections=max_workers, pool_maxsize=max_workers)
+            session.mount("https://", adapter)
+            with ThreadPoolExecutor(max_workers=max_workers) as pool:
+                resolved = dict(zip(todo, pool.map(lambda t: get_best_pair(t, session=session, limiter=limiter), todo)))
+        cache.put_many({f"token:{t}": pair for t, pair in resolved.items()}, "best_pair")
+        cached.update({f"token:{t}": pair for t, pair in resolved.items()})
+
+    results = [cached[f"token:{t}"] for t in tokens if cached.get(f"token:{t}")]
     return pd.DataFrame(results)
 
 def filter_supported_by_jupiter(df, contract_col="Contract", batch_size=50, price_api_url="https://lite-api.jup.ag/price/v3"):
-    """Filter tokens tradable on Jupiter."""
-    supported = []
+    """Filter tokens tradable on Jupiter (only contracts with a stale cached answer are queried)."""
+    cache = default_cache()
     contracts = df[contract_col].dropna().unique().tolist()
-    for i in range(0, len(contracts), batch_size):
-        batch = contracts[i:i + batch_size]
+    cached, stale = cache.get_many([f"contract:{c}" for c in contracts], "jupiter_tradable")
+    supported = [key[len("contract:"):] for key, ok in cached.items() if ok]
+    to_query = [key[len("contract:"):] for key in stale]
+    for i in range(0, len(to_query), batch_size):
+        batch = to_query[i:i + batch_size]
         ids = ",".join(batch)
+        start = time.perf_counter()
         resp = requests.get(price_api_url, params={"ids": ids})
+        metrics.record_response("jupiter_price", resp.status_code, time.perf_counter() - start)
         if resp.status_code != 200:
             print(f"Error querying Jupiter API for batch starting at {i}: {resp.status_code}")
             continue
         data = resp.json()
         supported.extend(data.keys())
+        cache.put_many({f"contract:{c}": c in data for c in batch}, "jupiter_tradable")
     supported_set = set(supported)
     filtered_df = df[df[contract_col].isin(supported_set)].copy()
     return filtered_df, supported_set
 
-def fetch_full_ohlc_gecko(pair_id: str, interval="hour", pages=5, limit=200, sleep=0.5, output_csv=None):
-    """Fetch OHLCV candles from GeckoTerminal API."""
-    all_candles = []
-    for page in range(1, pages + 1):
-        url = f"https://api.geckoterminal.com/api/v2/networks/solana/pools/{pair_id}/ohlcv/{interval}?limit={limit}&page={page}"
-        res = requests.get(url)
-        if res.status_code == 429:
-            print(f"⚠️ Rate limit hit for {pair_id} page {page}, waiting 7s...")
-            time.sleep(7)
-            continue
-        if res.status_code != 200:
-            print(f"❌ Error {res.status_code} for {pair_id} page {page}: {res.text}")
-            return pd.DataFrame()
-        candles = res.json().get("data", {}).get("attributes", {}).get("ohlcv_list", [])
-        if not candles:
-            break
-        for c in candles:
-            all_candles.append({
-                "pair_id": pair_id,
-                "time": datetime.datetime.fromtimestamp(c[0]),
-                "open": c[1], "high": c[2], "low": c[3], "close": c[4], "volume": c[5],
-            })
-        time.sleep(sleep)
-
-    df = pd.DataFrame(all_candles)
-    if not df.empty:
-        df = df.drop_duplicates(subset=["pair_id", "time"]).sort_values(["pair_id", "time"]).reset_index(drop=True)
-        if output_csv:
-            df.to_csv(output_csv, mode="a", header=not os.path.exists(output_csv), index=False)
-    return df
-
-def fetch_and_save_all(contract_df, interval="minute", pages=10, limit=200, output_csv="all_pairs_ohlc.csv", fetched_pairs_csv="fetched_pairs.csv", filtered_contracts_csv="filtered_contracts.csv"):
-    """Fetch OHLC for all pairs and save progressively (resumable)."""
+def fetch_and_save_all(contract_df, interval="minute", pages=10, limit=200, output_csv="all_pairs_ohlc.csv", fetched_pairs_csv="fetched_pairs.csv", filtered_contracts_csv="filtered_contracts.csv", journal_file=JOURNAL_FILE):
+    """Fetch OHLC for all pairs and save progressively (resumable per page via the backfill journal)."""
     if os.path.exists(fetched_pairs_csv):
         fetched_pairs_df = pd.read_csv(fetched_pairs_csv)
         fetched_pairs = set(fetched_pairs_df["PairId"].dropna().unique())
     else:
         fetched_pairs, fetched_pairs_df = set(), pd.DataFrame(columns=["PairId"])
-    new_fetched_pairs = []
+    store = CandleStore(compat_csv=output_csv)
+    journal = BackfillJournal(journal_file)
+    backfill = Backfill(store, journal)
+
+    # fetched pairs with failed pages are walked again; their finished pages are skipped
+    todo = [p for p in contract_df["PairId"].dropna().unique()
+            if p not in fetched_pairs or not journal.complete(p, interval, pages)]
+    if len(todo) < contract_df["PairId"].nunique():
+        print(f"⏩ Skipping {contract_df['PairId'].nunique() - len(todo)} pairs (already fetched)")
+    results = {r["pair_id"]: r for r in backfill.run(todo, interval=interval, pages=pages, limit=limit)}
+
+    # one more pass over the pages that failed (rate limits usually clear by then)
+    retry = [p for p, r in results.items() if not r["complete"]]
+    if retry:
+        print(f"🔁 Retrying failed pages for {len(retry)} pairs")
+        results.update({r["pair_id"]: r for r in backfill.run(retry, interval=interval, pages=pages, limit=limit)})
 
-    for pair_id in contract_df["PairId"].dropna().unique():
-        if pair_id in fetched_pairs:
-            print(f"⏩ Skipping {pair_id} (already fetched)")
+    new_fetched_pairs = []
+    for pair_id, r in results.items():
+        if not (r["candles"] or store.count(pair_id)):
+            print(f"⚠️ Skipped {pair_id} (no data)")
             continue
-        print(f"\n📊 Fetching Pair ID: {pair_id}")
-        df = fetch_full_ohlc_gecko(pair_id, interval=interval, pages=pages, limit=limit, output_csv=output_csv)
-        if not df.empty:
+        if not r["complete"]:
+            print(f"⚠️ {pair_id} kept with partial history, failed pages resume on the next run")
+        if pair_id not in fetched_pairs:
             new_fetched_pairs.append(pair_id)
-        else:
-            print(f"⚠️ Skipped {pair_id} (no data)")
 
     if new_fetched_pairs:
         pd.DataFrame(new_fetched_pairs, columns=["PairId"]).to_csv(fetched_pairs_csv, mode="a", header=not os.path.exists(fetched_pairs_csv), index=False)
 
-    fetched_pairs_df = pd.read_csv(fetched_pairs_csv).drop_duplicates()
+    fetched_pairs_df = pd.read_csv(fetched_pairs_csv).drop_duplicates() if os.path.exists(fetched_pairs_csv) else pd.DataFrame(columns=["PairId"])
     filtered_df = contract_df[contract_df["PairId"].isin(fetched_pairs_df["PairId"])]
     filtered_df.to_csv(filtered_contracts_csv, index=False)
+    tracked = filtered_df["Contract"].dropna().unique()
+    default_cache().set_tracked(tracked)
+    default_ledger().record_contracts(len(tracked))
     return fetched_pairs_df, filtered_df
 
 # -------------------------
@@ -215,30 +193,35 @@ def fetch_and_save_all(contract_df, interval="minute", pages=10, limit=200, outp
 
 def main():
     print("🔎 Scraping trending tokens from Dexscreener...")
-    rearranged_df = scrapeDex()
+    with metrics.timer("stage_seconds", stage="scrape"):
+        rearranged_df = scrapeDex()
     if rearranged_df is None or rearranged_df.empty:
         print("❌ No tokens scraped.")
         return
 
     print("🔎 Getting best pairs from Dexscreener API...")
-    rearranged_df_with_contracts = add_contracts_to_df(rearranged_df)
+    with metrics.timer("stage_seconds", stage="resolve_pairs"):
+        rearranged_df_with_contracts = add_contracts_to_df(rearranged_df)
     print(f"✅ Found {len(rearranged_df_with_contracts)} valid tokens")
 
     print("🔎 Filtering tokens supported by Jupiter...")
-    filtered_df, supported_contracts = filter_supported_by_jupiter(rearranged_df_with_contracts)
+    with metrics.timer("stage_seconds", stage="jupiter_filter"):
+        filtered_df, supported_contracts = filter_supported_by_jupiter(rearranged_df_with_contracts)
     print(f"✅ {len(supported_contracts)} tokens supported by Jupiter")
 
     print("📊 Fetching OHLC data for supported pairs...")
-    fetch_and_save_all(
-        filtered_df,
-        interval="minute",
-        pages=20,
-        limit=800,
-        output_csv="all_pairs_ohlc.csv",
-        fetched_pairs_csv="fetched_pairs.csv",
-        filtered_contracts_csv="filtered_contracts.csv"
-    )
+    with metrics.timer("stage_seconds", stage="fetch_ohlc"):
+        fetch_and_save_all(
+            filtered_df,
+            interval="minute",
+            pages=20,
+            limit=800,
+            output_csv="all_pairs_ohlc.csv",
+            fetched_pairs_csv="fetched_pairs.csv",
+            filtered_contracts_csv="filtered_contracts.csv"
+        )
     print("✅ Pipeline completed!")
 
 if __name__ == "__main__":
+    metrics.init("Get-pairs")
     main()
@@ -0,0 +1,82 @@
+# lazy_imports.py
+import argparse
+import importlib.util
+import os
+import subprocess
+import sys
+import time
+
+# Entry points main.py spawns (or that sit on its control path)
+ENTRY_POINTS = ["main", "control_bus", "supervisor", "metrics", "DataLoop", "get-pairs",
+                "allocation_manager", "model_server", "price_feed", "archive_store"]
+CONTROL_PATH = ["main", "control_bus", "supervisor", "metrics", "allocation_manager", "archive_store"]
+COLD_START_TARGET = 1.0   # seconds, for CONTROL_PATH modules
+
+
+def lazy_import(name):
+    """
+    Module whose body runs on first attribute access (importlib's LazyLoader).
+    `pd = lazy_import("pandas")` costs nothing until `pd.read_csv` is reached,
+    so processes that never touch a DataFrame never pay for pandas.
+    """
+    if name in sys.modules:
+        return sys.modules[name]
+    spec = importlib.util.find_spec(name)
+    if spec is None:
+        raise ModuleNotFoundError(f"No module named '{name}'", name=name)
+    loader = importlib.util.LazyLoader(spec.loader)
+    spec.loader = loader
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    loader.exec_module(module)
+    return module
+
+
+# ----------------------------
+# Startup profiling
+# ----------------------------
+def _importtime(module):
+    """Wall time of a fresh `import module` and {top-level package: cumulative µs} from -X importtime."""
+    code = f"import importlib; importlib.import_module({module!r})"
+    start = time.perf_counter()
+    proc = subprocess.run([sys.executable, "-X", "importtime", "-c", code],
+                          capture_output=True, text=True, cwd=os.path.dirname(os.path.abspath(__file__)))
+    wall = time.perf_counter() - start
+    packages = {}
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        _, cumulative, name = (part.strip() for part in line[len("import time:"):].split("|"))
+        if not cumulative.isdigit() or name == module:
+            continue
+        top = name.split(".")[0]
+        packages[top] = max(packages.get(top, 0), int(cumulative))   # outermost import is the largest
+    error = proc.stderr.strip().splitlines()[-1] if proc.returncode else ""
+    return wall, packages, error
+
+
+def profile_startup(modules=None, top=8, target=COLD_START_TARGET) -> dict:
+    """Print cold-start time per entry point and its heaviest imports; returns {module: seconds}."""
+    results = {}
+    for module in modules or ENTRY_POINTS:
+        wall, packages, error = _importtime(module)
+        results[module] = wall
+        flag = "✅" if wall <= target or module not in CONTROL_PATH else "⚠️"
+        print(f"{flag} {module}: {wall:.3f}s cold start" + (f" ({error})" if error else ""))
+        heaviest = sorted(packages.items(), key=lambda kv: -kv[1])[:top]
+        for name, us in heaviest:
+            if us >= 10_000:
+                print(f"     {us / 1e6:6.3f}s  {name}")
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Cold-start import profile of the entry points")
+    parser.add_argument("--profile-startup", nargs="*", metavar="MODULE",
+                        help="modules to profile (default: every entry point)")
+    parser.add_argument("--top", type=int, default=8)
+    args = parser.parse_args()
+    if args.profile_startup is None:
+        parser.print_help()
+    else:
+        profile_startup(args.profile_startup or None, args.top)
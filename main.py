@@ -1,22 +1,40 @@
 # main.py
 import os
+import sys
 import time
-import pandas as pd
 import subprocess
 import datetime
-import shutil
-
-MASTER_FILE = "master_control.csv"
-STATUS_FILE = "dataloop_status.csv"
+from archive_store import default_store
+from candle_store import CandleStore
+from candle_rollups import RollupStore
+from signal_queue import default_queue
+from pair_meta_cache import default_cache
+from portfolio_ledger import default_ledger
+import control_bus
+import metrics
+import trace_log
+from supervisor import Supervisor, Worker
+
+MASTER_FILE = control_bus.MASTER_FILE
+STATUS_FILE = control_bus.STATUS_FILE
+OHLC_FILE = "all_pairs_ohlc.csv"
+
+RUNTIME_SECONDS = 12 * 3600
+DATALOOP_READY_TIMEOUT = 300
+DATALOOP_MAX_HEARTBEAT_AGE = 300  # a rotation older than this means DataLoop is hung
+
+bus = control_bus.default_bus()
 
 # Files to back up
 CSV_FILES = [
     "ai-thought.csv",
     "all_pairs_ohlc.csv",
+    "backfill_journal.csv",
     "buybook.csv",
     "fetched_pairs.csv",
     "filtered_contracts.csv",
     "pending.csv",
+    "trace_log.csv",
     "transactionbook.csv",
 ]
 
@@ -26,98 +44,126 @@ RESET_FILES = {
 }
 
 
-def archive_csvs():
-    """Archive CSVs into ./archive/<timestamp>/ before starting system."""
-    ts = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
-    archive_dir = os.path.join("archive", ts)
-    os.makedirs(archive_dir, exist_ok=True)
-
-    # Copy & clean normal files
-    for fname in CSV_FILES:
-        if os.path.exists(fname):
-            try:
-                df = pd.read_csv(fname)
-                # Keep headers only
-                header_only = df.head(0)
-                # Save backup full copy
-                shutil.copy(fname, os.path.join(archive_dir, fname))
-                # Truncate file but keep headers
-                header_only.to_csv(fname, index=False)
-                print(f"📦 Archived + cleaned {fname}")
-            except Exception as e:
-                print(f"⚠️ Failed to archive {fname}: {e}")
-
-    # Reset special files
-    for fname, headers in RESET_FILES.items():
-        df_reset = pd.DataFrame([["OFF", "OFF"]], columns=headers)
-        if os.path.exists(fname):
-            shutil.copy(fname, os.path.join(archive_dir, fname))
-        df_reset.to_csv(fname, index=False)
-        print(f"🧹 Reset {fname} to OFF,OFF")
-
-    print(f"✅ Archive completed at {archive_dir}")
+def archive_csvs(background=True):
+    """
+    Archive CSVs into ./archive/<timestamp>/ before starting system.
+    Files are swapped for header-only copies right away; compression runs in the background.
+    """
+    # Signals: write the queue's ordered log out as pending.csv / ai-thought.csv so it is archived with them
+    signals = default_queue()
+    if signals.stats():
+        print(f"📨 Exported {signals.export()} queued signals for the archive")
+
+    store = default_store()
+    files = [f for f in CSV_FILES + list(RESET_FILES) if os.path.exists(f)]
+    session = store.archive(files, background=background)
+    print(f"📦 Staged {len(files)} files for archive/{session} (cleaned to headers)")
+
+    # Candles: the compat CSV was staged above, reset the partitioned store behind it
+    try:
+        store_ohlc = CandleStore(compat_csv=OHLC_FILE, load=False)
+        store_ohlc.reset()
+        RollupStore(load=False).reset()
+        print(f"📦 Cleaned {OHLC_FILE} ({store_ohlc.root}/ and rollups reset)")
+    except Exception as e:
+        print(f"⚠️ Failed to reset {OHLC_FILE}: {e}")
+
+    signals.reset()
+
+    # Tracked contracts: forget last session's set, get-pairs records this session's
+    default_cache().set_tracked([])
+    default_ledger().record_contracts(0)
+    print("🧹 Cleared the tracked contract count")
+
+    # Reset special files (controller.csv is a view of the control bus)
+    bus.set_controller(status="OFF", status2="OFF")
+    print(f"🧹 Reset {', '.join(RESET_FILES)} to OFF,OFF")
+    return store
 
 
 def reset_master():
-    df = pd.DataFrame([{"AI_BOT": "OFF", "WATCHER": "OFF", "DataLoop": "OFF", "Get-pairs": "OFF"}])
-    df.to_csv(MASTER_FILE, index=False)
+    bus.set_master(**{m: "OFF" for m in control_bus.MODULES})
     print("🔄 Master control reset: all OFF.")
 
 
 def set_master(ai="OFF", watcher="OFF", dataloop="OFF", getpairs="OFF"):
-    df = pd.DataFrame([{"AI_BOT": ai, "WATCHER": watcher, "DataLoop": dataloop, "Get-pairs": getpairs}])
-    df.to_csv(MASTER_FILE, index=False)
+    bus.set_master(**{"AI_BOT": ai, "WATCHER": watcher, "DataLoop": dataloop, "Get-pairs": getpairs})
     print(f"✅ Master updated: AI_BOT={ai}, WATCHER={watcher}, DataLoop={dataloop}, Get-pairs={getpairs}")
 
 
-def wait_for_dataloop_ready(timeout=300):
-    """Wait until dataloop_status.csv shows a run."""
-    start = time.time()
-    while time.time() - start < timeout:
-        if os.path.exists(STATUS_FILE):
-            try:
-                df = pd.read_csv(STATUS_FILE)
-                if "last_run" in df.columns and not df.empty:
-                    print("📌 DataLoop ready. Proceeding...")
-                    return True
-            except Exception:
-                pass
-        print("⏳ Waiting for DataLoop first run...")
-        time.sleep(5)
+def wait_for_dataloop_ready(since=None, timeout=300):
+    """Wait until DataLoop publishes its first ready heartbeat (event-driven, no polling)."""
+    print("⏳ Waiting for DataLoop first run...")
+    if bus.wait_ready("DataLoop", since=since, timeout=timeout):
+        print("📌 DataLoop ready. Proceeding...")
+        return True
     return False
 
 
 if __name__ == "__main__":
-    # Step 0: archive before running
-    archive_csvs()
+    if "--profile-startup" in sys.argv:
+        from lazy_imports import profile_startup
+        profile_startup()
+        exit(0)
+
+    metrics.init("main")
+
+    # Step 0: archive before running (compression continues in the background)
+    with metrics.timer("stage_seconds", stage="archive"):
+        archiver = archive_csvs()
+    print(f"⏱️ Trace session {trace_log.new_session()} (report: python trace_log.py)")
 
     reset_master()
 
     # Step 1: run get-pairs once
     set_master(getpairs="ON")
-    subprocess.run(["python", "get-pairs.py"])
+    with metrics.timer("stage_seconds", stage="get_pairs"):
+        subprocess.run(["python", "get-pairs.py"])
     set_master(getpairs="OFF")
 
-    # Step 2: start DataLoop
-    set_master(dataloop="ON")
-    dataloop_proc = subprocess.Popen(["python", "DataLoop.py"])
-
-    # Step 3: wait for DataLoop to finish 1st run
-    if not wait_for_dataloop_ready():
+    # Step 2: start DataLoop, and the AI bot alongside it so it loads its models
+    # while DataLoop finishes its first rotation. The watcher stays OFF until then,
+    # so nothing is executed on stale candles. The model server keeps both models
+    # warm across bot restarts, and the price feed polls each tracked contract once
+    # for every consumer.
+    sup = Supervisor([
+        Worker("DataLoop", ["python", "DataLoop.py"], heartbeat="DataLoop", max_heartbeat_age=DATALOOP_MAX_HEARTBEAT_AGE,
+               module="DataLoop"),
+        Worker("Inference", ["python", "model_server.py", "--serve"]),
+        Worker("PriceFeed", ["python", "price_feed.py", "--serve"]),
+        Worker("AI_BOT", ["python", "aibot.py"], module="AI_BOT"),
+    ], bus=bus)
+
+    set_master(ai="ON", dataloop="ON")
+    dataloop_started = datetime.datetime.now(datetime.UTC)
+    sup.start("DataLoop")
+    sup.start("Inference")
+    sup.start("PriceFeed")
+    sup.start("AI_BOT")
+
+    # Step 3: wait for DataLoop to finish 1st run (while supervising both)
+    def dataloop_ready():
+        beat = bus.last_ready("DataLoop")
+        return beat is not None and beat >= dataloop_started
+
+    print("⏳ Waiting for DataLoop first run...")
+    if not sup.run(DATALOOP_READY_TIMEOUT, until=dataloop_ready):
         print("❌ DataLoop did not complete first run in time.")
-        dataloop_proc.terminate()
+        set_master()
+        sup.stop_all()
         exit(1)
+    print(f"📌 DataLoop ready after {(datetime.datetime.now(datetime.UTC) - dataloop_started).total_seconds():.1f}s.")
 
-    # Step 4: launch AI Bot (with Watcher ON in master only)
+    # Step 4: enable the Watcher now that candles are fresh
     set_master(ai="ON", watcher="ON", dataloop="ON")
-    aibot_proc = subprocess.Popen(["python", "aibot.py"])
 
-    # Step 5: let them run for 12 hours
+    # Step 5: supervise for 12 hours (restart crashed or hung workers)
     print("⏳ System running for 12 hours...")
-    time.sleep(12 * 3600)
+    sup.run(RUNTIME_SECONDS)
 
     # Step 6: stop everything
     print("🛑 12 hours reached. Shutting down...")
     set_master(ai="OFF", watcher="OFF", dataloop="OFF", getpairs="OFF")
-    aibot_proc.terminate()
-    dataloop_proc.terminate()
+    sup.report()
+    sup.stop_all()
+    archiver.wait()
@@ -0,0 +1,240 @@
+# metrics.py
+import atexit
+import bisect
+import os
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+METRICS_DIR = "metrics"
+DUMP_INTERVAL = 30
+# one endpoint per process: http://127.0.0.1:<port>/metrics
+METRICS_PORTS = {"main": 9100, "DataLoop": 9101, "Get-pairs": 9102, "Inference": 9103, "PriceFeed": 9104}
+# seconds; covers a cached CSV read up to a rate-limited API call
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+HELP = {
+    "http_request_seconds": "Upstream HTTP request latency by API",
+    "http_rate_limited_total": "Upstream 429 responses by API",
+    "http_errors_total": "Upstream non-200 responses and exceptions by API",
+    "csv_io_seconds": "CSV read/write time by file and operation",
+    "candles_appended_total": "Candles written to the candle store",
+    "rotation_seconds": "DataLoop rotation duration",
+    "rotation_candles": "Candles appended in the last DataLoop rotation",
+    "model_score_seconds": "Classifier + regressor scoring time per batch",
+    "model_score_rows_total": "Rows scored",
+    "worker_restarts_total": "Supervisor restarts by worker",
+    "stage_seconds": "Duration of one-off stages (archive, get-pairs)",
+    "signal_age_seconds": "Seconds from candle close until a trace reached a stage",
+}
+
+
+def _label_key(labels: dict) -> tuple:
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def _fmt_labels(key, extra=()) -> str:
+    items = list(key) + list(extra)
+    if not items:
+        return ""
+    return "{" + ",".join(f'{k}="{v}"' for k, v in items) + "}"
+
+
+class Histogram:
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)   # last slot is +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def quantile(self, q) -> float:
+        """Upper bound of the bucket holding the q-th observation."""
+        if not self.count:
+            return float("nan")
+        rank, seen = q * self.count, 0
+        for bound, n in zip(self.buckets + (float("inf"),), self.counts):
+            seen += n
+            if seen >= rank:
+                return bound
+        return float("inf")
+
+
+class Registry:
+    """
+    Process-local counters, gauges and histograms, keyed by name + labels.
+
+    Everything is in memory behind one lock, so recording costs a dict
+    lookup. render() produces Prometheus text; serve() exposes it over HTTP
+    and rewrites metrics/<process>.prom every DUMP_INTERVAL seconds (and at
+    exit) for runs nobody scrapes.
+    """
+
+    def __init__(self, process="main"):
+        self.process = process
+        self._lock = threading.Lock()
+        self.counters = {}
+        self.gauges = {}
+        self.histograms = {}
+        self.started = time.time()
+
+    # ---- recording ----
+    def inc(self, name, value=1, **labels):
+        key = (name, _label_key(labels))
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def set(self, name, value, **labels):
+        with self._lock:
+            self.gauges[(name, _label_key(labels))] = value
+
+    def observe(self, name, value, buckets=LATENCY_BUCKETS, **labels):
+        key = (name, _label_key(labels))
+        with self._lock:
+            hist = self.histograms.get(key)
+            if hist is None:
+                hist = self.histograms[key] = Histogram(buckets)
+            hist.observe(value)
+
+    def counter(self, name, **labels):
+        return self.counters.get((name, _label_key(labels)), 0)
+
+    @contextmanager
+    def timer(self, name, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start, **labels)
+
+    # ---- export ----
+    def render(self) -> str:
+        lines = []
+        with self._lock:
+            groups = {}
+            for (name, key), value in self.counters.items():
+                groups.setdefault((name, "counter"), []).append((key, value))
+            for (name, key), value in self.gauges.items():
+                groups.setdefault((name, "gauge"), []).append((key, value))
+            for (name, key), hist in self.histograms.items():
+                groups.setdefault((name, "histogram"), []).append((key, hist))
+
+            for (name, kind), series in sorted(groups.items()):
+                if name in HELP:
+                    lines.append(f"# HELP {name} {HELP[name]}")
+                lines.append(f"# TYPE {name} {kind}")
+                for key, value in sorted(series, key=lambda s: s[0]):
+                    if kind != "histogram":
+                        lines.append(f"{name}{_fmt_labels(key)} {value}")
+                        continue
+                    cumulative = 0
+                    for bound, n in zip(value.buckets + (float("inf"),), value.counts):
+                        cumulative += n
+                        le = "+Inf" if bound == float("inf") else repr(bound)
+                        lines.append(f"{name}_bucket{_fmt_labels(key, [('le', le)])} {cumulative}")
+                    lines.append(f"{name}_sum{_fmt_labels(key)} {value.sum}")
+                    lines.append(f"{name}_count{_fmt_labels(key)} {value.count}")
+        lines.append(f'process_start_time_seconds{{process="{self.process}"}} {self.started}')
+        return "\n".join(lines) + "\n"
+
+    def summary(self) -> list:
+        """[(name, labels, count, mean, p50, p95)] per histogram, slowest total first."""
+        with self._lock:
+            rows = [(name, dict(key), h.count, h.sum / h.count if h.count else 0.0,
+                     h.quantile(0.5), h.quantile(0.95), h.sum)
+                    for (name, key), h in self.histograms.items()]
+        return [r[:6] for r in sorted(rows, key=lambda r: -r[6])]
+
+    def dump(self, directory=METRICS_DIR):
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, f"{self.process}.prom")
+        tmp = f"{path}.tmp"
+        with open(tmp, "w") as f:
+            f.write(self.render())
+        os.replace(tmp, path)
+        return path
+
+    def serve(self, port=None, dump_interval=DUMP_INTERVAL, directory=METRICS_DIR):
+        """Expose /metrics on a daemon thread and dump to file periodically. Never raises."""
+        registry = self
+        port = port if port is not None else METRICS_PORTS.get(self.process)
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                body = registry.render().encode()
+                self.send_response(200 if self.path.startswith("/metrics") else 404)
+                self.send_header("Content-Type", "text/plain; version=0.0.4")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        if port:
+            try:
+                server = ThreadingHTTPServer(("127.0.0.1", port), Handler)
+                threading.Thread(target=server.serve_forever, name="metrics-http", daemon=True).start()
+            except OSError as e:
+                print(f"⚠️ Metrics endpoint for {self.process} not started on :{port}: {e}")
+
+        def dump_loop():
+            while True:
+                time.sleep(dump_interval)
+                try:
+                    self.dump(directory)
+                except OSError:
+                    pass
+
+        threading.Thread(target=dump_loop, name="metrics-dump", daemon=True).start()
+        atexit.register(lambda: self.dump(directory))
+
+
+_registry = Registry()
+
+
+def registry() -> Registry:
+    return _registry
+
+
+def init(process, serve=True, port=None) -> Registry:
+    """Name this process's metrics (file name / process label) and start exporting them."""
+    _registry.process = process
+    if serve:
+        _registry.serve(port)
+    return _registry
+
+
+inc = _registry.inc
+gauge = _registry.set
+observe = _registry.observe
+timer = _registry.timer
+
+
+def record_response(api, status, seconds):
+    """Latency plus 429/error counts for one upstream call."""
+    observe("http_request_seconds", seconds, api=api)
+    if status == 429:
+        inc("http_rate_limited_total", api=api)
+    elif status != 200:
+        inc("http_errors_total", api=api)
+
+
+if __name__ == "__main__":
+    import argparse
+    import glob
+
+    parser = argparse.ArgumentParser(description="Show the latest metrics dumps")
+    parser.add_argument("--dir", default=METRICS_DIR)
+    args = parser.parse_args()
+    for path in sorted(glob.glob(os.path.join(args.dir, "*.prom"))):
+        print(f"📈 {path}")
+        with open(path) as f:
+            for line in f:
+                if not line.startswith("#") and "_bucket{" not in line:
+                    print(f"   {line.rstrip()}")
@@ -0,0 +1,348 @@
+# model_server.py
+from __future__ import annotations
+import argparse
+import hashlib
+import math
+import os
+import time
+import numpy as np
+import yaml
+import metrics
+import trace_log
+from lazy_imports import lazy_import
+
+pd = lazy_import("pandas")
+requests = lazy_import("requests")
+
+SERVER_PORT = 8766
+ZERO_THRESHOLD = 1e-35          # LightGBM's kZeroThreshold
+MISSING_NONE, MISSING_ZERO, MISSING_NAN = 0, 1, 2
+
+
+# ----------------------------
+# Array-based tree ensemble
+# ----------------------------
+class TreeEnsemble:
+    """
+    A fitted LightGBM ensemble flattened into NumPy arrays.
+
+    All internal nodes of all trees live in one set of arrays. Children are
+    global node indices (>= 0) or encoded leaves (-leaf - 1). Scoring walks
+    every (row, tree) pair one level per step, so a batch costs about
+    max_depth vectorized steps with no per-call validation.
+    """
+
+    ARRAYS = ("feature", "threshold", "default_left", "missing_type", "left", "right", "roots", "leaf_value")
+
+    def __init__(self, feature, threshold, default_left, missing_type, left, right, roots, leaf_value,
+                 objective="regression", sigmoid=1.0, feature_names=(), source_sha256=""):
+        self.feature = feature
+        self.threshold = threshold
+        self.default_left = default_left
+        self.missing_type = missing_type
+        self.left = left
+        self.right = right
+        self.roots = roots
+        self.leaf_value = leaf_value
+        self.objective = objective
+        self.sigmoid = sigmoid
+        self.feature_names = list(feature_names)
+        self.source_sha256 = source_sha256    # hash of the .pkl this was exported from
+
+    @property
+    def n_trees(self) -> int:
+        return len(self.roots)
+
+    # ---- build ----
+    @classmethod
+    def from_lgbm_text(cls, text: str, num_iteration=None) -> "TreeEnsemble":
+        """Parse LightGBM's text model (Booster.model_to_string())."""
+        header, trees, current = {}, [], None
+        for line in text.splitlines():
+            if line.startswith("Tree="):
+                current = {}
+                trees.append(current)
+            elif line.startswith("end of trees"):
+                break
+            elif "=" in line:
+                key, _, value = line.partition("=")
+                (current if current is not None else header)[key] = value
+
+        objective, *params = header["objective"].split()
+        params = dict(p.split(":", 1) for p in params if ":" in p)
+        if objective not in ("binary", "regression", "regression_l1", "huber", "fair", "quantile"):
+            raise ValueError(f"Unsupported LightGBM objective: {objective}")
+        if "sqrt" in header["objective"].split():
+            raise ValueError("regression with sqrt transform is not supported")
+        if int(header.get("num_tree_per_iteration", 1)) != 1:
+            raise ValueError("Multiclass models are not supported")
+        if num_iteration:
+            trees = trees[:num_iteration]
+
+        feature, threshold, decision, left, right, roots, leaves = [], [], [], [], [], [], []
+        for tree in trees:
+            if int(tree.get("num_cat", 0)):
+                raise ValueError("Categorical splits are not supported")
+            node_base, leaf_base = len(feature), len(leaves)
+            leaves.extend(float(v) for v in tree["leaf_value"].split())
+            if int(tree["num_leaves"]) == 1:
+                roots.append(-leaf_base - 1)
+                continue
+            remap = lambda c: node_base + c if c >= 0 else -(leaf_base + ~c) - 1
+            feature.extend(int(v) for v in tree["split_feature"].split())
+            threshold.extend(float(v) for v in tree["threshold"].split())
+            decision.extend(int(v) for v in tree["decision_type"].split())
+            left.extend(remap(int(v)) for v in tree["left_child"].split())
+            right.extend(remap(int(v)) for v in tree["right_child"].split())
+            roots.append(node_base)
+
+        decision = np.asarray(decision, dtype=np.int8)
+        return cls(
+            np.asarray(feature, dtype=np.int32), np.asarray(threshold, dtype="float64"),
+            (decision & 2) > 0, (decision >> 2) & 3,
+            np.asarray(left, dtype=np.int32), np.asarray(right, dtype=np.int32),
+            np.asarray(roots, dtype=np.int32), np.asarray(leaves, dtype="float64"),
+            objective=objective, sigmoid=float(params.get("sigmoid", 1.0)),
+            feature_names=header.get("feature_names", "").split(),
+        )
+
+    @classmethod
+    def from_model(cls, model) -> "TreeEnsemble":
+        """From a fitted LGBMClassifier / LGBMRegressor (needs lightgbm importable)."""
+        booster = model.booster_
+        best = getattr(model, "best_iteration_", None) or None
+        return cls.from_lgbm_text(booster.model_to_string(num_iteration=best))
+
+    # ---- persistence ----
+    def save(self, path):
+        np.savez(path, objective=self.objective, sigmoid=self.sigmoid, source_sha256=self.source_sha256,
+                 feature_names=np.asarray(self.feature_names), **{k: getattr(self, k) for k in self.ARRAYS})
+
+    @classmethod
+    def load(cls, path) -> "TreeEnsemble":
+        with np.load(path) as z:
+            return cls(*(z[k] for k in cls.ARRAYS), objective=str(z["objective"]),
+                       sigmoid=float(z["sigmoid"]), feature_names=z["feature_names"].tolist(),
+                       source_sha256=str(z["source_sha256"]) if "source_sha256" in z.files else "")
+
+    # ---- scoring ----
+    def raw_score(self, X) -> np.ndarray:
+        X = np.asarray(X, dtype="float64")
+        if X.ndim == 1:
+            X = X[None, :]
+        n_rows, n_cols = X.shape
+        flat_x = np.ascontiguousarray(X).ravel()
+        node = np.tile(self.roots, n_rows)             # (row, tree) flattened
+        pos = np.flatnonzero(node >= 0)                # walks still on an internal node
+        row_base = pos // self.n_trees * n_cols
+        while len(pos):
+            idx = node[pos]
+            x = flat_x[row_base + self.feature[idx]]
+            mt = self.missing_type[idx]
+            nan = np.isnan(x)
+            x = np.where(nan & (mt != MISSING_NAN), 0.0, x)
+            use_default = ((mt == MISSING_ZERO) & (np.abs(x) <= ZERO_THRESHOLD)) | ((mt == MISSING_NAN) & nan)
+            go_left = np.where(use_default, self.default_left[idx], x <= self.threshold[idx])
+            nxt = np.where(go_left, self.left[idx], self.right[idx])
+            node[pos] = nxt
+            keep = nxt >= 0
+            pos, row_base = pos[keep], row_base[keep]
+        return self.leaf_value[-node - 1].reshape(n_rows, self.n_trees).sum(axis=1)
+
+    def predict(self, X) -> np.ndarray:
+        """Probability of class 1 for binary models, the prediction otherwise."""
+        raw = self.raw_score(X)
+        if self.objective == "binary":
+            return 1.0 / (1.0 + np.exp(-self.sigmoid * raw))
+        return raw
+
+
+# ----------------------------
+# Scorer (both models, one batch)
+# ----------------------------
+def _load_ensemble(pkl_path) -> TreeEnsemble:
+    """
+    Use the exported .npz if it was exported from this exact pickle (sha256
+    stored inside it; mtimes don't survive a checkout), else export it now.
+    """
+    npz_path = os.path.splitext(pkl_path)[0] + ".npz"
+    if not os.path.exists(pkl_path):
+        return TreeEnsemble.load(npz_path)
+    with open(pkl_path, "rb") as f:
+        digest = hashlib.sha256(f.read()).hexdigest()
+    if os.path.exists(npz_path):
+        ensemble = TreeEnsemble.load(npz_path)
+        if ensemble.source_sha256 == digest:
+            return ensemble
+    import joblib
+    ensemble = TreeEnsemble.from_model(joblib.load(pkl_path))
+    ensemble.source_sha256 = digest
+    ensemble.save(npz_path)
+    print(f"📦 Exported {pkl_path} -> {npz_path} ({ensemble.n_trees} trees)")
+    return ensemble
+
+
+class Scorer:
+    """Scores every pair in one vectorized call per model."""
+
+    def __init__(self, classifier: TreeEnsemble, regressor: TreeEnsemble, features, prob_threshold=0.5):
+        for name, model in (("classifier", classifier), ("regressor", regressor)):
+            if model.feature_names and list(model.feature_names) != list(features):
+                raise ValueError(f"❌ {name} was trained on {model.feature_names}, config has {list(features)}")
+        self.classifier = classifier
+        self.regressor = regressor
+        self.features = list(features)
+        self.prob_threshold = prob_threshold
+
+    @classmethod
+    def from_config(cls, path="config.yaml"):
+        with open(path, "r") as f:
+            config = yaml.safe_load(f)
+        return cls(_load_ensemble(config["classifier_model"]), _load_ensemble(config["regressor_model"]),
+                   config["features"], config.get("prob_threshold", 0.5))
+
+    def score(self, X) -> dict:
+        X = np.asarray(X, dtype="float64").reshape(-1, len(self.features))
+        with metrics.timer("model_score_seconds"):
+            prob = self.classifier.predict(X)
+            reg = self.regressor.predict(X)
+        metrics.inc("model_score_rows_total", len(X))
+        signal = (prob >= self.prob_threshold).astype(int)
+        return {
+            "clf_prob": prob,
+            "clf_signal": signal,
+            "reg_prediction": reg,
+            "decision": np.where(signal == 1, "BUY", "NO_TRADE"),
+        }
+
+    def score_frame(self, df: pd.DataFrame) -> pd.DataFrame:
+        """Append clf_prob, clf_signal, reg_prediction, decision (predictions.csv columns)."""
+        out = df.assign(**self.score(df[self.features].to_numpy(dtype="float64")))
+        if "trace_id" in out:
+            trace_log.record(out["trace_id"].dropna(), "scored")
+        return out
+
+
+# ----------------------------
+# Warm long-lived service
+# ----------------------------
+def make_app(scorer: Scorer):
+    from aiohttp import web
+
+    async def score(request):
+        body = await request.json()
+        X = np.asarray(body["rows"], dtype="float64").reshape(-1, len(scorer.features))
+        start = time.perf_counter()
+        out = scorer.score(X)
+        return web.json_response({
+            **{k: v.tolist() for k, v in out.items()},
+            "elapsed_ms": (time.perf_counter() - start) * 1000,
+        })
+
+    async def health(request):
+        return web.json_response({"features": scorer.features,
+                                  "trees": [scorer.classifier.n_trees, scorer.regressor.n_trees]})
+
+    app = web.Application(client_max_size=64 * 1024 * 1024)
+    app.router.add_post("/score", score)
+    app.router.add_get("/health", health)
+    return app
+
+
+def score_remote(X, url=f"http://127.0.0.1:{SERVER_PORT}", session=None, timeout=10, trace_ids=None) -> dict:
+    """Score a feature matrix against the running server (rows as NaN-safe JSON)."""
+    rows = [[None if isinstance(v, float) and math.isnan(v) else v for v in row]
+            for row in np.asarray(X, dtype="float64").tolist()]
+    r = (session or requests).post(f"{url}/score", json={"rows": rows}, timeout=timeout)
+    r.raise_for_status()
+    out = r.json()
+    if trace_ids is not None:
+        trace_log.record(trace_ids, "scored")
+    return {
+        "clf_prob": np.asarray(out["clf_prob"], dtype="float64"),
+        "clf_signal": np.asarray(out["clf_signal"], dtype=int),
+        "reg_prediction": np.asarray(out["reg_prediction"], dtype="float64"),
+        "decision": np.asarray(out["decision"]),
+    }
+
+
+def serve(port=SERVER_PORT):
+    from aiohttp import web
+    import control_bus
+
+    metrics.init("Inference")
+    start = time.perf_counter()
+    scorer = Scorer.from_config()
+    print(f"🧠 Models loaded in {time.perf_counter() - start:.2f}s, serving on http://127.0.0.1:{port}")
+
+    async def on_startup(app):
+        control_bus.default_bus().mark_ready("Inference")
+
+    app = make_app(scorer)
+    app.on_startup.append(on_startup)
+    web.run_app(app, host="127.0.0.1", port=port, print=None)
+
+
+# ----------------------------
+# Benchmark
+# ----------------------------
+def _bench(n_pairs, cycles):
+    with open("config.yaml", "r") as f:
+        config = yaml.safe_load(f)
+    rng = np.random.default_rng(0)
+    X = rng.lognormal(-5, 2, size=(n_pairs, len(config["features"])))
+    X[:, config["features"].index("return")] = rng.normal(0, 0.02, n_pairs)
+
+    def timed(fn):
+        fn()
+        start = time.perf_counter()
+        for _ in range(cycles):
+            fn()
+        return (time.perf_counter() - start) / cycles * 1000
+
+    start = time.perf_counter()
+    scorer = Scorer.from_config()
+    print(f"📊 load exported arrays: {(time.perf_counter() - start) * 1000:.1f} ms")
+    print(f"📊 array evaluator: {timed(lambda: scorer.score(X)):.2f} ms/cycle ({n_pairs} pairs)")
+
+    try:
+        import joblib
+        start = time.perf_counter()
+        clf = joblib.load(config["classifier_model"])
+        reg = joblib.load(config["regressor_model"])
+        print(f"📊 unpickle models: {(time.perf_counter() - start) * 1000:.1f} ms")
+    except (ImportError, FileNotFoundError) as e:
+        print(f"⚠️ Skipping predict_proba baseline ({e})")
+        return
+    frame = pd.DataFrame(X, columns=config["features"])
+
+    def per_pair():
+        for i in range(n_pairs):
+            row = frame.iloc[[i]]
+            clf.predict_proba(row)
+            reg.predict(row)
+
+    print(f"📊 predict_proba batch: {timed(lambda: (clf.predict_proba(frame), reg.predict(frame))):.2f} ms/cycle")
+    print(f"📊 predict_proba per pair: {timed(per_pair):.2f} ms/cycle")
+    diff = np.abs(scorer.score(X)["clf_prob"] - clf.predict_proba(frame)[:, 1]).max()
+    print(f"📊 max |Δprob| vs sklearn: {diff:.2e}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Batched inference for the classifier/regressor pair")
+    parser.add_argument("--export", action="store_true", help="export the .pkl models to array .npz files")
+    parser.add_argument("--serve", action="store_true", help="keep the models warm behind a local HTTP API")
+    parser.add_argument("--bench", action="store_true", help="compare latency against predict_proba")
+    parser.add_argument("--port", type=int, default=SERVER_PORT)
+    parser.add_argument("--pairs", type=int, default=500)
+    parser.add_argument("--cycles", type=int, default=20)
+    args = parser.parse_args()
+
+    if args.export:
+        Scorer.from_config()
+    elif args.serve:
+        serve(args.port)
+    elif args.bench:
+        _bench(args.pairs, args.cycles)
+    else:
+        parser.print_help()
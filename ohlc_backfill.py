@@ -0,0 +1,184 @@
+# ohlc_backfill.py
+import argparse
+import asyncio
+import csv
+import datetime
+import os
+import time
+from candle_store import CandleStore
+from gecko_fetcher import GeckoFetcher, candles_to_df
+from rate_limit import backoff_delay
+
+JOURNAL_FILE = "backfill_journal.csv"
+JOURNAL_COLUMNS = ["pair_id", "interval", "anchor", "page", "before", "oldest", "status", "candles", "attempts", "updated"]
+INTERVAL_SECONDS = {"minute": 60, "hour": 3600, "day": 86400}
+PAGE_RETRIES = 3        # extra rounds on top of GeckoFetcher's own per-request retries
+FINISHED = ("done", "end")
+
+
+# ----------------------------
+# Journal
+# ----------------------------
+class BackfillJournal:
+    """
+    Append-only log of page outcomes: one line per (pair, interval, page)
+    attempt, last line wins. Status is "done" (full page written), "end"
+    (short or empty page: no older history) or "failed" (retries exhausted,
+    fetched again on the next pass). The anchor is the before_timestamp of
+    page 1, fixed on the first run. Every later page starts right before the
+    oldest candle the previous page returned ("oldest", journaled as the
+    cursor), so pages are `limit` candles each even for pairs that skip
+    minutes with no trades, and page N covers the same candles after a
+    restart even though "now" has moved.
+    """
+
+    def __init__(self, path=JOURNAL_FILE):
+        self.path = path
+        self.pages = {}     # (pair_id, interval) -> {page: row}
+        self.anchors = {}   # (pair_id, interval) -> epoch seconds
+        if os.path.exists(path) and os.path.getsize(path) > 0:
+            with open(path, newline="") as f:
+                for row in csv.DictReader(f):
+                    key = (row["pair_id"], row["interval"])
+                    self.anchors.setdefault(key, int(row["anchor"]))
+                    self.pages.setdefault(key, {})[int(row["page"])] = row
+
+    def anchor(self, pair_id, interval, now=None) -> int:
+        key = (pair_id, interval)
+        if key not in self.anchors:
+            step = INTERVAL_SECONDS[interval]
+            now = int(now if now is not None else time.time())
+            self.anchors[key] = now // step * step + step    # include the current (open) candle
+        return self.anchors[key]
+
+    def cursor(self, pair_id, interval, page):
+        """before_timestamp for `page`: the anchor, then the oldest candle of the page before it."""
+        if page == 1:
+            return self.anchor(pair_id, interval)
+        prev = self.pages.get((pair_id, interval), {}).get(page - 1, {})
+        return int(prev["oldest"]) if prev.get("status") == "done" and prev.get("oldest") else None
+
+    def record(self, pair_id, interval, page, status, candles=0, attempts=1, before=None, oldest=None):
+        row = {
+            "pair_id": pair_id, "interval": interval, "anchor": self.anchor(pair_id, interval),
+            "page": page, "before": "" if before is None else before, "oldest": "" if oldest is None else oldest,
+            "status": status, "candles": candles, "attempts": attempts,
+            "updated": datetime.datetime.now(datetime.UTC).isoformat(),
+        }
+        new_file = not os.path.exists(self.path) or os.path.getsize(self.path) == 0
+        with open(self.path, "a", newline="") as f:
+            writer = csv.DictWriter(f, fieldnames=JOURNAL_COLUMNS)
+            if new_file:
+                writer.writeheader()
+            writer.writerow(row)
+        self.pages.setdefault((pair_id, interval), {})[page] = row
+
+    def pending(self, pair_id, interval, pages) -> list:
+        """Pages not yet finished, up to `pages` or the recorded end of history."""
+        seen = self.pages.get((pair_id, interval), {})
+        ends = [p for p, row in seen.items() if row["status"] == "end"]
+        last = min(ends + [pages])
+        return [p for p in range(1, last + 1) if seen.get(p, {}).get("status") not in FINISHED]
+
+    def complete(self, pair_id, interval, pages) -> bool:
+        return not self.pending(pair_id, interval, pages)
+
+    def candles(self, pair_id, interval) -> int:
+        return sum(int(row["candles"]) for row in self.pages.get((pair_id, interval), {}).values()
+                   if row["status"] in FINISHED)
+
+    def reset(self):
+        self.pages, self.anchors = {}, {}
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+
+# ----------------------------
+# Engine
+# ----------------------------
+class Backfill:
+    """
+    Page-level history bootstrap into the CandleStore.
+
+    Pairs run concurrently on one GeckoFetcher (shared token bucket and
+    session); a pair walks its pages newest first until history ends. Each page
+    is appended to the store and then journaled, so at most one page per
+    pair is in memory and a crash re-fetches at most the pages in flight
+    (the store drops the duplicates). A page that still fails after
+    PAGE_RETRIES rounds is journaled "failed" and the pair stops there: the
+    pages after it are addressed from its oldest candle, so the next pass
+    resumes at the failed page.
+    """
+
+    def __init__(self, store: CandleStore, journal: BackfillJournal = None, fetcher: GeckoFetcher = None,
+                 page_retries=PAGE_RETRIES):
+        self.store = store
+        self.journal = journal or BackfillJournal()
+        self.fetcher = fetcher or GeckoFetcher()
+        self.page_retries = page_retries
+
+    async def _page(self, session, pair_id, interval, before, limit):
+        for attempt in range(1, self.page_retries + 1):
+            candles = await self.fetcher.fetch_candles(session, pair_id, interval, limit=limit,
+                                                       before_timestamp=before)
+            if candles is not None:
+                return candles, attempt
+            await asyncio.sleep(backoff_delay(attempt, base=2.0))
+        return None, self.page_retries
+
+    async def _pair(self, session, pair_id, interval, pages, limit) -> dict:
+        for page in self.journal.pending(pair_id, interval, pages):
+            before = self.journal.cursor(pair_id, interval, page)
+            if before is None:          # a page before this one is unfinished
+                break
+            candles, attempts = await self._page(session, pair_id, interval, before, limit)
+            if candles is None:
+                print(f"❌ {pair_id} page {page} failed after {attempts} rounds, will retry")
+                self.journal.record(pair_id, interval, page, "failed", attempts=attempts, before=before)
+                break
+            written = self.store.append(candles_to_df(pair_id, candles)) if candles else []
+            status = "done" if len(candles) >= limit else "end"
+            oldest = min(c[0] for c in candles) if candles else None
+            self.journal.record(pair_id, interval, page, status, len(written), attempts, before, oldest)
+            if status == "end":
+                break
+        complete = self.journal.complete(pair_id, interval, pages)
+        candles = self.journal.candles(pair_id, interval)
+        print(f"{'✅' if complete else '⚠️'} {pair_id}: {candles} candles"
+              + ("" if complete else f", {len(self.journal.pending(pair_id, interval, pages))} pages pending"))
+        return {"pair_id": pair_id, "complete": complete, "candles": candles}
+
+    async def run_async(self, pair_ids, interval="minute", pages=10, limit=200) -> list:
+        pair_ids = list(dict.fromkeys(pair_ids))
+        for pair_id in pair_ids:
+            self.journal.anchor(pair_id, interval)
+        todo = [p for p in pair_ids if not self.journal.complete(p, interval, pages)]
+        print(f"🧾 Backfill: {len(pair_ids) - len(todo)} pairs already complete, {len(todo)} to fetch")
+
+        async def one(session, pair_id):
+            return await self._pair(session, pair_id, interval, pages, limit)
+
+        done = [{"pair_id": p, "complete": True, "candles": self.journal.candles(p, interval)}
+                for p in pair_ids if p not in todo]
+        return done + (await self.fetcher._gather(one, todo) if todo else [])
+
+    def run(self, pair_ids, interval="minute", pages=10, limit=200) -> list:
+        """Blocking entry point. Returns [{pair_id, complete, candles}] for every pair."""
+        return asyncio.run(self.run_async(pair_ids, interval, pages, limit))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Show or reset the OHLC backfill journal")
+    parser.add_argument("--journal", default=JOURNAL_FILE)
+    parser.add_argument("--reset", action="store_true")
+    args = parser.parse_args()
+
+    journal = BackfillJournal(args.journal)
+    if args.reset:
+        journal.reset()
+        print(f"🧹 Removed {args.journal}")
+    for (pair_id, interval), pages in sorted(journal.pages.items()):
+        statuses = [row["status"] for _, row in sorted(pages.items())]
+        print(f"🧾 {pair_id} [{interval}]: {journal.candles(pair_id, interval)} candles, "
+              f"{statuses.count('done')} done, {statuses.count('failed')} failed"
+              + (", history ended" if "end" in statuses else ""))
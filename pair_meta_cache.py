@@ -0,0 +1,148 @@
+# pair_meta_cache.py
+import json
+import sqlite3
+import threading
+import time
+
+CACHE_DB = "pair_meta.db"
+MAX_KEYS = 5000
+
+# Per-field freshness (seconds). Anything not listed uses DEFAULT_TTL.
+FIELD_TTLS = {
+    "best_pair": 30 * 60,           # token name -> best Dexscreener pair
+    "pair_id": 24 * 3600,           # contract -> pair address
+    "contract": 24 * 3600,          # pair -> contract
+    "jupiter_tradable": 6 * 3600,
+    "liquidity_usd": 5 * 60,
+    "market_cap": 5 * 60,
+    "price_usd": 30,
+    "tracked": 365 * 24 * 3600,     # contract is in the current filtered_contracts.csv
+}
+MISS_TTL = 5 * 60                   # cached "not found" answers expire sooner
+DEFAULT_TTL = 10 * 60
+
+
+class PairMetaCache:
+    """
+    Local metadata cache shared by get-pairs, check-price and allocation_manager.
+
+    Keys are namespaced strings ("token:<name>", "contract:<mint>", "pair:<address>"),
+    each holding independent fields with their own TTL. Values are JSON.
+    Least-recently used keys are evicted once more than `max_keys` are stored.
+    """
+
+    def __init__(self, path=CACHE_DB, max_keys=MAX_KEYS, ttls=None):
+        self.path = path
+        self.max_keys = max_keys
+        self.ttls = dict(FIELD_TTLS, **(ttls or {}))
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS meta (
+                key TEXT NOT NULL,
+                field TEXT NOT NULL,
+                value TEXT,
+                updated REAL NOT NULL,
+                PRIMARY KEY (key, field)
+            )""")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS lru (key TEXT PRIMARY KEY, accessed REAL NOT NULL)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS lru_accessed ON lru (accessed)")
+
+    def ttl(self, field, value=None) -> float:
+        if value is None:
+            return min(MISS_TTL, self.ttls.get(field, DEFAULT_TTL))
+        return self.ttls.get(field, DEFAULT_TTL)
+
+    # ---- reads ----
+    def get_many(self, keys, field):
+        """
+        Batch lookup of one field for many keys.
+        Returns (fresh, stale): fresh maps key -> value, stale lists keys to refetch.
+        """
+        keys = list(dict.fromkeys(keys))
+        if not keys:
+            return {}, []
+        now = time.time()
+        fresh = {}
+        with self._lock:
+            for i in range(0, len(keys), 500):
+                chunk = keys[i:i + 500]
+                marks = ",".join("?" * len(chunk))
+                rows = self._conn.execute(
+                    f"SELECT key, value, updated FROM meta WHERE field=? AND key IN ({marks})", [field, *chunk]
+                ).fetchall()
+                for key, raw, updated in rows:
+                    value = json.loads(raw)
+                    if now - updated < self.ttl(field, value):
+                        fresh[key] = value
+            if fresh:
+                self._conn.executemany("INSERT OR REPLACE INTO lru VALUES (?, ?)", [(k, now) for k in fresh])
+        return fresh, [k for k in keys if k not in fresh]
+
+    def get(self, key, field, default=None):
+        fresh, _ = self.get_many([key], field)
+        return fresh.get(key, default)
+
+    # ---- writes ----
+    def put_many(self, items, field):
+        """items: {key: value}. None is stored as a short-lived miss."""
+        if not items:
+            return
+        now = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN")
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO meta VALUES (?, ?, ?, ?)",
+                [(k, field, json.dumps(v), now) for k, v in items.items()],
+            )
+            self._conn.executemany("INSERT OR REPLACE INTO lru VALUES (?, ?)", [(k, now) for k in items])
+            self._conn.execute("COMMIT")
+            self._evict()
+
+    def put(self, key, field, value):
+        self.put_many({key: value}, field)
+
+    def put_fields(self, key, **fields):
+        for field, value in fields.items():
+            self.put_many({key: value}, field)
+
+    def _evict(self):
+        (n,) = self._conn.execute("SELECT COUNT(*) FROM lru").fetchone()
+        excess = n - self.max_keys
+        if excess <= 0:
+            return
+        victims = [k for (k,) in self._conn.execute(
+            "SELECT key FROM lru WHERE key NOT IN (SELECT key FROM meta WHERE field='tracked') "
+            "ORDER BY accessed LIMIT ?", (excess,))]
+        if not victims:
+            return
+        marks = ",".join("?" * len(victims))
+        self._conn.execute(f"DELETE FROM meta WHERE key IN ({marks})", victims)
+        self._conn.execute(f"DELETE FROM lru WHERE key IN ({marks})", victims)
+
+    # ---- tracked contract set ----
+    def set_tracked(self, contracts):
+        """Replace the tracked contract set (mirrors filtered_contracts.csv)."""
+        with self._lock:
+            self._conn.execute("DELETE FROM meta WHERE field='tracked'")
+        self.put_many({f"contract:{c}": True for c in contracts}, "tracked")
+
+    def tracked_count(self) -> int:
+        with self._lock:
+            (n,) = self._conn.execute("SELECT COUNT(*) FROM meta WHERE field='tracked'").fetchone()
+        return n
+
+    def close(self):
+        self._conn.close()
+
+
+_default_cache = None
+
+
+def default_cache() -> PairMetaCache:
+    global _default_cache
+    if _default_cache is None:
+        _default_cache = PairMetaCache()
+    return _default_cache
@@ -0,0 +1,256 @@
+# portfolio_ledger.py
+import csv
+import datetime
+import io
+import json
+import os
+
+try:
+    import fcntl
+except ImportError:  # Windows: single-writer assumption, no cross-process lock
+    fcntl = None
+
+LEDGER_FILE = "portfolio_ledger.csv"
+SNAPSHOT_FILE = "portfolio_state.json"
+SIM_PORTFOLIO = "sim_portfolio.csv"
+SIM_TOKEN_LOG = "sim_token_log.csv"
+
+LEDGER_COLUMNS = ["seq", "timestamp", "event", "asset", "amount", "price", "value_usd"]
+TOTAL = "TOTAL"
+
+
+def _now() -> str:
+    return datetime.datetime.now(datetime.UTC).isoformat()
+
+
+def _float(value):
+    return None if value in (None, "") else float(value)
+
+
+class PortfolioLedger:
+    """
+    Append-only portfolio event log with materialized latest-state views.
+
+    Events: `value` (total portfolio USD), `balance` (one asset's amount,
+    price and USD value) and `contracts` (tracked contract count). Each
+    append updates the in-memory view in O(1) and rewrites the small
+    snapshot (portfolio_state.json), which records the ledger byte offset it
+    covers. Readers therefore load the snapshot and only replay bytes
+    appended after it.
+
+    sim_portfolio.csv and sim_token_log.csv are still appended to as
+    exports. Rows that other writers append to them directly are imported
+    as events on the next read, by tailing from the last known offset.
+    Our own export writes are recorded as byte ranges and skipped there, so
+    an external row landing between the import and our write is not lost.
+    """
+
+    def __init__(self, path=LEDGER_FILE, snapshot_file=SNAPSHOT_FILE,
+                 portfolio_csv=SIM_PORTFOLIO, token_log_csv=SIM_TOKEN_LOG, export=True):
+        self.path = path
+        self.snapshot_file = snapshot_file
+        self.portfolio_csv = portfolio_csv
+        self.token_log_csv = token_log_csv
+        self.export = export
+        self._load_snapshot()
+        self.refresh()
+
+    @staticmethod
+    def _empty_state() -> dict:
+        return {"seq": 0, "offset": 0, "exports": {}, "own": {}, "total": None, "assets": {}, "contracts": None}
+
+    # ---- replay ----
+    def _load_snapshot(self):
+        self.state = self._empty_state()
+        try:
+            with open(self.snapshot_file, "r") as f:
+                self.state.update(json.load(f))
+        except (OSError, ValueError):
+            pass
+
+    def _save_snapshot(self):
+        tmp = f"{self.snapshot_file}.tmp"
+        with open(tmp, "w") as f:
+            json.dump(self.state, f)
+        os.replace(tmp, self.snapshot_file)
+
+    def _apply(self, row: dict):
+        event = row["event"]
+        if event == "value":
+            self.state["total"] = {"value_usd": _float(row["value_usd"]), "timestamp": row["timestamp"]}
+        elif event == "balance":
+            self.state["assets"][row["asset"]] = {
+                "amount": _float(row["amount"]), "price": _float(row["price"]),
+                "value_usd": _float(row["value_usd"]), "timestamp": row["timestamp"],
+            }
+        elif event == "contracts":
+            self.state["contracts"] = int(float(row["amount"]))
+        self.state["seq"] = int(row["seq"])
+
+    def _replay(self) -> int:
+        """Apply ledger lines appended since our state's offset."""
+        size = os.path.getsize(self.path) if os.path.exists(self.path) else 0
+        if size < self.state["offset"]:           # ledger was removed: start over
+            self.state = self._empty_state()
+        if size == self.state["offset"]:
+            return 0
+        with open(self.path, "rb") as f:
+            f.seek(self.state["offset"])
+            chunk = f.read(size - self.state["offset"])
+        end = chunk.rfind(b"\n") + 1              # never apply a half-written line
+        lines = chunk[:end].decode("utf-8").splitlines()
+        if self.state["offset"] == 0 and lines and lines[0].startswith("seq,"):
+            lines = lines[1:]
+        rows = list(csv.DictReader(io.StringIO("\n".join(lines)), fieldnames=LEDGER_COLUMNS))
+        for row in rows:
+            self._apply(row)
+        self.state["offset"] += end
+        return len(rows)
+
+    def _tail_csv(self, path):
+        """Rows appended to an export CSV since its recorded offset, and the new offset."""
+        offset = self.state["exports"].get(path, 0)
+        own = self.state["own"].get(path, [])
+        size = os.path.getsize(path) if os.path.exists(path) else 0
+        if size < offset:                          # truncated or replaced: read it again
+            offset, own = 0, []
+        if size == offset:
+            return [], offset
+        with open(path, "rb") as f:
+            header = f.readline().decode("utf-8").strip()
+            f.seek(max(offset, f.tell()))
+            start = f.tell()
+            chunk = f.read(size - start)
+        end = chunk.rfind(b"\n") + 1
+        # drop the rows we exported ourselves (they are already in the ledger), keep everyone else's
+        external, pos = [], start
+        for lo, hi in sorted(own):
+            if lo >= start and hi <= start + end:
+                external.append(chunk[pos - start:lo - start])
+                pos = hi
+        external.append(chunk[pos - start:end])
+        self.state["own"][path] = [[lo, hi] for lo, hi in own if hi > start + end]
+        text = b"".join(external).decode("utf-8")
+        rows = list(csv.DictReader(io.StringIO(f"{header}\n{text}")))
+        return rows, start + end
+
+    def _external_events(self) -> list:
+        """Rows written straight to sim_portfolio.csv / sim_token_log.csv by other modules."""
+        events = []
+        rows, self.state["exports"][self.portfolio_csv] = self._tail_csv(self.portfolio_csv)
+        events += [(r["Timestamp"], "value", TOTAL, "", "", r["TOTAL_VALUE_USD"]) for r in rows]
+        rows, self.state["exports"][self.token_log_csv] = self._tail_csv(self.token_log_csv)
+        events += [(r["Timestamp"], "balance", r["Contract"], r["Amount"], r["Price"], r["USD_Value"]) for r in rows]
+        return sorted(events, key=lambda e: e[0])
+
+    def _exports_changed(self) -> bool:
+        for path in (self.portfolio_csv, self.token_log_csv):
+            size = os.path.getsize(path) if os.path.exists(path) else 0
+            if size != self.state["exports"].get(path, 0):
+                return True
+        return False
+
+    def refresh(self) -> int:
+        """Catch up with other writers; returns how many events were applied."""
+        n = self._replay()
+        if self._exports_changed():
+            n += self._append([])
+        return n
+
+    # ---- writes ----
+    def _append(self, events, export=None) -> int:
+        lock = open(f"{self.path}.lock", "a")
+        try:
+            if fcntl:
+                fcntl.flock(lock, fcntl.LOCK_EX)
+            # the snapshot on disk is always written under this lock, so it is the latest state
+            self._load_snapshot()
+            self._replay()
+            external = self._external_events()
+            new_file = not os.path.exists(self.path) or os.path.getsize(self.path) == 0
+            rows = []
+            for ts, event, asset, amount, price, value_usd in external + list(events):
+                rows.append({"seq": self.state["seq"] + 1, "timestamp": ts, "event": event, "asset": asset,
+                             "amount": amount, "price": price, "value_usd": value_usd})
+                self._apply(rows[-1])
+            if rows:
+                with open(self.path, "a", newline="") as f:
+                    writer = csv.DictWriter(f, fieldnames=LEDGER_COLUMNS)
+                    if new_file:
+                        writer.writeheader()
+                    writer.writerows(rows)
+                self.state["offset"] = os.path.getsize(self.path)
+            if self.export if export is None else export:
+                self._export(rows[len(external):])
+            self._save_snapshot()
+        finally:
+            if fcntl:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+            lock.close()
+        return len(rows)
+
+    def _export(self, rows):
+        for path, header, event, fmt in (
+            (self.portfolio_csv, ["Timestamp", "TOTAL_VALUE_USD"], "value",
+             lambda r: [r["timestamp"], r["value_usd"]]),
+            (self.token_log_csv, ["Timestamp", "Contract", "Amount", "Price", "USD_Value"], "balance",
+             lambda r: [r["timestamp"], r["asset"], r["amount"], r["price"], r["value_usd"]]),
+        ):
+            selected = [fmt(r) for r in rows if r["event"] == event]
+            if not selected:
+                continue
+            new_file = not os.path.exists(path) or os.path.getsize(path) == 0
+            buf = io.StringIO()
+            writer = csv.writer(buf)
+            if new_file:
+                writer.writerow(header)
+            writer.writerows(selected)
+            data = buf.getvalue().encode("utf-8")
+            with open(path, "ab") as f:
+                f.write(data)                            # one append, so the range below is ours alone
+                end = f.tell()
+            # our own rows are already in the ledger: skip them, but not rows other writers
+            # appended since _external_events read up to the recorded offset
+            if end - len(data) == self.state["exports"].get(path, 0) or new_file:
+                self.state["exports"][path] = end
+            else:
+                self.state["own"].setdefault(path, []).append([end - len(data), end])
+
+    def record_value(self, total_usd, timestamp=None):
+        self._append([(timestamp or _now(), "value", TOTAL, "", "", float(total_usd))])
+
+    def record_balance(self, asset, amount, price, value_usd=None, timestamp=None):
+        value_usd = float(amount) * float(price) if value_usd is None else float(value_usd)
+        self._append([(timestamp or _now(), "balance", asset, float(amount), float(price), value_usd)])
+
+    def record_contracts(self, count, timestamp=None):
+        self._append([(timestamp or _now(), "contracts", "", int(count), "", "")])
+
+    # ---- views ----
+    def total_value(self):
+        self.refresh()
+        total = self.state["total"]
+        return total["value_usd"] if total else None
+
+    def balance(self, asset):
+        """Latest {amount, price, value_usd, timestamp} for an asset, or None."""
+        self.refresh()
+        return self.state["assets"].get(asset)
+
+    def balances(self) -> dict:
+        self.refresh()
+        return dict(self.state["assets"])
+
+    def contract_count(self):
+        self.refresh()
+        return self.state["contracts"]
+
+
+_default_ledger = None
+
+
+def default_ledger() -> PortfolioLedger:
+    global _default_ledger
+    if _default_ledger is None:
+        _default_ledger = PortfolioLedger()
+    return _default_ledger
@@ -0,0 +1,452 @@
+# price_feed.py
+import argparse
+import asyncio
+import collections
+import json
+import os
+import random
+import time
+import metrics
+from lazy_imports import lazy_import
+from rate_limit import TokenBucket, backoff_delay
+
+aiohttp = lazy_import("aiohttp")
+pd = lazy_import("pandas")
+requests = lazy_import("requests")
+
+DEXSCREENER_BASE_URL = "https://api.dexscreener.com/latest/dex"
+DEXSCREENER_PER_MINUTE = 300     # shared quota for tokens/trades endpoints
+TOKENS_PER_REQUEST = 30          # /tokens accepts up to 30 comma-separated addresses
+POLL_INTERVAL = 10
+RING_SIZE = 500                  # recent trades kept per contract
+IDLE_POLLS = 30                  # drop an on-demand subscription nobody has read for this many polls
+FEED_PORT = 8767
+STUB_PORT = 8768
+CONTRACTS_FILE = "filtered_contracts.csv"
+
+
+def trade_key(trade: dict) -> tuple:
+    """Identity of a trade across overlapping polls (tx hash when the API gives one)."""
+    tx = trade.get("txnHash") or trade.get("txHash") or trade.get("signature")
+    if tx:
+        return (tx, trade.get("logIndex"), trade.get("maker"))
+    return (trade.get("blockTimestamp") or trade.get("timestamp"), trade.get("maker"),
+            trade.get("type"), trade.get("amount"), trade.get("priceUsd"))
+
+
+class ContractFeed:
+    """Latest price plus a ring buffer of deduped trades for one contract."""
+
+    def __init__(self, contract, ring_size=RING_SIZE):
+        self.contract = contract
+        self.trades = collections.deque(maxlen=ring_size)   # newest first
+        self._seen = collections.OrderedDict()
+        self._seen_limit = ring_size * 4
+        self.price = None
+        self.pair = {}
+        self.updated = None
+        self.upstream_polls = 0
+        self.pinned = False      # subscribed explicitly; on-demand feeds expire when unread
+        self.idle_polls = 0      # polls since a consumer last read this feed
+
+    def add_trades(self, trades: list) -> int:
+        """Merge one poll (newest first); returns how many trades were new."""
+        fresh = []
+        for trade in trades:
+            key = trade_key(trade)
+            if key in self._seen:
+                continue
+            self._seen[key] = None
+            fresh.append(trade)
+        while len(self._seen) > self._seen_limit:
+            self._seen.popitem(last=False)
+        self.trades.extendleft(reversed(fresh))
+        if fresh and self.price is None and fresh[0].get("priceUsd") is not None:
+            self.price = fresh[0]["priceUsd"]
+        self.updated = time.time()
+        return len(fresh)
+
+    def set_pair(self, pair: dict):
+        self.pair = {
+            "pair_id": pair.get("pairAddress"),
+            "symbol": pair.get("baseToken", {}).get("symbol"),
+            "liquidity_usd": float(pair.get("liquidity", {}).get("usd", 0) or 0),
+        }
+        self.price = pair.get("priceUsd", self.price)
+        self.updated = time.time()
+
+    def snapshot(self) -> dict:
+        return {"contract": self.contract, "price_usd": self.price, **self.pair,
+                "updated": self.updated, "trades": len(self.trades)}
+
+
+class PriceFeed:
+    """
+    One upstream subscription per tracked contract, shared by every consumer.
+
+    Each poll cycle fetches prices for all contracts in batches of
+    TOKENS_PER_REQUEST, plus one trades request per contract, through one
+    pooled session and a token bucket. Consumers read from memory (or from
+    the local API), so N consumers watching M tokens cost M upstream
+    requests per cycle instead of N x M.
+    """
+
+    def __init__(self, base_url=DEXSCREENER_BASE_URL, rate_per_minute=DEXSCREENER_PER_MINUTE,
+                 poll_interval=POLL_INTERVAL, ring_size=RING_SIZE, retries=3, timeout=10, cache=None,
+                 idle_polls=IDLE_POLLS):
+        self.base_url = base_url.rstrip("/")
+        self.limiter = TokenBucket(rate_per_minute, per=60.0)
+        self.poll_interval = poll_interval
+        self.ring_size = ring_size
+        self.retries = retries
+        self.timeout = aiohttp.ClientTimeout(total=timeout)
+        self.cache = cache
+        self.idle_polls = idle_polls
+        self.feeds = {}
+        self.upstream_requests = 0
+        self._wake = None
+
+    # ---- subscriptions ----
+    def subscribe(self, contracts, pinned=True) -> list:
+        """
+        Start polling `contracts`. Pinned subscriptions stay until unsubscribe();
+        on-demand ones (a local API read of an unknown contract) are dropped
+        after `idle_polls` polls without a reader.
+        """
+        added = [c for c in contracts if c and c not in self.feeds]
+        for c in added:
+            self.feeds[c] = ContractFeed(c, self.ring_size)
+        for c in contracts:
+            if c in self.feeds:
+                self.feeds[c].pinned |= pinned
+                self.feeds[c].idle_polls = 0
+        if added and self._wake is not None:
+            self._wake.set()                   # poll new contracts now instead of next cycle
+        return added
+
+    def unsubscribe(self, contracts):
+        for c in contracts:
+            self.feeds.pop(c, None)
+
+    def expire_idle(self) -> list:
+        """Drop on-demand subscriptions nobody has read for `idle_polls` polls."""
+        idle = [c for c, f in self.feeds.items() if not f.pinned and f.idle_polls >= self.idle_polls]
+        self.unsubscribe(idle)
+        if idle:
+            print(f"🧹 Dropped {len(idle)} idle price subscriptions")
+        return idle
+
+    def price(self, contract):
+        feed = self.feeds.get(contract)
+        return feed.price if feed else None
+
+    def trades(self, contract, limit=None) -> list:
+        feed = self.feeds.get(contract)
+        if feed is None:
+            return []
+        return list(feed.trades)[:limit]
+
+    # ---- upstream ----
+    async def _get(self, session, path):
+        for attempt in range(self.retries):
+            await self.limiter.acquire_async()
+            self.upstream_requests += 1
+            api = f"dexscreener_{path.split('/')[0]}"
+            start = time.perf_counter()
+            try:
+                async with session.get(f"{self.base_url}/{path}") as res:
+                    metrics.record_response(api, res.status, time.perf_counter() - start)
+                    if res.status == 429:
+                        wait = backoff_delay(attempt, base=2.0)
+                        self.limiter.penalize(wait)
+                        print(f"⚠️ Rate limit hit on {path.split('/')[0]}, backing off {wait:.1f}s...")
+                        await asyncio.sleep(wait)
+                        continue
+                    if res.status != 200:
+                        print(f"⚠️ API error {res.status} for {path}")
+                        return None
+                    return await res.json(content_type=None)
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                metrics.inc("http_errors_total", api=api)
+                print(f"❌ Error fetching {path}: {e}")
+                await asyncio.sleep(backoff_delay(attempt))
+        return None
+
+    async def _poll_prices(self, session, contracts):
+        data = await self._get(session, f"tokens/{','.join(contracts)}")
+        best = {}
+        for pair in (data or {}).get("pairs") or []:
+            token = pair.get("baseToken", {}).get("address")
+            liq = float(pair.get("liquidity", {}).get("usd", 0) or 0)
+            if token in self.feeds and liq >= best.get(token, (-1, None))[0]:
+                best[token] = (liq, pair)
+        for token, (_, pair) in best.items():
+            feed = self.feeds[token]
+            feed.set_pair(pair)
+            if self.cache is not None:
+                self.cache.put_fields(f"contract:{token}", price_usd=feed.price,
+                                      pair_id=feed.pair["pair_id"], liquidity_usd=feed.pair["liquidity_usd"])
+
+    async def _poll_trades(self, session, contract):
+        data = await self._get(session, f"trades/solana/{contract}")
+        feed = self.feeds.get(contract)
+        if data is not None and feed is not None:
+            feed.upstream_polls += 1
+            feed.add_trades(data.get("trades", []))
+
+    async def poll_once(self, session):
+        self.expire_idle()
+        for feed in self.feeds.values():
+            feed.idle_polls += 1
+        contracts = list(self.feeds)
+        batches = [contracts[i:i + TOKENS_PER_REQUEST] for i in range(0, len(contracts), TOKENS_PER_REQUEST)]
+        await asyncio.gather(*(self._poll_prices(session, b) for b in batches),
+                             *(self._poll_trades(session, c) for c in contracts))
+
+    async def run(self, stop: asyncio.Event = None):
+        self._wake = asyncio.Event()
+        stop = stop or asyncio.Event()
+        async with aiohttp.ClientSession(timeout=self.timeout) as session:
+            while not stop.is_set():
+                self._wake.clear()
+                if self.feeds:
+                    await self.poll_once(session)
+                try:
+                    await asyncio.wait_for(self._wake.wait(), timeout=self.poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+
+
+# ----------------------------
+# Local API
+# ----------------------------
+def make_app(feed: PriceFeed):
+    from aiohttp import web
+
+    def contracts_param(request):
+        return [c for c in request.query.get("contracts", "").split(",") if c]
+
+    # reads subscribe on demand and keep the subscription alive; see PriceFeed.expire_idle
+    async def price(request):
+        contract = request.match_info["contract"]
+        feed.subscribe([contract], pinned=False)
+        return web.json_response(feed.feeds[contract].snapshot())
+
+    async def prices(request):
+        named = contracts_param(request)
+        feed.subscribe(named, pinned=False)
+        contracts = named or list(feed.feeds)
+        return web.json_response({c: feed.feeds[c].snapshot() for c in contracts})
+
+    async def trades(request):
+        contract = request.match_info["contract"]
+        feed.subscribe([contract], pinned=False)
+        limit = int(request.query.get("limit", 50))
+        return web.json_response({"contract": contract, "trades": feed.trades(contract, limit)})
+
+    async def subscribe(request):
+        body = await request.json()
+        return web.json_response({"added": feed.subscribe(body.get("contracts", []))})
+
+    async def health(request):
+        return web.json_response({"contracts": len(feed.feeds), "upstream_requests": feed.upstream_requests})
+
+    app = web.Application()
+    app.router.add_get("/price/{contract}", price)
+    app.router.add_get("/prices", prices)
+    app.router.add_get("/trades/{contract}", trades)
+    app.router.add_post("/subscribe", subscribe)
+    app.router.add_get("/health", health)
+    return app
+
+
+def get_price(contract, url=f"http://127.0.0.1:{FEED_PORT}", timeout=2):
+    """Latest price from the running feed, or None if it is down or has no price yet."""
+    try:
+        r = requests.get(f"{url}/price/{contract}", timeout=timeout)
+        r.raise_for_status()
+        return r.json().get("price_usd")
+    except (requests.RequestException, ValueError):
+        return None
+
+
+def get_trades(contract, limit=50, url=f"http://127.0.0.1:{FEED_PORT}", timeout=2):
+    """Recent deduped trades (newest first) from the running feed, or None if it is down."""
+    try:
+        r = requests.get(f"{url}/trades/{contract}", params={"limit": limit}, timeout=timeout)
+        r.raise_for_status()
+        return r.json().get("trades", [])
+    except (requests.RequestException, ValueError):
+        return None
+
+
+def get_prices(contracts, url=f"http://127.0.0.1:{FEED_PORT}", timeout=2) -> dict:
+    """contract -> latest price for many contracts in one local call ({} if the feed is down)."""
+    try:
+        r = requests.get(f"{url}/prices", params={"contracts": ",".join(contracts)}, timeout=timeout)
+        r.raise_for_status()
+        return {c: snap.get("price_usd") for c, snap in r.json().items()}
+    except (requests.RequestException, ValueError):
+        return {}
+
+
+def tracked_contracts(path=CONTRACTS_FILE) -> list:
+    if not os.path.exists(path) or os.path.getsize(path) == 0:
+        return []
+    return pd.read_csv(path, dtype=str)["Contract"].dropna().unique().tolist()
+
+
+def serve(port=FEED_PORT, base_url=DEXSCREENER_BASE_URL, poll_interval=POLL_INTERVAL):
+    from aiohttp import web
+    import control_bus
+    from pair_meta_cache import default_cache
+
+    metrics.init("PriceFeed")
+    feed = PriceFeed(base_url=base_url, poll_interval=poll_interval, cache=default_cache())
+    feed.subscribe(tracked_contracts())
+    print(f"📡 Price feed for {len(feed.feeds)} contracts on http://127.0.0.1:{port}")
+
+    async def on_startup(app):
+        app["poller"] = asyncio.create_task(feed.run())
+        control_bus.default_bus().mark_ready("PriceFeed")
+
+    async def on_cleanup(app):
+        app["poller"].cancel()
+
+    app = make_app(feed)
+    app.on_startup.append(on_startup)
+    app.on_cleanup.append(on_cleanup)
+    web.run_app(app, host="127.0.0.1", port=port, print=None)
+
+
+# ----------------------------
+# Replay stub (offline testing)
+# ----------------------------
+def make_stub_app(recording=None, latency=0.02):
+    """
+    Dexscreener-shaped /tokens and /trades endpoints. With a recording
+    (JSONL of {"path", "body"} from --record) responses are replayed in
+    order per path; otherwise trades are synthetic, with overlapping
+    windows like the real endpoint.
+    """
+    from aiohttp import web
+
+    frames = collections.defaultdict(list)
+    if recording:
+        with open(recording, "r") as f:
+            for line in f:
+                rec = json.loads(line)
+                frames[rec["path"]].append(rec["body"])
+    cursors = collections.Counter()
+    history = collections.defaultdict(list)
+    stats = collections.Counter()
+
+    def replayed(path):
+        if not frames.get(path):
+            return None
+        body = frames[path][min(cursors[path], len(frames[path]) - 1)]
+        cursors[path] += 1
+        return body
+
+    async def tokens(request):
+        await asyncio.sleep(latency)
+        stats["tokens"] += 1
+        addresses = request.match_info["addresses"]
+        body = replayed(f"tokens/{addresses}")
+        if body is None:
+            body = {"pairs": [{"pairAddress": f"PAIR{a[:8]}", "priceUsd": f"{random.uniform(0.0001, 1):.6f}",
+                               "baseToken": {"address": a, "symbol": a[:4]},
+                               "liquidity": {"usd": random.uniform(5e4, 1e6)}}
+                              for a in addresses.split(",")]}
+        return web.json_response(body)
+
+    async def trades(request):
+        await asyncio.sleep(latency)
+        stats["trades"] += 1
+        contract = request.match_info["contract"]
+        body = replayed(f"trades/solana/{contract}")
+        if body is None:
+            log = history[contract]
+            for _ in range(random.randint(0, 5)):
+                log.insert(0, {"txnHash": f"{contract[:6]}-{len(log)}", "type": random.choice(["buy", "sell"]),
+                               "priceUsd": f"{random.uniform(0.0001, 1):.6f}", "amount": random.uniform(1, 1e6),
+                               "amountUsd": random.uniform(1, 500), "maker": f"W{random.randint(0, 99)}"})
+            body = {"trades": log[:50]}
+        return web.json_response(body)
+
+    async def counts(request):
+        return web.json_response(dict(stats))
+
+    app = web.Application()
+    app.router.add_get("/tokens/{addresses}", tokens)
+    app.router.add_get("/trades/solana/{contract}", trades)
+    app.router.add_get("/_stats", counts)
+    return app
+
+
+def record(contracts, out, cycles, base_url=DEXSCREENER_BASE_URL, poll_interval=POLL_INTERVAL):
+    """Capture real upstream responses for the replay stub."""
+    with requests.Session() as session, open(out, "a") as f:
+        for cycle in range(cycles):
+            paths = [f"tokens/{','.join(contracts[i:i + TOKENS_PER_REQUEST])}"
+                     for i in range(0, len(contracts), TOKENS_PER_REQUEST)]
+            paths += [f"trades/solana/{c}" for c in contracts]
+            for path in paths:
+                r = session.get(f"{base_url}/{path}", timeout=10)
+                if r.status_code == 200:
+                    f.write(json.dumps({"path": path, "body": r.json()}) + "\n")
+            print(f"📼 Recorded cycle {cycle + 1}/{cycles} ({len(paths)} responses)")
+            if cycle + 1 < cycles:
+                time.sleep(poll_interval)
+
+
+async def _bench(n_contracts, consumers, cycles, port):
+    from aiohttp import web
+
+    runner = web.AppRunner(make_stub_app(latency=0.01))
+    await runner.setup()
+    await web.TCPSite(runner, "127.0.0.1", port).start()
+    try:
+        feed = PriceFeed(base_url=f"http://127.0.0.1:{port}", rate_per_minute=60000, poll_interval=0)
+        contracts = [f"STUBTOKEN{i:04d}" for i in range(n_contracts)]
+        async with aiohttp.ClientSession() as session:
+            for _ in range(cycles):
+                for _ in range(consumers):      # every consumer subscribes; only the first one adds work
+                    feed.subscribe(contracts)
+                await feed.poll_once(session)
+        served = sum(len(feed.trades(c)) for c in contracts)
+    finally:
+        await runner.cleanup()
+    print(f"📊 {consumers} consumers x {n_contracts} contracts x {cycles} cycles: "
+          f"{feed.upstream_requests} upstream requests (polling each: {consumers * n_contracts * 2 * cycles}), "
+          f"{served} unique trades buffered")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Shared Dexscreener price/trade feed")
+    parser.add_argument("--serve", action="store_true", help="poll tracked contracts and serve the local API")
+    parser.add_argument("--stub", action="store_true", help="serve the replay stub of the Dexscreener API")
+    parser.add_argument("--record", metavar="FILE", help="record upstream responses for --stub --replay")
+    parser.add_argument("--replay", metavar="FILE", help="recording for --stub to replay")
+    parser.add_argument("--bench", action="store_true", help="count upstream requests against the stub")
+    parser.add_argument("--upstream", default=DEXSCREENER_BASE_URL, help="e.g. http://127.0.0.1:8768 for the stub")
+    parser.add_argument("--port", type=int, default=None)
+    parser.add_argument("--interval", type=float, default=POLL_INTERVAL)
+    parser.add_argument("--contracts", type=int, default=50)
+    parser.add_argument("--consumers", type=int, default=5)
+    parser.add_argument("--cycles", type=int, default=3)
+    args = parser.parse_args()
+
+    if args.serve:
+        serve(args.port or FEED_PORT, args.upstream, args.interval)
+    elif args.stub:
+        from aiohttp import web
+        port = args.port or STUB_PORT
+        print(f"🧪 Stub Dexscreener API on http://127.0.0.1:{port}")
+        web.run_app(make_stub_app(args.replay), host="127.0.0.1", port=port)
+    elif args.record:
+        record(tracked_contracts(), args.record, args.cycles, args.upstream, args.interval)
+    elif args.bench:
+        asyncio.run(_bench(args.contracts, args.consumers, args.cycles, args.port or STUB_PORT))
+    else:
+        parser.print_help()
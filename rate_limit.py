@@ -0,0 +1,52 @@
+# rate_limit.py
+import asyncio
+import random
+import threading
+import time
+
+
+class TokenBucket:
+    """
+    Token-bucket limiter shared by every caller of one upstream API.
+
+    `rate` tokens are refilled per `per` seconds up to `capacity`. Works from
+    threads (`acquire`) and from asyncio tasks (`acquire_async`).
+    """
+
+    def __init__(self, rate: float, per: float = 60.0, capacity: float = None):
+        self.rate = float(rate) / per          # tokens per second
+        self.capacity = float(capacity if capacity is not None else rate)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _reserve(self) -> float:
+        """Take one token; return how long the caller must wait before using it."""
+        with self._lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            self.tokens -= 1
+            if self.tokens >= 0:
+                return 0.0
+            return -self.tokens / self.rate
+
+    def acquire(self):
+        wait = self._reserve()
+        if wait > 0:
+            time.sleep(wait)
+
+    async def acquire_async(self):
+        wait = self._reserve()
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+    def penalize(self, seconds: float):
+        """Drain the bucket after a 429 so every caller backs off together."""
+        with self._lock:
+            self.tokens = min(self.tokens, 0) - seconds * self.rate
+
+
+def backoff_delay(attempt: int, base: float = 1.0, cap: float = 60.0) -> float:
+    """Full-jitter exponential backoff: uniform(0, min(cap, base * 2**attempt))."""
+    return random.uniform(0, min(cap, base * (2 ** attempt)))
@@ -0,0 +1,329 @@
+# signal_queue.py
+import argparse
+import csv
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from datetime import datetime, timezone
+from control_bus import _Inotify
+import trace_log
+
+DB_FILE = "signals.db"
+PENDING_CSV = "pending.csv"
+THOUGHT_CSV = "ai-thought.csv"
+LEASE_SECONDS = 30       # a claim not acked within this is handed out again
+MAX_ATTEMPTS = 5         # claims before a signal is parked as "failed"
+POLL_INTERVAL = 0.01     # fallback when inotify is unavailable
+BUSY_TIMEOUT_MS = 5000
+
+PENDING_COLUMNS = ["id", "contract", "decision", "time_queued"]
+THOUGHT_COLUMNS = ["ID", "CONTRACT", "DECISION", "TIME-QUEUED", "TRADE-STAT", "LAST-PRICE", "TOKEN", "SYMBOL",
+                   "PAIRID", "PRICE", "MARKETCAP", "LIQUIDITY", "FDV", "IN-PRICE", "LAST-PRICE(OLDER)", "TIME-INPRICE"]
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS signals (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    id TEXT UNIQUE,
+    contract TEXT NOT NULL,
+    decision TEXT NOT NULL,
+    time_queued TEXT NOT NULL,
+    payload TEXT,
+    state TEXT NOT NULL DEFAULT 'ready',
+    consumer TEXT,
+    lease_until REAL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    acked_at TEXT,
+    result TEXT
+);
+CREATE INDEX IF NOT EXISTS signals_open ON signals (state, seq) WHERE state IN ('ready', 'claimed');
+"""
+
+_FIELDS = ["seq", "id", "contract", "decision", "time_queued", "payload", "state", "consumer",
+           "lease_until", "attempts", "acked_at", "result"]
+
+
+def _now_iso() -> str:
+    return datetime.now(timezone.utc).isoformat()
+
+
+def _row(values) -> dict:
+    row = dict(zip(_FIELDS, values))
+    row["payload"] = json.loads(row["payload"]) if row["payload"] else {}
+    return row
+
+
+class SignalQueue:
+    """
+    Durable AI bot -> watcher signal queue in one SQLite file (WAL mode).
+
+    enqueue() commits a row and touches a sidecar file; consumers blocked in
+    claim() are woken through inotify on it (stat polling elsewhere), so a
+    signal is claimable a few milliseconds after it is queued. claim() takes
+    the oldest ready row under BEGIN IMMEDIATE, which serialises claimers:
+    no signal is handed to two consumers. A claim is a lease; if the
+    consumer dies before ack(), the row becomes claimable again after
+    LEASE_SECONDS, so nothing is lost either. Rows are never deleted during
+    a session: seq order is the replay log, and export() writes it out as
+    pending.csv / ai-thought.csv for the archive.
+    """
+
+    def __init__(self, path=DB_FILE):
+        self.path = path
+        self.notify_file = f"{path}.notify"
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, isolation_level=None, check_same_thread=False)
+        self._conn.execute(f"PRAGMA busy_timeout={BUSY_TIMEOUT_MS}")
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(SCHEMA)
+        self._notifier = None
+
+    # ---- producer ----
+    def enqueue(self, contract, decision, id=None, time_queued=None, **fields) -> int:
+        """
+        Queue one signal; extra fields (TOKEN, PRICE, ...) travel in the payload.
+        Re-enqueueing an existing id is a no-op, so producers can retry blindly.
+        Pass trace_id (from the feature/prediction row) to trace the signal to its fill.
+        Returns the signal's seq.
+        """
+        id = str(id or uuid.uuid4().hex)
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR IGNORE INTO signals (id, contract, decision, time_queued, payload) VALUES (?, ?, ?, ?, ?)",
+                (id, contract, str(decision).upper(), time_queued or _now_iso(), json.dumps(fields, default=str)))
+            seq = self._conn.execute("SELECT seq FROM signals WHERE id=?", (id,)).fetchone()[0]
+        self._notify(seq)
+        trace_log.record([fields.get("trace_id")], "queued")
+        return seq
+
+    def _notify(self, seq):
+        tmp = f"{self.notify_file}.{os.getpid()}.tmp"
+        with open(tmp, "w") as f:
+            f.write(str(seq))
+        os.replace(tmp, self.notify_file)
+
+    # ---- consumer ----
+    def _claim_once(self, consumer, decisions, lease):
+        now = time.time()
+        where = "(state='ready' OR (state='claimed' AND lease_until < ?))"
+        params = [now]
+        if decisions:
+            where += f" AND decision IN ({','.join('?' * len(decisions))})"
+            params += [d.upper() for d in decisions]
+        select = f"SELECT {','.join(_FIELDS)} FROM signals WHERE {where} ORDER BY seq LIMIT 1"
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                while True:
+                    values = self._conn.execute(select, params).fetchone()
+                    if values is None:
+                        self._conn.execute("COMMIT")
+                        return None
+                    row = _row(values)
+                    if row["attempts"] < MAX_ATTEMPTS:
+                        break
+                    # claimed and abandoned MAX_ATTEMPTS times: park it instead of crash-looping consumers
+                    self._conn.execute("UPDATE signals SET state='failed', result='max attempts' WHERE seq=?",
+                                       (row["seq"],))
+                self._conn.execute(
+                    "UPDATE signals SET state='claimed', consumer=?, lease_until=?, attempts=attempts+1 WHERE seq=?",
+                    (consumer, now + lease, row["seq"]))
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        row.update(state="claimed", consumer=consumer, lease_until=now + lease, attempts=row["attempts"] + 1)
+        trace_log.record([row["payload"].get("trace_id")], "claimed")
+        return row
+
+    def claim(self, consumer, decisions=None, timeout=0.0, lease=LEASE_SECONDS):
+        """
+        Oldest claimable signal (optionally only these decisions) as a dict, or
+        None if nothing arrived within `timeout` seconds.
+        """
+        deadline = time.monotonic() + timeout
+        while True:
+            row = self._claim_once(consumer, decisions, lease)
+            if row is not None:
+                return row
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return None
+            self.wait(min(remaining, 1.0))
+
+    def ack(self, seq, consumer, result=None) -> bool:
+        """Mark a claimed signal executed (the trace's fill). False if the lease was lost to another consumer."""
+        with self._lock:
+            cur = self._conn.execute(
+                "UPDATE signals SET state='acked', acked_at=?, result=?, lease_until=NULL "
+                "WHERE seq=? AND state='claimed' AND consumer=?",
+                (_now_iso(), None if result is None else json.dumps(result, default=str), seq, consumer))
+            payload = self._conn.execute("SELECT payload FROM signals WHERE seq=?", (seq,)).fetchone()
+        if cur.rowcount == 1 and payload and payload[0]:
+            trace_log.record([json.loads(payload[0]).get("trace_id")], "filled")
+        return cur.rowcount == 1
+
+    def release(self, seq, consumer) -> bool:
+        """Give a claimed signal back (e.g. execution failed and should be retried now)."""
+        with self._lock:
+            cur = self._conn.execute(
+                "UPDATE signals SET state='ready', consumer=NULL, lease_until=NULL "
+                "WHERE seq=? AND state='claimed' AND consumer=?", (seq, consumer))
+        if cur.rowcount:
+            self._notify(seq)
+        return cur.rowcount == 1
+
+    def wait(self, timeout: float) -> bool:
+        """Block until something is enqueued or released, or timeout. True on wake-up."""
+        if self._notifier is None and os.name == "posix":
+            try:
+                self._notifier = _Inotify(self.notify_file)
+            except (OSError, AttributeError):
+                self._notifier = False
+        if self._notifier:
+            return self._notifier.wait(timeout)
+
+        def mtime():
+            try:
+                return os.stat(self.notify_file).st_mtime_ns
+            except FileNotFoundError:
+                return None
+
+        before = mtime()
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            time.sleep(POLL_INTERVAL)
+            if mtime() != before:
+                return True
+        return False
+
+    # ---- replay / views ----
+    def replay(self, since_seq=0, states=None) -> list:
+        """Signals after `since_seq` in queue order."""
+        sql = f"SELECT {','.join(_FIELDS)} FROM signals WHERE seq > ?"
+        params = [since_seq]
+        if states:
+            sql += f" AND state IN ({','.join('?' * len(states))})"
+            params += list(states)
+        with self._lock:
+            rows = self._conn.execute(sql + " ORDER BY seq", params).fetchall()
+        return [_row(values) for values in rows]
+
+    def stats(self) -> dict:
+        with self._lock:
+            return dict(self._conn.execute("SELECT state, COUNT(*) FROM signals GROUP BY state").fetchall())
+
+    def export(self, pending_csv=PENDING_CSV, thought_csv=THOUGHT_CSV):
+        """Write the queue as the old CSVs: open signals to pending.csv, the full ordered log to ai-thought.csv."""
+        rows = self.replay()
+        with open(pending_csv, "w", newline="") as f:
+            writer = csv.writer(f)
+            writer.writerow(PENDING_COLUMNS)
+            for r in rows:
+                if r["state"] in ("ready", "claimed"):
+                    writer.writerow([r["id"], r["contract"], r["decision"], r["time_queued"]])
+        with open(thought_csv, "w", newline="") as f:
+            writer = csv.DictWriter(f, fieldnames=THOUGHT_COLUMNS, extrasaction="ignore")
+            writer.writeheader()
+            for r in rows:
+                writer.writerow({"TRADE-STAT": r["state"], **r["payload"], "ID": r["id"], "CONTRACT": r["contract"],
+                                 "DECISION": r["decision"], "TIME-QUEUED": r["time_queued"]})
+        return len(rows)
+
+    def import_csv(self, path=PENDING_CSV) -> int:
+        """Queue the rows of an old pending.csv / ai-thought.csv (ids already queued are skipped)."""
+        if not os.path.exists(path):
+            return 0
+        count = 0
+        with open(path, newline="") as f:
+            for row in csv.DictReader(f):
+                row = {k.strip(): v for k, v in row.items() if k}
+                lower = {k.lower().replace("-", "_"): v for k, v in row.items()}
+                if not lower.get("contract") or not lower.get("decision"):
+                    continue
+                extra = {k: v for k, v in row.items()
+                         if k.lower().replace("-", "_") not in PENDING_COLUMNS and v not in (None, "")}
+                self.enqueue(lower["contract"], lower["decision"], id=lower.get("id") or None,
+                             time_queued=lower.get("time_queued") or None, **extra)
+                count += 1
+        return count
+
+    def reset(self):
+        """Start a new session: drop every signal (export() first to keep them)."""
+        with self._lock:
+            self._conn.execute("DELETE FROM signals")
+            self._conn.execute("DELETE FROM sqlite_sequence WHERE name='signals'")
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+_default_queue = None
+
+
+def default_queue() -> SignalQueue:
+    global _default_queue
+    if _default_queue is None:
+        _default_queue = SignalQueue()
+    return _default_queue
+
+
+# ----------------------------
+# Latency benchmark
+# ----------------------------
+def _bench_consumer(path, n, out):
+    q = SignalQueue(path)
+    latencies = []
+    while len(latencies) < n:
+        row = q.claim("bench", timeout=5)
+        if row is None:
+            break
+        latencies.append(time.time() - row["payload"]["sent"])
+        q.ack(row["seq"], "bench")
+    out.put(latencies)
+
+
+def _bench(n, path):
+    import multiprocessing
+
+    for suffix in ("", "-wal", "-shm", ".notify"):
+        if os.path.exists(path + suffix):
+            os.remove(path + suffix)
+    q = SignalQueue(path)
+    out = multiprocessing.Queue()
+    proc = multiprocessing.Process(target=_bench_consumer, args=(path, n, out))
+    proc.start()
+    time.sleep(0.5)
+    for i in range(n):
+        q.enqueue(f"BENCH{i:04d}", "BUY", sent=time.time())
+        time.sleep(0.01)
+    latencies = sorted(out.get())
+    proc.join()
+    print(f"📨 {len(latencies)}/{n} signals, enqueue->claim p50={latencies[len(latencies) // 2] * 1000:.2f}ms "
+          f"p99={latencies[int(len(latencies) * 0.99) - 1] * 1000:.2f}ms, duplicates claimed: "
+          f"{len(latencies) - len({r['seq'] for r in q.replay(states=['acked'])})}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="AI bot -> watcher signal queue")
+    parser.add_argument("--db", default=DB_FILE)
+    parser.add_argument("--stats", action="store_true")
+    parser.add_argument("--export", action="store_true", help=f"rewrite {PENDING_CSV} / {THOUGHT_CSV} from the queue")
+    parser.add_argument("--import-csv", metavar="CSV", help="queue the rows of an old pending/ai-thought CSV")
+    parser.add_argument("--bench", type=int, metavar="N", help="cross-process enqueue->claim latency over N signals")
+    args = parser.parse_args()
+
+    if args.bench:
+        _bench(args.bench, "signals_bench.db")
+    else:
+        queue = SignalQueue(args.db)
+        if args.import_csv:
+            print(f"📥 Queued {queue.import_csv(args.import_csv)} signals from {args.import_csv}")
+        if args.export:
+            print(f"📤 Exported {queue.export()} signals to {PENDING_CSV} / {THOUGHT_CSV}")
+        if args.stats or not (args.import_csv or args.export):
+            print(f"📨 {queue.stats()}")
@@ -0,0 +1,195 @@
+# supervisor.py
+import csv
+import datetime
+import os
+import statistics
+import subprocess
+import time
+import control_bus
+import metrics
+
+STATUS_REPORT_FILE = "supervisor_status.csv"
+
+
+class Worker:
+    """
+    One supervised child process.
+
+    `heartbeat` is the control-bus module name the child marks ready each
+    rotation (None = liveness only). A heartbeat older than `max_heartbeat_age`
+    seconds counts as a hang and the child is restarted. `module` is the
+    master flag the child obeys: a clean exit while it is OFF is a stop, not
+    a crash, and the child is only started again once the flag is back ON.
+    """
+
+    def __init__(self, name, cmd, heartbeat=None, max_heartbeat_age=None,
+                 backoff_base=5.0, backoff_max=300.0, stable_after=600.0, module=None):
+        self.name = name
+        self.cmd = cmd
+        self.module = module
+        self.heartbeat = heartbeat
+        self.max_heartbeat_age = max_heartbeat_age
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.stable_after = stable_after
+
+        self.proc = None
+        self.started_at = None
+        self.restarts = 0
+        self.failures = 0            # consecutive, reset once the child is stable
+        self.next_start = 0.0
+        self.parked = False          # exited cleanly because its module is OFF
+        self.last_beat = None
+        self.rotations = []          # seconds between consecutive heartbeats
+        self._fresh_start = False    # first beat after a (re)start is not a rotation
+
+    # ---- lifecycle ----
+    def start(self):
+        self.proc = subprocess.Popen(self.cmd)
+        self.started_at = time.monotonic()
+        self._fresh_start = True
+        print(f"🚀 Started {self.name} (pid {self.proc.pid})")
+
+    def stop(self, timeout=10):
+        if self.proc and self.proc.poll() is None:
+            self.proc.terminate()
+            try:
+                self.proc.wait(timeout=timeout)
+            except subprocess.TimeoutExpired:
+                self.proc.kill()
+        self.proc = None
+
+    def alive(self) -> bool:
+        return self.proc is not None and self.proc.poll() is None
+
+    def uptime(self) -> float:
+        return time.monotonic() - self.started_at if self.alive() else 0.0
+
+    # ---- health ----
+    def observe_heartbeat(self, bus: control_bus.ControlBus):
+        if not self.heartbeat:
+            return
+        beat = bus.last_ready(self.heartbeat)
+        if beat is None or beat == self.last_beat:
+            return
+        if self.last_beat is not None and not self._fresh_start:
+            self.rotations.append((beat - self.last_beat).total_seconds())
+            self.rotations = self.rotations[-200:]
+        self.last_beat = beat
+        self._fresh_start = False
+
+    def heartbeat_age(self):
+        if self.last_beat is None:
+            return None
+        return (datetime.datetime.now(datetime.UTC) - self.last_beat).total_seconds()
+
+    def switched_off(self, bus: control_bus.ControlBus) -> bool:
+        """Exited with code 0 while its master flag is OFF (a requested stop)."""
+        return (self.module is not None and self.proc is not None and self.proc.poll() == 0
+                and not bus.is_module_on(self.module))
+
+    def unhealthy(self) -> str:
+        """Reason the child needs a restart, or '' if healthy."""
+        if self.proc is None:
+            return ""
+        code = self.proc.poll()
+        if code is not None:
+            return f"exited with code {code}"
+        age = self.heartbeat_age()
+        if self.max_heartbeat_age and self.uptime() > self.max_heartbeat_age:
+            if age is None or age > self.max_heartbeat_age:
+                return f"heartbeat stale ({'never' if age is None else f'{age:.0f}s'})"
+        return ""
+
+    def schedule_restart(self):
+        if self.started_at is not None and time.monotonic() - self.started_at >= self.stable_after:
+            self.failures = 0
+        self.failures += 1
+        delay = min(self.backoff_max, self.backoff_base * 2 ** (self.failures - 1))
+        self.next_start = time.monotonic() + delay
+        return delay
+
+
+class Supervisor:
+    """Keeps workers alive, restarts them with backoff and reports their health."""
+
+    def __init__(self, workers, bus=None, check_interval=2.0, report_interval=60.0,
+                 report_file=STATUS_REPORT_FILE):
+        self.workers = {w.name: w for w in workers}
+        self.bus = bus or control_bus.default_bus()
+        self.check_interval = check_interval
+        self.report_interval = report_interval
+        self.report_file = report_file
+        self._last_report = 0.0
+
+    def start(self, name):
+        self.workers[name].start()
+
+    def stop_all(self):
+        for w in self.workers.values():
+            w.stop()
+
+    def check(self):
+        now = time.monotonic()
+        for w in self.workers.values():
+            w.observe_heartbeat(self.bus)
+            if w.proc is None:
+                if w.parked and self.bus.is_module_on(w.module):
+                    w.parked = False
+                    print(f"▶️ {w.name} switched back ON. Starting...")
+                    w.start()
+                elif w.next_start and now >= w.next_start:
+                    w.next_start = 0.0
+                    w.restarts += 1
+                    metrics.inc("worker_restarts_total", worker=w.name)
+                    w.start()
+                continue
+            if w.switched_off(self.bus):
+                print(f"⏹️ {w.name} stopped ({w.module} is OFF). Not restarting until it is ON again.")
+                w.stop()
+                w.parked = True
+                continue
+            reason = w.unhealthy()
+            if reason:
+                delay = w.schedule_restart()
+                print(f"💥 {w.name} {reason}. Restarting in {delay:.0f}s...")
+                w.stop()
+        if now - self._last_report >= self.report_interval:
+            self.report()
+            self._last_report = now
+
+    def run(self, duration: float, until=None):
+        """Supervise for `duration` seconds, or until `until()` returns True."""
+        deadline = time.monotonic() + duration
+        while time.monotonic() < deadline:
+            self.check()
+            if until and until():
+                return True
+            # heartbeats arrive through the bus, so wake on change as well as on the tick
+            self.bus.wait_for_change(min(self.check_interval, max(0.0, deadline - time.monotonic())))
+        return False
+
+    def report(self):
+        rows = []
+        for w in self.workers.values():
+            age = w.heartbeat_age()
+            rows.append({
+                "module": w.name,
+                "pid": w.proc.pid if w.alive() else "",
+                "alive": w.alive(),
+                "uptime_s": round(w.uptime(), 1),
+                "restarts": w.restarts,
+                "heartbeat_age_s": "" if age is None else round(age, 1),
+                "rotation_last_s": round(w.rotations[-1], 2) if w.rotations else "",
+                "rotation_p50_s": round(statistics.median(w.rotations), 2) if w.rotations else "",
+                "rotation_max_s": round(max(w.rotations), 2) if w.rotations else "",
+            })
+        tmp = f"{self.report_file}.tmp"
+        with open(tmp, "w", newline="") as f:
+            writer = csv.DictWriter(f, fieldnames=list(rows[0].keys()))
+            writer.writeheader()
+            writer.writerows(rows)
+        os.replace(tmp, self.report_file)
+        for r in rows:
+            print(f"🩺 {r['module']}: alive={r['alive']} up={r['uptime_s']}s restarts={r['restarts']} "
+                  f"heartbeat_age={r['heartbeat_age_s']} rotation_p50={r['rotation_p50_s']}")
@@ -0,0 +1,261 @@
+# sweep.py
+import argparse
+import glob
+import hashlib
+import itertools
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from multiprocessing import shared_memory
+import numpy as np
+import pandas as pd
+import yaml
+from archive_store import default_store
+from backtest_engine import OHLCArrays, pair_volatility, run_configs
+from fill_model import default_model, pair_liquidity, latest_sol_usd
+
+ARCHIVE_GLOB = os.path.join("archive", "*", "all_pairs_ohlc.csv")   # sessions archived before compression
+OHLC_FILE = "all_pairs_ohlc.csv"
+CONTRACTS_FILE = "filtered_contracts.csv"
+CHECKPOINT_CSV = "sweep_checkpoint.csv"
+LEADERBOARD_CSV = "sweep_leaderboard.csv"
+CHUNK_SIZE = 64   # configs per work unit
+
+
+# ----------------------------
+# Shared-memory session arrays
+# ----------------------------
+class SharedSession:
+    """
+    One archived session packed into shared memory: a (5, n) float64 block
+    (open, high, low, close, clf_prob) plus the int64 pair offsets. Workers
+    attach by name, so the arrays are never pickled.
+    """
+
+    def __init__(self, name, data: OHLCArrays, prob=None, cost=None):
+        self.name = name
+        self.n_rows = len(data.close)
+        self.n_pairs = data.n_pairs
+        self.has_prob = prob is not None
+        self.vol = pair_volatility(data)   # per pair, small enough to pickle
+        self.cost = cost                   # round-trip cost per pair (or None)
+
+        self._values = shared_memory.SharedMemory(create=True, size=max(1, 5 * self.n_rows * 8))
+        self._offsets = shared_memory.SharedMemory(create=True, size=(self.n_pairs + 1) * 8)
+        values = np.ndarray((5, self.n_rows), dtype="float64", buffer=self._values.buf)
+        values[:4] = [data.open, data.high, data.low, data.close]
+        values[4] = prob if prob is not None else np.nan
+        np.ndarray(self.n_pairs + 1, dtype="int64", buffer=self._offsets.buf)[:] = data.offsets
+
+    def handle(self) -> dict:
+        return {
+            "name": self.name, "n_rows": self.n_rows, "n_pairs": self.n_pairs, "vol": self.vol,
+            "values": self._values.name, "offsets": self._offsets.name, "has_prob": self.has_prob,
+            "cost": self.cost,
+        }
+
+    def release(self):
+        for shm in (self._values, self._offsets):
+            shm.close()
+            shm.unlink()
+
+
+def _attach(handle):
+    values_shm = shared_memory.SharedMemory(name=handle["values"])
+    offsets_shm = shared_memory.SharedMemory(name=handle["offsets"])
+    values = np.ndarray((5, handle["n_rows"]), dtype="float64", buffer=values_shm.buf)
+    offsets = np.ndarray(handle["n_pairs"] + 1, dtype="int64", buffer=offsets_shm.buf)
+    data = OHLCArrays(np.arange(handle["n_pairs"]), offsets, values[0], values[1], values[2], values[3])
+    return data, values[4], (values_shm, offsets_shm)
+
+
+# ----------------------------
+# Worker
+# ----------------------------
+def evaluate_unit(handle, grid_id, unit_id, grid):
+    """grid: [(core_sl, trail_sl, prob_threshold, regime_threshold)] -> result rows."""
+    data, prob, shms = _attach(handle)
+    rows = []
+    try:
+        by_prob = {}
+        for cfg in grid:
+            by_prob.setdefault(cfg[2], []).append(cfg)
+        for prob_threshold, cfgs in by_prob.items():
+            mask = None
+            if handle["has_prob"] and prob_threshold is not None and not np.isnan(prob_threshold):
+                mask = prob >= prob_threshold
+            res = run_configs(data, [c[0] for c in cfgs], [c[1] for c in cfgs], entry_mask=mask, cost=handle["cost"])
+            vol = np.nan_to_num(handle["vol"], nan=np.inf)
+            for i, (core_sl, trail_sl, _, regime_threshold) in enumerate(cfgs):
+                calm = vol < regime_threshold
+                pnl = res["pnl"][i] * 100
+                rows.append({
+                    "session": handle["name"], "grid_id": grid_id, "unit": unit_id,
+                    "core_sl": core_sl, "trail_sl": trail_sl,
+                    "prob_threshold": prob_threshold, "regime_threshold": regime_threshold,
+                    "pairs": handle["n_pairs"], "calm_pairs": int(calm.sum()),
+                    "trades": int(res["trades"][i].sum()),
+                    "total_pnl_%": pnl.sum(),
+                    "calm_pnl_%": pnl[calm].sum(),
+                    "storm_pnl_%": pnl[~calm].sum(),
+                })
+    finally:
+        del data, prob
+        for shm in shms:
+            shm.close()
+    return rows
+
+
+# ----------------------------
+# Runner
+# ----------------------------
+def parse_grid(spec: str):
+    """'0.03:0.10:0.01' (inclusive range) or '0.05,0.07' -> list of floats."""
+    if ":" in spec:
+        start, stop, step = (float(x) for x in spec.split(":"))
+        return [round(v, 10) for v in np.arange(start, stop + step / 2, step)]
+    return [float(x) for x in spec.split(",") if x.strip()]
+
+
+def load_session(path) -> tuple:
+    df = pd.read_csv(path)
+    df.columns = [c.strip().lower() for c in df.columns]
+    data = OHLCArrays.from_frame(df)
+    prob = None
+    if "clf_prob" in df.columns:
+        df = df.assign(time=pd.to_datetime(df["time"], errors="coerce", utc=True))
+        prob = df.sort_values(["pair_id", "time"], kind="mergesort")["clf_prob"].to_numpy(dtype="float64")
+    return data, prob
+
+
+def session_costs(contracts_csv, data: OHLCArrays, trade_usd, model, sol_usd) -> np.ndarray:
+    """Round-trip fill cost per pair, using the liquidity recorded in that session's filtered_contracts.csv."""
+    liquidity = pair_liquidity(contracts_csv) if contracts_csv else {}
+    return model.pair_costs(data.pair_ids, trade_usd, liquidity, sol_usd)
+
+
+def find_sessions(pattern=ARCHIVE_GLOB, store=None) -> list:
+    """
+    [(name, ohlc_path, contracts_path)] for compressed sessions in the archive
+    manifest plus plain-CSV session folders matching `pattern`.
+    """
+    store = store or default_store()
+    found = {}
+    for path in sorted(glob.glob(pattern)):
+        name = os.path.basename(os.path.dirname(path)) or path
+        contracts = os.path.join(os.path.dirname(path), CONTRACTS_FILE)
+        found[name] = (name, path, contracts)
+    if pattern == ARCHIVE_GLOB:
+        m = store.manifest()
+        for name in m.loc[m["file"] == OHLC_FILE, "session"].unique():
+            found[name] = (name, store.locate(name, OHLC_FILE), store.locate(name, CONTRACTS_FILE))
+    return [found[k] for k in sorted(found)]
+
+
+def load_checkpoint(path, grid_id):
+    """Rows already computed for this grid, and their (session, unit) keys."""
+    if not os.path.exists(path) or os.path.getsize(path) == 0:
+        return pd.DataFrame(), set()
+    done = pd.read_csv(path, dtype={"grid_id": str})
+    done = done[done["grid_id"] == grid_id]
+    return done, set(zip(done["session"], done["unit"]))
+
+
+def leaderboard(results: pd.DataFrame) -> pd.DataFrame:
+    keys = ["core_sl", "trail_sl", "prob_threshold", "regime_threshold"]
+    board = results.groupby(keys, dropna=False).agg(
+        sessions=("session", "nunique"),
+        pairs=("pairs", "sum"),
+        trades=("trades", "sum"),
+        total_pnl=("total_pnl_%", "sum"),
+        calm_pnl=("calm_pnl_%", "sum"),
+        storm_pnl=("storm_pnl_%", "sum"),
+    ).reset_index()
+    board["avg_pnl_per_pair_%"] = board["total_pnl"] / board["pairs"].where(board["pairs"] > 0)
+    board = board.rename(columns={"total_pnl": "total_pnl_%", "calm_pnl": "calm_pnl_%", "storm_pnl": "storm_pnl_%"})
+    board = board.sort_values("total_pnl_%", ascending=False).reset_index(drop=True)
+    board.insert(0, "rank", board.index + 1)
+    return board
+
+
+def run_sweep(sessions, core_grid, trail_grid, prob_grid, regime_grid, workers=None,
+              checkpoint_csv=CHECKPOINT_CSV, leaderboard_csv=LEADERBOARD_CSV, chunk_size=CHUNK_SIZE,
+              trade_usd=None):
+    """
+    sessions: find_sessions() tuples or plain OHLC CSV paths (.csv or .csv.gz).
+    `trade_usd` set: charge each trade the fill model's round-trip cost at that size.
+    """
+    grid = list(itertools.product(core_grid, trail_grid, prob_grid, regime_grid))
+    grid_id = hashlib.sha1(repr((grid, chunk_size, trade_usd)).encode()).hexdigest()[:12]
+    model = default_model() if trade_usd else None
+    sol_usd = latest_sol_usd() if trade_usd else None
+    _, done = load_checkpoint(checkpoint_csv, grid_id)
+    units = [grid[i:i + chunk_size] for i in range(0, len(grid), chunk_size)]
+    print(f"🧮 {len(grid)} configs x {len(sessions)} sessions in {len(units)} units/session "
+          f"({len(done)} units already checkpointed)")
+
+    shared = []
+    try:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = []
+            for item in sessions:
+                if isinstance(item, str):
+                    item = (os.path.basename(os.path.dirname(item)) or item, item,
+                            os.path.join(os.path.dirname(item), CONTRACTS_FILE))
+                name, path, contracts_csv = item
+                if all((name, u) in done for u in range(len(units))):
+                    continue
+                data, prob = load_session(path)
+                cost = session_costs(contracts_csv, data, trade_usd, model, sol_usd) if trade_usd else None
+                session = SharedSession(name, data, prob, cost)
+                shared.append(session)
+                if prob is None and len(prob_grid) > 1:
+                    print(f"⚠️ {name}: no clf_prob column, prob_threshold has no effect")
+                for unit_id, unit in enumerate(units):
+                    if (name, unit_id) not in done:
+                        futures.append(pool.submit(evaluate_unit, session.handle(), grid_id, unit_id, unit))
+
+            for n, fut in enumerate(as_completed(futures), 1):
+                rows = pd.DataFrame(fut.result())
+                rows.to_csv(checkpoint_csv, mode="a", index=False,
+                            header=not os.path.exists(checkpoint_csv) or os.path.getsize(checkpoint_csv) == 0)
+                if n % 10 == 0 or n == len(futures):
+                    print(f"📌 {n}/{len(futures)} units done")
+    finally:
+        for session in shared:
+            session.release()
+
+    results, _ = load_checkpoint(checkpoint_csv, grid_id)
+    if results.empty:
+        print("❌ No results.")
+        return results
+    board = leaderboard(results)
+    board.to_csv(leaderboard_csv, index=False)
+    return board
+
+
+if __name__ == "__main__":
+    with open("config.yaml", "r") as f:
+        config = yaml.safe_load(f)
+
+    parser = argparse.ArgumentParser(description="Parallel stop-loss / threshold sweep over archived sessions")
+    parser.add_argument("--sessions", default=ARCHIVE_GLOB, help="glob of plain session OHLC CSVs (the default also includes compressed archives)")
+    parser.add_argument("--core", default="0.03:0.10:0.01")
+    parser.add_argument("--trail", default="0.02:0.06:0.01")
+    parser.add_argument("--prob", default=str(config.get("prob_threshold", 0.5)))
+    parser.add_argument("--regime", default="0.01:0.03:0.005")
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--trade-usd", type=float, default=None, help="apply fill_model costs at this trade size")
+    parser.add_argument("--fresh", action="store_true", help="ignore an existing checkpoint")
+    args = parser.parse_args()
+
+    if args.fresh and os.path.exists(CHECKPOINT_CSV):
+        os.remove(CHECKPOINT_CSV)
+
+    sessions = find_sessions(args.sessions)
+    if not sessions:
+        raise FileNotFoundError(f"❌ No sessions match {args.sessions}")
+
+    board = run_sweep(sessions, parse_grid(args.core), parse_grid(args.trail),
+                      parse_grid(args.prob), parse_grid(args.regime), workers=args.workers,
+                      trade_usd=args.trade_usd)
+    print(board.head(20))
@@ -1,7 +1,12 @@
-import pandas as pd
+import argparse
+import os
+from backtest_engine import OHLCArrays, backtest
+from fill_model import default_model, pair_liquidity, latest_sol_usd
 
 # ---- Parameters ----
 CSV_FILE = r"C:\Users\kate\Documents\sol-trade\archive\20250912_114737\all_pairs_ohlc.csv"
+CONTRACTS_FILE = "filtered_contracts.csv"
+TRADE_USD = 100.0  # size each trade is costed at (fill_model.py), 0 = frictionless
 
 # configs: (core stoploss, trailing stop)
 configs = [
@@ -11,103 +16,25 @@ configs = [
     ("7% core + 4% trail", 0.07, 0.04),
 ]
 
-# ---- Load ----
-df = pd.read_csv(CSV_FILE)
-df.columns = [c.strip().lower() for c in df.columns]
-df["time"] = pd.to_datetime(df["time"], errors="coerce", utc=True)
-
-aggregate_results = []
-
-# ---- Simple regime detector ----
-def detect_regime(sub, lookback=20):
-    """Return 'calm' or 'storm' based on rolling volatility."""
-    sub = sub.sort_values("time").reset_index(drop=True)
-    sub["return"] = sub["close"].pct_change()
-    vol = sub["return"].rolling(lookback).std().mean()
-
-    # thresholds can be tuned depending on your dataset
-    if vol < 0.02:   # <2% std dev → calm
-        return "calm"
-    else:
-        return "storm"
-
-for name, core_sl, trail_sl in configs:
-    results = []
-    calm_count, storm_count = 0, 0
-
-    for pair, sub in df.groupby("pair_id"):
-        regime = detect_regime(sub)
-
-        if regime == "calm":
-            calm_count += 1
-        else:
-            storm_count += 1
-
-        sub = sub.sort_values("time").reset_index(drop=True)
-
-        balance = 0.0
-        trades = 0
-        stoploss_hits = 0
-        trail_hits = 0
-        entry_price = None
-        highest_price = None
-
-        for _, row in sub.iterrows():
-            price_open = row["open"]
-            price_high = row["high"]
-            price_low = row["low"]
-            price_close = row["close"]
-
-            if entry_price is None:
-                entry_price = price_open
-                highest_price = price_open
-                continue
-
-            # update high water mark
-            highest_price = max(highest_price, price_high)
-
-            # core stoploss
-            if price_low <= entry_price * (1 - core_sl):
-                pnl = -core_sl
-                balance += pnl
-                trades += 1
-                stoploss_hits += 1
-                entry_price = None
-                highest_price = None
-                continue
-
-            # trailing stop
-            if price_low <= highest_price * (1 - trail_sl):
-                pnl = (highest_price * (1 - trail_sl) - entry_price) / entry_price
-                balance += pnl
-                trades += 1
-                trail_hits += 1
-                entry_price = None
-                highest_price = None
-                continue
-
-            # otherwise close at end of bar
-            pnl = (price_close - entry_price) / entry_price
-            balance += pnl
-            trades += 1
-            entry_price = None
-            highest_price = None
-
-        results.append(balance * 100)  # percent return for pair
-
-    # aggregate portfolio view
-    total_pnl = sum(results)
-    avg_pnl = total_pnl / len(results) if results else 0
-    aggregate_results.append({
-        "config": name,
-        "pairs_tested": len(results),
-        "calm_pairs": calm_count,
-        "storm_pairs": storm_count,
-        "total_pnl_%": total_pnl,
-        "avg_pnl_per_pair_%": avg_pnl
-    })
-
-# ---- Save + Show ----
-agg_df = pd.DataFrame(aggregate_results)
-agg_df.to_csv("aggregate_stoploss_comparison.csv", index=False)
-print(agg_df)
+# ---- Run ----
+# The OHLC file is loaded once into NumPy arrays and every config is evaluated
+# in one vectorized pass (see backtest_engine.py for the state machine).
+# Each trade is charged the fill model's round-trip cost for its pair, using
+# the liquidity in the session's filtered_contracts.csv next to the OHLC file.
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Stop-loss / trailing-stop backtest")
+    parser.add_argument("csv_file", nargs="?", default=CSV_FILE)
+    parser.add_argument("--trade-usd", type=float, default=TRADE_USD, help="trade size for fill costs (0 = frictionless)")
+    args = parser.parse_args()
+
+    data = OHLCArrays.from_csv(args.csv_file)
+    cost = None
+    if args.trade_usd:
+        liquidity = pair_liquidity(os.path.join(os.path.dirname(args.csv_file), CONTRACTS_FILE))
+        cost = default_model().pair_costs(data.pair_ids, args.trade_usd, liquidity, latest_sol_usd())
+        print(f"🧮 Fill costs at ${args.trade_usd:.0f}/trade: mean round trip {cost.mean() * 100:.3f}%")
+
+    # ---- Save + Show ----
+    # writes aggregate_stoploss_comparison.csv and stoploss_trailing_backtest_results.csv
+    agg_df = backtest(data, configs, cost=cost)
+    print(agg_df)
@@ -0,0 +1,148 @@
+# trace_log.py
+from __future__ import annotations
+import argparse
+import datetime
+import os
+import time
+import metrics
+from lazy_imports import lazy_import
+
+pd = lazy_import("pandas")
+
+TRACE_FILE = "trace_log.csv"
+TRACE_COLUMNS = ["session", "trace_id", "stage", "ts"]
+# close is implied by the trace id; the others are written by the stage that reaches them
+STAGES = ["close", "stored", "features", "scored", "queued", "claimed", "filled"]
+CANDLE_SECONDS = 60
+AGE_BUCKETS = (0.5, 1, 2, 5, 10, 20, 30, 60, 120, 300, 600, 1800)
+QUANTILES = (0.5, 0.95, 0.99)
+
+
+# ----------------------------
+# Trace ids
+# ----------------------------
+def trace_id(pair_id, candle_time) -> str:
+    """
+    `<pair_id>@<candle open epoch>`. Derived from the candle itself, so every
+    stage can compute it from what it already has (pair + candle time) and
+    nothing has to be threaded through files that don't carry it.
+    """
+    if not isinstance(candle_time, (int, float)):
+        candle_time = pd.Timestamp(candle_time).timestamp()
+    return f"{pair_id}@{int(candle_time)}"
+
+
+def candle_close(tid: str) -> float:
+    return int(tid.rsplit("@", 1)[1]) + CANDLE_SECONDS
+
+
+def latest_ids(df: pd.DataFrame) -> list:
+    """Trace id of the newest candle per pair in a candle frame."""
+    if df is None or len(df) == 0:
+        return []
+    last = df.groupby("pair_id", sort=False)["time"].max()
+    return [trace_id(p, t) for p, t in last.items()]
+
+
+def session() -> str:
+    return os.environ.get("TRACE_SESSION", "adhoc")
+
+
+def new_session() -> str:
+    """Start a trace session; worker processes spawned afterwards inherit it."""
+    os.environ["TRACE_SESSION"] = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
+    return os.environ["TRACE_SESSION"]
+
+
+# ----------------------------
+# Recording
+# ----------------------------
+def record(trace_ids, stage, ts=None, path=TRACE_FILE):
+    """
+    Append one line per trace for `stage` in a single write (small O_APPEND
+    writes don't interleave between processes) and feed signal_age_seconds.
+    """
+    trace_ids = [t for t in trace_ids if t]
+    if not trace_ids:
+        return
+    ts = ts if ts is not None else time.time()
+    sess = session()
+    lines = "".join(f"{sess},{t},{stage},{ts:.3f}\n" for t in trace_ids)
+    new_file = not os.path.exists(path)
+    with open(path, "a", newline="") as f:
+        f.write((",".join(TRACE_COLUMNS) + "\n" if new_file else "") + lines)
+    for t in trace_ids:
+        metrics.observe("signal_age_seconds", ts - candle_close(t), buckets=AGE_BUCKETS, stage=stage)
+
+
+# ----------------------------
+# Report
+# ----------------------------
+def load(path=TRACE_FILE, archived_sessions=()) -> pd.DataFrame:
+    """Current trace log plus the trace logs of archived sessions."""
+    frames = []
+    if os.path.exists(path) and os.path.getsize(path) > 0:
+        frames.append(pd.read_csv(path, dtype={"session": str, "trace_id": str}))
+    if archived_sessions:
+        from archive_store import default_store
+        store = default_store()
+        for name in archived_sessions:
+            try:
+                frames.append(store.read_csv(name, os.path.basename(path), dtype={"session": str, "trace_id": str}))
+            except FileNotFoundError:
+                print(f"⚠️ No {os.path.basename(path)} in archive/{name}")
+    if not frames:
+        return pd.DataFrame(columns=TRACE_COLUMNS)
+    return pd.concat(frames, ignore_index=True)
+
+
+def stage_latencies(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    One row per (trace, stage): `step` is the time since the previous stage the
+    trace reached, `age` the time since candle close. A stage seen twice (a
+    re-claim) counts from its first occurrence.
+    """
+    if df.empty:
+        return pd.DataFrame(columns=["session", "trace_id", "stage", "ts", "step", "age"])
+    df = df[df["stage"].isin(STAGES)]
+    df = df.sort_values("ts").drop_duplicates(["session", "trace_id", "stage"])
+    close = df["trace_id"].str.rsplit("@", n=1).str[1].astype("int64") + CANDLE_SECONDS
+    df = df.assign(order=df["stage"].map(STAGES.index), age=df["ts"] - close)
+    df = df.sort_values(["session", "trace_id", "order"])
+    prev_age = df.groupby(["session", "trace_id"])["age"].shift().fillna(0.0)
+    return df.assign(step=df["age"] - prev_age)[["session", "trace_id", "stage", "ts", "step", "age"]]
+
+
+def report(df: pd.DataFrame) -> pd.DataFrame:
+    """p50/p95/p99 of step and age per session and stage, stages in pipeline order."""
+    lat = stage_latencies(df)
+    if lat.empty:
+        return pd.DataFrame()
+    grouped = lat.groupby(["session", "stage"])
+    out = grouped.size().rename("traces").to_frame()
+    for col in ("step", "age"):
+        q = grouped[col].quantile(list(QUANTILES)).unstack()
+        q.columns = [f"{col}_p{int(round(x * 100))}" for x in QUANTILES]
+        out = out.join(q)
+    out = out.reset_index()
+    out["order"] = out["stage"].map(STAGES.index)
+    return out.sort_values(["session", "order"]).drop(columns="order").reset_index(drop=True)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Candle-close -> fill latency report from the trace log")
+    parser.add_argument("--file", default=TRACE_FILE)
+    parser.add_argument("--session", nargs="*", help="only these sessions")
+    parser.add_argument("--archive", nargs="*", metavar="SESSION", default=(),
+                        help="also read the trace log archived in these archive/ sessions")
+    args = parser.parse_args()
+
+    traces = load(args.file, args.archive)
+    if args.session:
+        traces = traces[traces["session"].isin(args.session)]
+    table = report(traces)
+    if table.empty:
+        print(f"⚠️ No traces in {args.file}")
+    else:
+        print("⏱️ Seconds per stage (step = since previous stage, age = since candle close)")
+        print(table.to_string(index=False, float_format=lambda x: f"{x:.3f}"))
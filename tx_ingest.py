@@ -0,0 +1,280 @@
+# tx_ingest.py
+from __future__ import annotations
+import argparse
+import glob
+import json
+import os
+from lazy_imports import lazy_import
+
+try:
+    import ijson                      # optional: incremental parsing
+except ImportError:
+    ijson = None
+
+np = lazy_import("numpy")
+pd = lazy_import("pandas")
+
+TX_GLOB = "raydium_tx_*.json"
+TX_CSV = "tx_index.csv"
+LEGS_CSV = "tx_legs.csv"
+NATIVE_MINT = "SOL"                   # lamport balance legs (pre/postBalances)
+WSOL_MINT = "So11111111111111111111111111111111111111112"
+SOL_DECIMALS = 9
+
+TX_DTYPES = {
+    "signature": "string", "slot": "int64", "block_time": "int64", "signer": "string",
+    "fee": "int64", "compute_units": "int64", "failed": "bool", "n_accounts": "int64", "source": "string",
+}
+LEG_DTYPES = {
+    "signature": "string", "block_time": "int64", "account": "string", "owner": "string",
+    "mint": "string", "decimals": "int64", "pre": "int64", "post": "int64", "delta": "int64",
+    "ui_delta": "float64", "signer_owned": "bool",
+}
+
+# Only these branches of a getTransaction document are kept; everything else
+# (instructions, innerInstructions, logs, ...) is skipped while streaming.
+_SCALARS = {
+    "blockTime": "block_time", "slot": "slot",
+    "meta.fee": "fee", "meta.computeUnitsConsumed": "compute_units",
+}
+_LISTS = {
+    "meta.preBalances.item": "pre_balances",
+    "meta.postBalances.item": "post_balances",
+    "transaction.signatures.item": "signatures",
+    "transaction.message.accountKeys.item.pubkey": "account_keys",
+    "transaction.message.accountKeys.item": "account_keys",   # legacy (non-parsed) encoding
+}
+_TOKEN_BALANCES = {"meta.preTokenBalances.item": "pre_tokens", "meta.postTokenBalances.item": "post_tokens"}
+_TOKEN_FIELDS = {"accountIndex": "accountIndex", "mint": "mint", "owner": "owner",
+                 "uiTokenAmount.amount": "amount", "uiTokenAmount.decimals": "decimals"}
+
+
+# ----------------------------
+# Streaming parse
+# ----------------------------
+def _new_doc():
+    return {"pre_balances": [], "post_balances": [], "signatures": [], "account_keys": [],
+            "pre_tokens": [], "post_tokens": [], "failed": False}
+
+
+def _routes(root):
+    """ijson prefix -> (action, target); one dict lookup per event, everything else is skipped."""
+    routes = {f"{root}{p}": ("scalar", k) for p, k in _SCALARS.items()}
+    routes.update({f"{root}{p}": ("list", k) for p, k in _LISTS.items()})
+    routes[f"{root}meta.err"] = ("err", None)
+    for p, k in _TOKEN_BALANCES.items():
+        routes[f"{root}{p}"] = ("token", k)
+        routes.update({f"{root}{p}.{f}": ("token_field", name) for f, name in _TOKEN_FIELDS.items()})
+    return routes
+
+
+def _iter_docs_streaming(f):
+    """Yield slim transaction dicts from one file (a single document or an array of them)."""
+    events = ijson.parse(f, use_float=True)
+    _, first, _ = next(events, ("", None, None))
+    top = "item" if first == "start_array" else ""
+    routes = _routes("item." if top else "")
+    doc, token = (None, None) if top else (_new_doc(), None)
+    for prefix, event, value in events:
+        route = routes.get(prefix)
+        if route is None:
+            if prefix == top:
+                if event == "start_map":
+                    doc = _new_doc()
+                elif event == "end_map":
+                    yield doc
+                    doc = None
+            continue
+        action, target = route
+        if action == "token_field":
+            token[target] = value
+        elif action == "list":
+            if event in ("number", "string"):
+                doc[target].append(value)
+        elif action == "token":
+            if event == "start_map":
+                token = {}
+            elif event == "end_map":
+                doc[target].append(token)
+        elif action == "scalar":
+            if event == "number":
+                doc[target] = int(value)
+        elif event != "null":              # meta.err
+            doc["failed"] = True
+
+
+def _iter_docs_json(f):
+    """Fallback when ijson is missing: full json.load, reduced to the same slim dict."""
+    data = json.load(f)
+    for tx in (data if isinstance(data, list) else [data]):
+        meta, message = tx.get("meta") or {}, tx["transaction"]["message"]
+        slim = lambda balances: [{
+            "accountIndex": t["accountIndex"], "mint": t["mint"], "owner": t.get("owner"),
+            "amount": t["uiTokenAmount"]["amount"], "decimals": t["uiTokenAmount"]["decimals"],
+        } for t in balances or []]
+        yield {
+            "block_time": tx.get("blockTime"), "slot": tx.get("slot"),
+            "fee": meta.get("fee", 0), "compute_units": meta.get("computeUnitsConsumed", 0),
+            "failed": meta.get("err") is not None,
+            "pre_balances": meta.get("preBalances", []), "post_balances": meta.get("postBalances", []),
+            "signatures": tx["transaction"].get("signatures", []),
+            "account_keys": [k["pubkey"] if isinstance(k, dict) else k for k in message["accountKeys"]],
+            "pre_tokens": slim(meta.get("preTokenBalances")), "post_tokens": slim(meta.get("postTokenBalances")),
+        }
+
+
+def iter_transactions(path):
+    with open(path, "rb") as f:
+        yield from (_iter_docs_streaming(f) if ijson else _iter_docs_json(f))
+
+
+# ----------------------------
+# Row extraction
+# ----------------------------
+def _legs(doc, signature):
+    keys = doc["account_keys"]
+    signer = keys[0] if keys else None
+    legs = []
+    for i, (pre, post) in enumerate(zip(doc["pre_balances"], doc["post_balances"])):
+        if pre != post:
+            legs.append((signature, doc.get("block_time", 0), keys[i], keys[i], NATIVE_MINT, SOL_DECIMALS,
+                         pre, post, post - pre, (post - pre) / 10 ** SOL_DECIMALS, keys[i] == signer))
+
+    # token accounts can be created or closed inside the tx: missing side = 0
+    balances = {}
+    for side, entries in ((0, doc["pre_tokens"]), (1, doc["post_tokens"])):
+        for t in entries:
+            idx = int(t["accountIndex"])
+            entry = balances.setdefault(idx, [0, 0, t["mint"], t.get("owner"), int(t["decimals"])])
+            entry[side] = int(t["amount"])
+    for idx, (pre, post, mint, owner, decimals) in sorted(balances.items()):
+        if pre != post:
+            legs.append((signature, doc.get("block_time", 0), keys[idx], owner, mint, decimals,
+                         pre, post, post - pre, (post - pre) / 10 ** decimals, owner == signer))
+    return legs
+
+
+def load_transactions(paths) -> tuple:
+    """Parse dump files into (tx, legs) DataFrames with fixed dtypes."""
+    tx_rows, leg_rows = [], []
+    for path in paths:
+        for doc in iter_transactions(path):
+            signature = doc["signatures"][0] if doc["signatures"] else f"{os.path.basename(path)}#{len(tx_rows)}"
+            keys = doc["account_keys"]
+            tx_rows.append((signature, doc.get("slot", 0), doc.get("block_time", 0), keys[0] if keys else "",
+                            doc.get("fee", 0), doc.get("compute_units", 0), doc["failed"], len(keys),
+                            os.path.basename(path)))
+            leg_rows.extend(_legs(doc, signature))
+    tx = pd.DataFrame(tx_rows, columns=list(TX_DTYPES)).astype(TX_DTYPES)
+    legs = pd.DataFrame(leg_rows, columns=list(LEG_DTYPES)).astype(LEG_DTYPES)
+    return tx, legs
+
+
+# ----------------------------
+# Indexed table
+# ----------------------------
+class TxTable:
+    """
+    Columnar transaction table: one row per transaction plus one row per
+    balance leg (account x mint whose balance changed). Both are sorted by
+    block_time, so time ranges are a binary search; accounts map to leg rows
+    through a prebuilt index.
+    """
+
+    def __init__(self, tx: pd.DataFrame, legs: pd.DataFrame):
+        self.tx = tx.drop_duplicates("signature").sort_values(["block_time", "slot"], kind="mergesort").reset_index(drop=True)
+        self.legs = legs[legs["signature"].isin(self.tx["signature"])]
+        self.legs = self.legs.drop_duplicates(["signature", "account", "mint"]).sort_values(
+            "block_time", kind="mergesort").reset_index(drop=True)
+        self._tx_times = self.tx["block_time"].to_numpy()
+        self._leg_times = self.legs["block_time"].to_numpy()
+        self._by_account = None
+
+    @classmethod
+    def from_files(cls, paths=None, tx_csv=TX_CSV, legs_csv=LEGS_CSV):
+        """Parse only dumps not already in the persisted CSVs, then save the union."""
+        paths = sorted(glob.glob(TX_GLOB)) if paths is None else list(paths)
+        old_tx, old_legs = cls.read_csv(tx_csv, legs_csv)
+        done = set(old_tx["source"])
+        new_tx, new_legs = load_transactions([p for p in paths if os.path.basename(p) not in done])
+        table = cls(pd.concat([old_tx, new_tx], ignore_index=True), pd.concat([old_legs, new_legs], ignore_index=True))
+        if len(new_tx):
+            table.save(tx_csv, legs_csv)
+        return table
+
+    @staticmethod
+    def read_csv(tx_csv=TX_CSV, legs_csv=LEGS_CSV):
+        if not os.path.exists(tx_csv) or not os.path.exists(legs_csv):
+            return (pd.DataFrame(columns=list(TX_DTYPES)).astype(TX_DTYPES),
+                    pd.DataFrame(columns=list(LEG_DTYPES)).astype(LEG_DTYPES))
+        return pd.read_csv(tx_csv, dtype=TX_DTYPES), pd.read_csv(legs_csv, dtype=LEG_DTYPES)
+
+    def save(self, tx_csv=TX_CSV, legs_csv=LEGS_CSV):
+        for df, path in ((self.tx, tx_csv), (self.legs, legs_csv)):
+            tmp = f"{path}.tmp"
+            df.to_csv(tmp, index=False)
+            os.replace(tmp, path)
+
+    # ---- lookups ----
+    def between(self, start, end) -> pd.DataFrame:
+        """Transactions with start <= blockTime < end (unix seconds)."""
+        lo, hi = np.searchsorted(self._tx_times, [start, end], side="left")
+        return self.tx.iloc[lo:hi]
+
+    def legs_between(self, start, end) -> pd.DataFrame:
+        lo, hi = np.searchsorted(self._leg_times, [start, end], side="left")
+        return self.legs.iloc[lo:hi]
+
+    def for_account(self, account) -> pd.DataFrame:
+        """Legs touching an account, either as the token account or its owner."""
+        if self._by_account is None:
+            index = {}
+            for col in ("account", "owner"):
+                for key, rows in self.legs.groupby(col, sort=False).indices.items():
+                    index.setdefault(key, []).append(rows)
+            self._by_account = {k: np.unique(np.concatenate(v)) for k, v in index.items()}
+        return self.legs.iloc[self._by_account.get(account, np.empty(0, dtype=np.int64))]
+
+    # ---- analysis ----
+    def swaps(self) -> pd.DataFrame:
+        """
+        Signer-side view of each transaction: the token sold (largest outflow),
+        the token bought (largest inflow) and the signer's SOL change net of
+        the network fee.
+        """
+        own = self.legs[self.legs["signer_owned"]]
+        # wrapped SOL is a token account but the same asset (and decimals) as lamports
+        is_sol = own["mint"].isin([NATIVE_MINT, WSOL_MINT])
+        tokens = own[~is_sol]
+        sol = own[is_sol].groupby("signature")["delta"].sum()
+
+        sold = tokens[tokens["delta"] < 0].sort_values("delta").drop_duplicates("signature")
+        bought = tokens[tokens["delta"] > 0].sort_values("delta", ascending=False).drop_duplicates("signature")
+        out = self.tx[["signature", "block_time", "signer", "fee", "compute_units", "failed"]].set_index("signature")
+        out = out.join(sold.set_index("signature")[["mint", "ui_delta"]].rename(
+            columns={"mint": "sold_mint", "ui_delta": "sold_amount"}))
+        out = out.join(bought.set_index("signature")[["mint", "ui_delta"]].rename(
+            columns={"mint": "bought_mint", "ui_delta": "bought_amount"}))
+        out["sold_amount"] = -out["sold_amount"]
+        out["sol_change"] = sol.reindex(out.index).fillna(0).astype("int64")
+        out["sol_change_ex_fee"] = (out["sol_change"] + out["fee"]) / 10 ** SOL_DECIMALS
+        out["fee_sol"] = out["fee"] / 10 ** SOL_DECIMALS
+        # total fee (base 5000 lamports per signature + priority fee) over CU consumed, not the priority CU price
+        out["fee_per_cu_lamports"] = out["fee"] / out["compute_units"].where(out["compute_units"] > 0)
+        return out.reset_index()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Index captured getTransaction dumps")
+    parser.add_argument("paths", nargs="*", help=f"dump files (default: {TX_GLOB})")
+    parser.add_argument("--rebuild", action="store_true", help="ignore the persisted index")
+    args = parser.parse_args()
+
+    if args.rebuild:
+        for path in (TX_CSV, LEGS_CSV):
+            if os.path.exists(path):
+                os.remove(path)
+    table = TxTable.from_files(args.paths or None)
+    print(f"🧾 {len(table.tx)} transactions, {len(table.legs)} balance legs "
+          f"({'ijson streaming' if ijson else 'json fallback'})")
+    print(table.swaps().head(20).to_string(index=False))
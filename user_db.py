@@ -0,0 +1,196 @@
+# user_db.py
+import asyncio
+import queue
+import sqlite3
+import threading
+from concurrent.futures import Future, InvalidStateError, ThreadPoolExecutor
+from datetime import datetime, timezone
+
+DB_FILE = "users.db"
+READERS = 4             # pooled read-only connections
+MAX_BATCH = 256         # writes committed together in one transaction
+BUSY_TIMEOUT_MS = 5000
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS users (
+    user_id INTEGER PRIMARY KEY,
+    username TEXT,
+    sol_balance REAL DEFAULT 0,
+    joined_window TIMESTAMP,
+    trading_active INTEGER DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS users_trading_active ON users (trading_active) WHERE trading_active = 1;
+CREATE TABLE IF NOT EXISTS window_settlements (
+    settled_at TIMESTAMP,
+    users INTEGER,
+    stake_sol REAL,
+    profit_sol REAL
+);
+"""
+
+_STOP = object()
+
+
+def _connect(path) -> sqlite3.Connection:
+    conn = sqlite3.connect(path, isolation_level=None, check_same_thread=False)
+    conn.execute(f"PRAGMA busy_timeout={BUSY_TIMEOUT_MS}")
+    return conn
+
+
+def _resolve(future: Future, result=None, error=None):
+    """Complete a write future; one that is already done (e.g. cancelled) is left alone."""
+    try:
+        if error is None:
+            future.set_result(result)
+        else:
+            future.set_exception(error)
+    except InvalidStateError:
+        pass
+
+
+class UserDB:
+    """
+    users.db behind one writer thread and a small pool of readers.
+
+    The database runs in WAL mode, so readers see the last committed state
+    and never wait on the writer. Writes go onto a queue. The writer drains
+    up to MAX_BATCH of them per transaction (each in its own SAVEPOINT, so a
+    failing statement only fails its own caller) and commits once, which
+    keeps a burst of /start and /join to one fsync. Every method is a
+    coroutine and the event loop never touches sqlite directly.
+    """
+
+    def __init__(self, path=DB_FILE, readers=READERS):
+        self.path = path
+        conn = _connect(path)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.executescript(SCHEMA)
+        conn.close()
+
+        self._queue = queue.Queue()
+        self._writer = threading.Thread(target=self._write_loop, name="user-db-writer", daemon=True)
+        self._writer.start()
+        self._local = threading.local()
+        self._readers = ThreadPoolExecutor(max_workers=readers, thread_name_prefix="user-db-reader")
+
+    # ---- writer ----
+    def _write_loop(self):
+        conn = _connect(self.path)
+        conn.execute("PRAGMA synchronous=NORMAL")     # safe with WAL: only the last commits can be lost on power cut
+        while True:
+            batch = [self._queue.get()]
+            while len(batch) < MAX_BATCH:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            stop = any(job is _STOP for job in batch)
+            # a caller cancelled while queued (handler timeout, shutdown) is skipped; running ones can't be cancelled
+            batch = [job for job in batch if job is not _STOP and job[1].set_running_or_notify_cancel()]
+            try:
+                if batch:
+                    self._run_batch(conn, batch)
+            except Exception as e:                   # keep the writer alive, the callers get the error
+                print(f"❌ user-db writer batch failed: {e}")
+                for _, future in batch:
+                    _resolve(future, error=e)
+            if stop:
+                conn.close()
+                return
+
+    @staticmethod
+    def _run_batch(conn, batch):
+        results = []
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            for fn, future in batch:
+                conn.execute("SAVEPOINT job")
+                try:
+                    results.append((future, fn(conn), None))
+                    conn.execute("RELEASE job")
+                except Exception as e:
+                    conn.execute("ROLLBACK TO job")
+                    conn.execute("RELEASE job")
+                    results.append((future, None, e))
+            conn.execute("COMMIT")
+        except Exception as e:
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            for _, future in batch:
+                _resolve(future, error=e)
+            return
+        for future, result, error in results:
+            _resolve(future, result, error)
+
+    def _submit(self, fn) -> Future:
+        future = Future()
+        self._queue.put((fn, future))
+        return future
+
+    async def write(self, fn):
+        """Run fn(conn) inside the next write batch; returns its result once committed."""
+        return await asyncio.wrap_future(self._submit(fn))
+
+    async def execute(self, sql, params=()) -> int:
+        return await self.write(lambda conn: conn.execute(sql, params).rowcount)
+
+    # ---- readers ----
+    def _reader(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._local.conn = _connect(self.path)
+            conn.execute("PRAGMA query_only=1")
+        return conn
+
+    async def fetchone(self, sql, params=()):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._readers, lambda: self._reader().execute(sql, params).fetchone())
+
+    async def fetchall(self, sql, params=()):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._readers, lambda: self._reader().execute(sql, params).fetchall())
+
+    # ---- users ----
+    async def register(self, user_id, username) -> bool:
+        return await self.execute("INSERT OR IGNORE INTO users (user_id, username) VALUES (?, ?)",
+                                  (user_id, username)) > 0
+
+    async def join_window(self, user_id, start_time) -> bool:
+        return await self.execute("UPDATE users SET trading_active=1, joined_window=? WHERE user_id=?",
+                                  (str(start_time), user_id)) > 0
+
+    async def balance(self, user_id):
+        row = await self.fetchone("SELECT sol_balance FROM users WHERE user_id=?", (user_id,))
+        return row[0] if row else None
+
+    async def credit(self, user_id, amount_sol) -> bool:
+        return await self.execute("UPDATE users SET sol_balance = sol_balance + ? WHERE user_id=?",
+                                  (amount_sol, user_id)) > 0
+
+    async def settle_window(self, profit_sol, settled_at=None) -> dict:
+        """
+        Close the 12-hour window: split profit_sol over every trading_active
+        user pro rata to their balance and mark them inactive, all in one
+        transaction (a loss is a negative profit_sol).
+        """
+        settled_at = settled_at or datetime.now(timezone.utc)
+
+        def settle(conn):
+            users, stake = conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(sol_balance), 0) FROM users WHERE trading_active=1").fetchone()
+            if users and stake > 0:
+                conn.execute("UPDATE users SET sol_balance = sol_balance * (1 + ?), trading_active=0 "
+                             "WHERE trading_active=1", (profit_sol / stake,))
+            else:
+                conn.execute("UPDATE users SET trading_active=0 WHERE trading_active=1")
+            conn.execute("INSERT INTO window_settlements VALUES (?, ?, ?, ?)",
+                         (str(settled_at), users, stake, profit_sol if stake > 0 else 0.0))
+            return {"users": users, "stake_sol": stake, "profit_sol": profit_sol if stake > 0 else 0.0}
+
+        return await self.write(settle)
+
+    # ---- shutdown ----
+    def close(self):
+        self._queue.put(_STOP)
+        self._writer.join()
+        self._readers.shutdown(wait=True)